@@ -0,0 +1,101 @@
+"""
+In-process response cache for aggregate read endpoints.
+Reason: repeated dashboard loads hit memory instead of re-running GROUP BY/joins until the data generation changes.
+"""
+import json
+import os
+import threading
+from collections import OrderedDict
+
+CACHE_MAX_BYTES = int(os.getenv("API_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+def _estimate_bytes(value) -> int:
+    return len(json.dumps(value, default=str))
+
+
+def cache_key(endpoint: str, **params) -> tuple:
+    """Normalize query params (drop unset values, stable ordering) into a hashable key."""
+    items = []
+    for k, v in sorted(params.items()):
+        if v is None or v == "":
+            continue
+        if isinstance(v, str):
+            v = v.strip()
+        items.append((k, v))
+    return (endpoint, tuple(items))
+
+
+class ResponseCache:
+    """
+    LRU keyed on normalized params, bounded by an estimated byte budget, flushed when the generation
+    advances. Callers that read an older generation (a request in flight across a bump) miss and do not
+    store, so they cannot flush or pollute the newer entries. Pinned entries (small reference data
+    preloaded at startup) are never evicted, only flushed.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._pinned = set()
+        self._bytes = 0
+        self._generation = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _sync_generation(self, generation: int) -> bool:
+        """Advance to a newer generation (flushing everything); False if the caller's generation is stale."""
+        if self._generation is not None and generation < self._generation:
+            return False
+        if generation != self._generation:
+            self._entries.clear()
+            self._pinned.clear()
+            self._bytes = 0
+            self._generation = generation
+        return True
+
+    def get(self, key: tuple, generation: int):
+        with self._lock:
+            entry = self._entries.get(key) if self._sync_generation(generation) else None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, value, generation: int, pin: bool = False) -> None:
+        size = _estimate_bytes(value)
+        if size > self.max_bytes and not pin:
+            return
+        with self._lock:
+            if not self._sync_generation(generation):
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, size)
+            self._bytes += size
+            if pin:
+                self._pinned.add(key)
+            for old_key in list(self._entries):
+                if self._bytes <= self.max_bytes:
+                    break
+                if old_key not in self._pinned:
+                    self._bytes -= self._entries.pop(old_key)[1]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "pinned": len(self._pinned),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "generation": self._generation,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+response_cache = ResponseCache()
@@ -2,14 +2,20 @@
 Shared API utilities.
 Reason: keep common helpers (DB engine, session resolution, hashing) separate from route wiring.
 """
+import base64
 import hashlib
+import json
+import os
 from pathlib import Path
 from typing import Optional
 
-from fastapi import HTTPException
+from fastapi import HTTPException, Request, Response, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import text
 
-from code.database.connect import get_engine
+from code.api.cache import cache_key, response_cache
+from code.database.connect import get_engine, connect, connect_async, pool_stats
+from code.database.generation import current_generation_async
 from code.database.etl.utils import get_or_create_session_id, load_table, clean_numeric
 
 
@@ -31,19 +37,138 @@ def sha256_path(path: Path, chunk_size: int = 1_048_576) -> str:
     return h.hexdigest()
 
 
-def fetch_all(query: str, params: dict = None):
-    engine = get_engine()
-    with engine.connect() as conn:
+# Bytes moved per read/write/hash step when staging an upload
+UPLOAD_CHUNK_BYTES = int(os.getenv("API_UPLOAD_CHUNK_BYTES", str(4 * 1024 * 1024)))
+
+
+def _write_and_hash(f, h, chunk: bytes) -> None:
+    f.write(chunk)
+    h.update(chunk)
+
+
+async def save_upload(upload: UploadFile, dest: Path, chunk_size: Optional[int] = None) -> str:
+    """
+    Copy an upload to dest in chunks, hashing each chunk as it is written; returns the sha256 hex digest.
+    Reason: one pass over the bytes (no re-read for the checksum), and the file I/O plus hashing run in
+    worker threads so a large upload never blocks the event loop.
+    """
+    h = hashlib.sha256()
+    f = await run_in_threadpool(dest.open, "wb")
+    try:
+        while True:
+            chunk = await upload.read(chunk_size or UPLOAD_CHUNK_BYTES)
+            if not chunk:
+                break
+            await run_in_threadpool(_write_and_hash, f, h, chunk)
+    finally:
+        await run_in_threadpool(f.close)
+    return h.hexdigest()
+
+
+def encode_cursor(values: list) -> str:
+    """Opaque keyset cursor: base64url JSON of the last row's sort key."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, key_types: tuple) -> list:
+    """Inverse of encode_cursor; 400 unless it holds one value of the expected type per sort-key column."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list) or len(values) != len(key_types):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    for value, kind in zip(values, key_types):
+        # bool is an int subclass but never a valid sort key
+        if not isinstance(value, kind) or isinstance(value, bool):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+# Reference payloads revalidate on every load by default (one If-None-Match round trip)
+REFERENCE_MAX_AGE = int(os.getenv("API_REFERENCE_MAX_AGE", "0"))
+
+
+def make_etag(*parts) -> str:
+    """Strong ETag from a data-version marker plus anything else that shapes the payload (endpoint, params)."""
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()[:32]
+    return f'"{digest}"'
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Set ETag/Cache-Control on the response; return a bare 304 if the client's If-None-Match already matches.
+    """
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={REFERENCE_MAX_AGE}, must-revalidate"}
+    response.headers.update(headers)
+    inm = request.headers.get("if-none-match")
+    if inm:
+        tags = [t.strip().removeprefix("W/") for t in inm.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=headers)
+    return None
+
+
+async def get_db():
+    """
+    FastAPI dependency yielding one pooled async connection for the whole request.
+    Reason: several queries in a route share a single checkout, and reads don't occupy the threadpool.
+    """
+    async with connect_async() as conn:
+        yield conn
+
+
+def fetch_all(query: str, params: dict = None, conn=None):
+    """Synchronous fetch for scripts and threadpool callers; routes use fetch_all_async."""
+    if conn is not None:
         rows = conn.execute(text(query), params or {})
         cols = rows.keys()
         return [dict(zip(cols, row)) for row in rows]
+    with connect() as conn:
+        return fetch_all(query, params, conn)
+
+
+async def fetch_all_async(query: str, params: dict = None, conn=None):
+    if conn is not None:
+        rows = await conn.execute(text(query), params or {})
+        cols = rows.keys()
+        return [dict(zip(cols, row)) for row in rows]
+    async with connect_async() as conn:
+        return await fetch_all_async(query, params, conn)
+
+
+async def fetch_all_cached(endpoint: str, query: str, params: dict, conn, pin: bool = False):
+    """
+    fetch_all_async through the response cache, keyed on the bound params.
+    Reason: aggregates only change when a write bumps the data generation.
+    pin=True keeps the entry out of LRU eviction (reference data preloaded at startup).
+    """
+    generation = await current_generation_async(conn)
+    key = cache_key(endpoint, **params)
+    rows = response_cache.get(key, generation)
+    if rows is None:
+        rows = await fetch_all_async(query, params, conn=conn)
+        response_cache.put(key, rows, generation, pin=pin)
+    return rows
 
 
 __all__ = [
     "get_engine",
+    "get_db",
+    "make_etag",
+    "not_modified",
+    "encode_cursor",
+    "decode_cursor",
+    "pool_stats",
     "resolve_session_id",
     "sha256_path",
+    "save_upload",
     "fetch_all",
+    "fetch_all_async",
+    "fetch_all_cached",
+    "response_cache",
     "get_or_create_session_id",
     "load_table",
     "clean_numeric",
@@ -0,0 +1,220 @@
+"""
+Background job runner for microscopy conversion.
+Reason: decoding, OME-Zarr writing and hashing of large stacks no longer run inside the upload request.
+Uploads are staged to disk, recorded as a queued row in ingest_jobs, and converted in a process pool;
+the job row carries per-file progress so /jobs/{id} can be polled, and queued or interrupted jobs are
+resubmitted when the API starts again.
+"""
+import asyncio
+import multiprocessing
+import os
+import shutil
+import socket
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from pathlib import Path
+
+from code.database.connect import get_engine
+from code.database.ingest_upload import INGEST_WORKERS, ROOT, discard_unregistered_outputs, ingest
+from code.database import jobs as job_store
+
+JOB_WORKERS = int(os.getenv("API_JOB_WORKERS", "2"))
+# Conversion processes per job. JOB_WORKERS jobs run at once, each converting with this many processes,
+# so INGEST_WORKERS is a budget shared by the jobs rather than multiplied by them: at most
+# max(JOB_WORKERS, INGEST_WORKERS) interpreters hold a decoded image. 1 converts inside the job worker.
+JOB_INGEST_WORKERS = int(os.getenv("API_JOB_INGEST_WORKERS", str(max(1, INGEST_WORKERS // JOB_WORKERS))))
+# Uploaded files wait here (one directory per upload) until their job finishes
+JOB_STAGING_ROOT = Path(os.getenv("API_JOB_STAGING_DIR", str(ROOT / "data" / "upload_staging")))
+MICROSCOPY_JOB = "microscopy"
+# Running jobs touch updated_at every JOB_HEARTBEAT_S; silent for JOB_STALE_S means the worker is gone.
+# The sweep runs every JOB_SWEEP_S in each API process (requeueing is idempotent across processes).
+JOB_HEARTBEAT_S = float(os.getenv("API_JOB_HEARTBEAT_S", "30"))
+JOB_STALE_S = float(os.getenv("API_JOB_STALE_S", "300"))
+JOB_SWEEP_S = float(os.getenv("API_JOB_SWEEP_S", "60"))
+# Claims per job before a lost worker fails it instead of requeueing it (a file that OOM-kills its worker)
+JOB_MAX_ATTEMPTS = int(os.getenv("API_JOB_MAX_ATTEMPTS", "3"))
+
+_pool = None
+_pool_lock = threading.Lock()
+_shutting_down = False
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: children start with fresh DB engines / file handles instead of forked copies
+            _pool = ProcessPoolExecutor(max_workers=JOB_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    """Drop a broken pool so the next get_pool() starts fresh (no-op if it was already replaced)."""
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def submit(job_id: int) -> None:
+    """
+    Run the job in the pool. A pool broken by a dead worker (e.g. OOM-killed on a huge TIFF) is
+    rebuilt and the submit retried once.
+    """
+    for attempt in range(2):
+        pool = get_pool()
+        try:
+            future = pool.submit(run_job, job_id)
+        except BrokenProcessPool:
+            _discard_pool(pool)
+            if attempt:
+                raise
+            continue
+        future.add_done_callback(partial(_on_job_done, job_id, pool))
+        return
+
+
+def _on_job_done(job_id: int, pool: ProcessPoolExecutor, future: Future) -> None:
+    """
+    Catch worker deaths that run_job could not record itself. One dead worker breaks every future of the
+    pool, so each job that was running is requeued (failed once out of attempts) and resubmitted along
+    with those that never started.
+    """
+    if _shutting_down or future.cancelled() or not isinstance(future.exception(), BrokenProcessPool):
+        return
+    _discard_pool(pool)
+    try:
+        with get_engine().begin() as conn:
+            job_store.release_running_job(conn, job_id, JOB_MAX_ATTEMPTS, "Worker process died during conversion")
+            job = job_store.get_job(conn, job_id)
+        if job["status"] == "queued":
+            submit(job_id)
+        elif job["status"] == "failed":
+            discard_job_files(job)
+    except Exception as e:
+        # the periodic stale sweep picks the job up later
+        print(f"⚠️ Could not recover job {job_id} after worker death: {e}")
+
+
+def discard_job_files(job: dict) -> None:
+    """A failed job's staged uploads, plus any stores its dead worker wrote but never registered."""
+    params = job["params"]
+    shutil.rmtree(params["staging_dir"], ignore_errors=True)
+    try:
+        discard_unregistered_outputs(params["subject_id"], params["session_id"], job["files_total"])
+    except Exception as e:
+        print(f"⚠️ Could not remove partial outputs of job {job['job_id']}: {e}")
+
+
+def resume_jobs() -> list:
+    """Startup: release jobs whose heartbeat went stale, then submit every queued job."""
+    global _shutting_down
+    _shutting_down = False
+    sweep_stale_jobs(submit_requeued=False)
+    with get_engine().begin() as conn:
+        job_ids = job_store.queued_job_ids(conn)
+    for job_id in job_ids:
+        submit(job_id)
+    return job_ids
+
+
+def sweep_stale_jobs(submit_requeued: bool = True) -> list:
+    """
+    Requeue and resubmit running jobs whose worker stopped heartbeating (crashed, killed, host lost);
+    those out of attempts are failed and their files removed.
+    """
+    with get_engine().begin() as conn:
+        requeued, failed = job_store.requeue_stale(conn, JOB_STALE_S, JOB_MAX_ATTEMPTS)
+        failed_jobs = [job_store.get_job(conn, job_id) for job_id in failed]
+    for job in failed_jobs:
+        discard_job_files(job)
+    if submit_requeued:
+        for job_id in requeued:
+            submit(job_id)
+    return requeued
+
+
+async def sweep_loop() -> None:
+    while True:
+        await asyncio.sleep(JOB_SWEEP_S)
+        try:
+            await asyncio.to_thread(sweep_stale_jobs)
+        except Exception as e:
+            print(f"⚠️ Stale job sweep failed: {e}")
+
+
+def shutdown() -> None:
+    """
+    Stop accepting work and terminate running conversions; their jobs go back to queued and are
+    resubmitted on the next start. (Shutting the executor down alone would leave running workers
+    alive, and its exit handler would block the API until every conversion finished.)
+    """
+    global _pool, _shutting_down
+    with _pool_lock:
+        pool, _pool = _pool, None
+        _shutting_down = True
+    if pool is None:
+        return
+    workers = dict(pool._processes or {})  # cleared by shutdown(); pid -> Process
+    for proc in workers.values():
+        proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+    try:
+        with get_engine().begin() as conn:
+            job_store.requeue_worker_jobs(conn, socket.gethostname(), list(workers))
+    except Exception as e:
+        # the stale sweep on the next start requeues them instead
+        print(f"⚠️ Could not requeue interrupted jobs: {e}")
+
+
+def _heartbeat(engine, job_id: int, stop: threading.Event) -> None:
+    while not stop.wait(JOB_HEARTBEAT_S):
+        try:
+            with engine.begin() as conn:
+                job_store.heartbeat(conn, job_id)
+        except Exception:
+            pass  # a missed beat is harmless; only JOB_STALE_S of silence requeues the job
+
+
+def run_job(job_id: int) -> None:
+    """Worker-process entry point: claim the job, run ingest with progress reporting, record the outcome."""
+    engine = get_engine()
+    with engine.begin() as conn:
+        job = job_store.claim_job(conn, job_id)
+    if job is None:
+        return
+    params = job["params"]
+    progress = job["progress"]
+    staging = Path(params["staging_dir"])
+    stop = threading.Event()
+    threading.Thread(target=_heartbeat, args=(engine, job_id, stop), daemon=True).start()
+
+    def on_file(event: dict):
+        progress[event["index"] - 1].update({k: v for k, v in event.items() if k != "index"})
+        with engine.begin() as conn:
+            job_store.record_progress(conn, job_id, progress)
+
+    try:
+        ingested = ingest(
+            subject=params["subject_id"],
+            session=params["session_id"],
+            hemisphere=params["hemisphere"],
+            files=[staging / entry["name"] for entry in progress],
+            pixel_size_um=params["pixel_size_um"],
+            experiment_type=params["experiment_type"],
+            progress=on_file,
+            source_hashes=params.get("source_sha256"),
+            workers=JOB_INGEST_WORKERS,
+        )
+    except Exception as e:
+        with engine.begin() as conn:
+            job_store.finish_job(conn, job_id, "failed", error=str(e))
+    else:
+        with engine.begin() as conn:
+            job_store.finish_job(conn, job_id, "succeeded", result={"ingested": [str(p) for p in ingested]})
+    finally:
+        stop.set()
+    shutil.rmtree(staging, ignore_errors=True)
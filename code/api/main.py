@@ -1,15 +1,41 @@
+import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import RedirectResponse, FileResponse
+from fastapi.responses import JSONResponse, RedirectResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 from code.api.routes_data import router as data_router
 from code.api.routes_uploads import router as upload_router
 from code.api.scrna import router as scrna_router
+from code.api import jobs, warmup
+from code.database.connect import dispose_async_engine, dispose_engine
 
 WEB_DIR = Path(__file__).resolve().parents[1] / "web"
 
-app = FastAPI(title="Olfactory Data API", version="0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Preload reference data in the background; the server accepts requests meanwhile
+    task = asyncio.create_task(warmup.run_warmup()) if warmup.WARMUP_ENABLED else None
+    # Resubmit conversion jobs that were queued or interrupted when the API last stopped
+    try:
+        await asyncio.to_thread(jobs.resume_jobs)
+    except Exception as e:
+        print(f"⚠️ Could not resume background jobs: {e}")
+    # Requeue jobs whose worker died while this API keeps running
+    sweeper = asyncio.create_task(jobs.sweep_loop())
+    yield
+    sweeper.cancel()
+    if task is not None and not task.done():
+        task.cancel()
+    jobs.shutdown()
+    # Release pooled DB connections on shutdown
+    dispose_engine()
+    await dispose_async_engine()
+
+
+app = FastAPI(title="Olfactory Data API", version="0.1.0", lifespan=lifespan)
 app.mount("/code/web", StaticFiles(directory=WEB_DIR, html=True), name="web")
 
 
@@ -19,6 +45,13 @@ def root():
     return RedirectResponse(url="/code/web/index.html")
 
 
+@app.get("/status/ready")
+def status_ready():
+    """Readiness probe: 503 while startup warm-up is still running, 200 once reference data is loaded."""
+    state = warmup.readiness()
+    return JSONResponse(state, status_code=200 if state["ready"] else 503)
+
+
 @app.get("/favicon.ico", include_in_schema=False)
 def favicon():
     ico = WEB_DIR / "favicon.ico"
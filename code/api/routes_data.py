@@ -3,13 +3,72 @@ Core data read endpoints (subjects, sessions, files, fluor metrics).
 Reason: separate read-only API routes from uploads and main wiring.
 """
 from typing import List, Optional
-from fastapi import APIRouter, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel
 
-from code.api.deps import fetch_all
+from code.api.deps import (
+    decode_cursor,
+    encode_cursor,
+    fetch_all_async,
+    fetch_all_cached,
+    get_db,
+    make_etag,
+    not_modified,
+    pool_stats,
+    response_cache,
+)
+from code.api.streaming import stream_format, stream_rows
+from code.database.generation import current_generation_async
 
 router = APIRouter()
 
+# Sort key stand-in for NULL runs so "run NULLS LAST" can be expressed as a keyset row comparison
+RUN_NULLS_LAST = 2147483647
+# Keyset cursor value types, in sort-key order
+FILES_CURSOR = (str, int, int)
+COUNTS_CURSOR = (str, int, str)
+
+# Arrow column types for streamed output, in SELECT order
+FILES_COLUMNS = {
+    "file_id": "int64", "session_id": "string", "subject_id": "string", "run": "int64",
+    "hemisphere": "string", "path": "string", "sha256": "string", "created_at": "timestamp",
+}
+COUNTS_COLUMNS = {
+    "subject_id": "string", "region_id": "int64", "region_name": "string", "region_pixels": "int64",
+    "region_area_mm": "double", "object_count": "int64", "object_pixels": "int64", "object_area_mm": "double",
+    "load": "double", "norm_load": "double", "hemisphere": "string", "file_id": "int64",
+}
+
+
+def _page(rows: list, limit: int, response: Response, key) -> list:
+    """Trim the limit+1 lookahead row and advertise the next keyset cursor in X-Next-Cursor."""
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(key(rows[-1]))
+    return rows
+
+
+async def _revalidate(request: Request, response: Response, conn, *parts) -> Optional[Response]:
+    """Conditional GET for reference data: ETag is keyed on the data generation plus endpoint/params."""
+    generation = await current_generation_async(conn)
+    return not_modified(request, response, make_etag(*parts, generation))
+
+
+async def _require_region(conn, region_id: int):
+    rows = await fetch_all_async("SELECT 1 AS found FROM brain_regions WHERE region_id = :rid", {"rid": region_id}, conn=conn)
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"Region {region_id} not found")
+
+
+# Reference lists preloaded and pinned in the response cache by code.api.warmup
+SUBJECTS_SQL = "SELECT subject_id, sex, experiment_type, details FROM subjects ORDER BY subject_id"
+REGIONS_TREE_SQL = (
+    "SELECT region_id, name, acronym, parent_id, st_level, atlas_id, ontology_id FROM brain_regions ORDER BY region_id"
+)
+
+# Subtree filter for count endpoints: ?under=<region_id> matches that region and all its descendants
+UNDER_FILTER = "{col} IN (SELECT descendant_id FROM brain_region_closure WHERE ancestor_id = :under)"
+
 
 class Subject(BaseModel):
     subject_id: str
@@ -19,32 +78,98 @@ class Subject(BaseModel):
 
 
 @router.get("/subjects", response_model=List[Subject])
-def list_subjects():
-    rows = fetch_all("SELECT subject_id, sex, experiment_type, details FROM subjects ORDER BY subject_id")
-    return rows
+async def list_subjects(request: Request, response: Response, conn=Depends(get_db)):
+    cached = await _revalidate(request, response, conn, "subjects")
+    if cached is not None:
+        return cached
+    return await fetch_all_cached("subjects", SUBJECTS_SQL, {}, conn, pin=True)
 
 
 @router.get("/sessions")
-def list_sessions(subject_id: Optional[str] = None):
+async def list_sessions(request: Request, response: Response, subject_id: Optional[str] = None, conn=Depends(get_db)):
+    cached = await _revalidate(request, response, conn, "sessions", subject_id)
+    if cached is not None:
+        return cached
     q = "SELECT session_id, subject_id, modality, session_date, protocol, notes FROM sessions"
     params = {}
     if subject_id:
         q += " WHERE subject_id = :sid"
         params["sid"] = subject_id
     q += " ORDER BY session_id"
-    return fetch_all(q, params)
+    return await fetch_all_async(q, params, conn=conn)
 
 
 @router.get("/regions/tree")
-def regions_tree():
-    rows = fetch_all(
-        "SELECT region_id, name, acronym, parent_id, st_level, atlas_id, ontology_id FROM brain_regions ORDER BY region_id"
+async def regions_tree(request: Request, response: Response, conn=Depends(get_db)):
+    cached = await _revalidate(request, response, conn, "regions_tree")
+    if cached is not None:
+        return cached
+    return await fetch_all_cached("regions_tree", REGIONS_TREE_SQL, {}, conn, pin=True)
+
+
+@router.get("/regions/{region_id}/descendants")
+async def region_descendants(
+    region_id: int,
+    request: Request,
+    response: Response,
+    max_depth: Optional[int] = Query(None, ge=1),
+    conn=Depends(get_db),
+):
+    """All regions below region_id (nearest first), read from the closure table."""
+    cached = await _revalidate(request, response, conn, "region_descendants", region_id, max_depth)
+    if cached is not None:
+        return cached
+    await _require_region(conn, region_id)
+    q = """
+    SELECT br.region_id, br.name, br.acronym, br.parent_id, br.st_level, c.depth
+    FROM brain_region_closure c
+    JOIN brain_regions br ON br.region_id = c.descendant_id
+    WHERE c.ancestor_id = :rid AND c.depth > 0
+    """
+    params = {"rid": region_id}
+    if max_depth:
+        q += " AND c.depth <= :maxd"
+        params["maxd"] = max_depth
+    q += " ORDER BY c.depth, br.region_id"
+    return await fetch_all_async(q, params, conn=conn)
+
+
+@router.get("/regions/{region_id}/ancestors")
+async def region_ancestors(region_id: int, request: Request, response: Response, conn=Depends(get_db)):
+    """Lineage of region_id from the atlas root down to its parent, read from the closure table."""
+    cached = await _revalidate(request, response, conn, "region_ancestors", region_id)
+    if cached is not None:
+        return cached
+    await _require_region(conn, region_id)
+    return await fetch_all_async(
+        """
+        SELECT br.region_id, br.name, br.acronym, br.parent_id, br.st_level, c.depth
+        FROM brain_region_closure c
+        JOIN brain_regions br ON br.region_id = c.ancestor_id
+        WHERE c.descendant_id = :rid AND c.depth > 0
+        ORDER BY c.depth DESC
+        """,
+        {"rid": region_id},
+        conn=conn,
     )
-    return rows
 
 
 @router.get("/files")
-def list_files(session_id: Optional[str] = None, subject_id: Optional[str] = None):
+async def list_files(
+    request: Request,
+    response: Response,
+    session_id: Optional[str] = None,
+    subject_id: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(1000, ge=1, le=5000),
+    conn=Depends(get_db),
+):
+    """
+    List registered microscopy files. Pages by keyset on (session_id, run, file_id);
+    pass the X-Next-Cursor response header back as ?cursor= for the next page.
+    With Accept: application/x-ndjson or application/vnd.apache.arrow.stream, streams every
+    remaining row (from ?cursor= if given) and ignores limit.
+    """
     q = """
     SELECT mf.file_id, mf.session_id, s.subject_id, mf.run, mf.hemisphere, mf.path, mf.sha256, mf.created_at
     FROM microscopy_files mf
@@ -58,19 +183,44 @@ def list_files(session_id: Optional[str] = None, subject_id: Optional[str] = Non
     if subject_id:
         where.append("s.subject_id = :subj")
         params["subj"] = subject_id
+    if cursor:
+        params["c_sess"], params["c_run"], params["c_file"] = decode_cursor(cursor, FILES_CURSOR)
+        where.append(f"(mf.session_id, COALESCE(mf.run, {RUN_NULLS_LAST}), mf.file_id) > (:c_sess, :c_run, :c_file)")
     if where:
         q += " WHERE " + " AND ".join(where)
-    q += " ORDER BY mf.session_id, mf.run NULLS LAST"
-    return fetch_all(q, params)
+    q += f" ORDER BY mf.session_id, COALESCE(mf.run, {RUN_NULLS_LAST}), mf.file_id"
+    fmt = stream_format(request)
+    if fmt:
+        return stream_rows(q, params, fmt, FILES_COLUMNS)
+    q += " LIMIT :lim"
+    params["lim"] = limit + 1
+    rows = await fetch_all_async(q, params, conn=conn)
+    return _page(
+        rows,
+        limit,
+        response,
+        lambda r: [r["session_id"], RUN_NULLS_LAST if r["run"] is None else r["run"], r["file_id"]],
+    )
 
 
 @router.get("/fluor/counts")
-def fluor_counts(
+async def fluor_counts(
+    request: Request,
+    response: Response,
     subject_id: Optional[str] = None,
     region_id: Optional[int] = None,
     hemisphere: Optional[str] = Query(None, regex="^(left|right|bilateral)$"),
+    under: Optional[int] = Query(None, description="Only regions in this region's subtree"),
+    cursor: Optional[str] = None,
     limit: int = Query(500, ge=1, le=5000),
+    conn=Depends(get_db),
 ):
+    """
+    Per-subject region counts. Pages by keyset on (subject_id, region_id, hemisphere);
+    pass the X-Next-Cursor response header back as ?cursor= for the next page.
+    With Accept: application/x-ndjson or application/vnd.apache.arrow.stream, streams every
+    remaining row (from ?cursor= if given) and ignores limit.
+    """
     q = """
     SELECT rc.subject_id, rc.region_id, br.name AS region_name, rc.region_pixels, rc.region_area_mm,
            rc.object_count, rc.object_pixels, rc.object_area_mm, rc.load, rc.norm_load,
@@ -89,70 +239,152 @@ def fluor_counts(
     if hemisphere:
         where.append("rc.hemisphere = :hemi")
         params["hemi"] = hemisphere
+    if under:
+        where.append(UNDER_FILTER.format(col="rc.region_id"))
+        params["under"] = under
+    if cursor:
+        params["c_sid"], params["c_rid"], params["c_hemi"] = decode_cursor(cursor, COUNTS_CURSOR)
+        where.append("(rc.subject_id, rc.region_id, rc.hemisphere) > (:c_sid, :c_rid, :c_hemi)")
     if where:
         q += " WHERE " + " AND ".join(where)
-    q += " ORDER BY rc.subject_id, rc.region_id LIMIT :lim"
-    params["lim"] = limit
-    return fetch_all(q, params)
+    q += " ORDER BY rc.subject_id, rc.region_id, rc.hemisphere"
+    fmt = stream_format(request)
+    if fmt:
+        return stream_rows(q, params, fmt, COUNTS_COLUMNS)
+    q += " LIMIT :lim"
+    params["lim"] = limit + 1
+    rows = await fetch_all_cached("fluor_counts", q, params, conn)
+    return _page(rows, limit, response, lambda r: [r["subject_id"], r["region_id"], r["hemisphere"]])
 
 
 @router.get("/fluor/summary")
-def fluor_summary(
+async def fluor_summary(
     experiment_type: Optional[str] = Query(None, regex="^(double_injection|rabies)$"),
     hemisphere: Optional[str] = Query(None, regex="^(left|right|bilateral)$"),
     subject_id: Optional[str] = None,
     region_id: Optional[int] = None,
+    under: Optional[int] = Query(None, description="Only regions in this region's subtree"),
     limit: int = Query(500, ge=1, le=5000),
+    conn=Depends(get_db),
 ):
     """
     Aggregated region-level summary to drive charts without client-side recompute.
+    Reads the materialized region_summary table (see code.database.etl.summary).
     """
     q = """
-    SELECT br.region_id,
-           br.name AS region_name,
-           rc.hemisphere,
-           COUNT(*) AS records,
-           SUM(rc.region_pixels) AS region_pixels_sum,
-           AVG(rc.region_pixels) AS region_pixels_avg,
-           SUM(rc.load) AS load_sum,
-           AVG(rc.load) AS load_avg,
-           SUM(rc.object_count) AS object_count_sum,
-           AVG(rc.object_count) AS object_count_avg
-    FROM region_counts rc
-    JOIN brain_regions br ON rc.region_id = br.region_id
-    JOIN subjects s ON rc.subject_id = s.subject_id
+    SELECT region_id,
+           region_name,
+           hemisphere,
+           SUM(records) AS records,
+           SUM(region_pixels_sum) AS region_pixels_sum,
+           CAST(SUM(region_pixels_sum) AS DOUBLE PRECISION) / NULLIF(SUM(records), 0) AS region_pixels_avg,
+           SUM(load_sum) AS load_sum,
+           SUM(load_sum) / NULLIF(SUM(records), 0) AS load_avg,
+           SUM(object_count_sum) AS object_count_sum,
+           CAST(SUM(object_count_sum) AS DOUBLE PRECISION) / NULLIF(SUM(object_count_n), 0) AS object_count_avg
+    FROM region_summary
     """
     params = {}
-    where = []
+    # subject_id NULL rows are the precomputed all-subjects rollup
+    where = ["subject_id = :sid" if subject_id else "subject_id IS NULL"]
+    if subject_id:
+        params["sid"] = subject_id
     if experiment_type:
-        where.append("s.experiment_type = :exp")
+        where.append("experiment_type = :exp")
         params["exp"] = experiment_type
     if hemisphere:
-        where.append("rc.hemisphere = :hemi")
+        where.append("hemisphere = :hemi")
         params["hemi"] = hemisphere
-    if subject_id:
-        where.append("rc.subject_id = :sid")
-        params["sid"] = subject_id
     if region_id:
-        where.append("rc.region_id = :rid")
+        where.append("region_id = :rid")
         params["rid"] = region_id
-    if where:
-        q += " WHERE " + " AND ".join(where)
+    if under:
+        where.append(UNDER_FILTER.format(col="region_id"))
+        params["under"] = under
+    q += " WHERE " + " AND ".join(where)
     q += """
-    GROUP BY br.region_id, br.name, rc.hemisphere
-    ORDER BY br.region_id
+    GROUP BY region_id, region_name, hemisphere
+    ORDER BY region_id
     LIMIT :lim
     """
     params["lim"] = limit
-    return fetch_all(q, params)
+    return await fetch_all_cached("fluor_summary", q, params, conn)
+
+
+@router.get("/fluor/rollup")
+async def fluor_rollup(
+    st_level: Optional[int] = Query(None, ge=0),
+    ancestor_id: Optional[List[int]] = Query(None),
+    experiment_type: Optional[str] = Query(None, regex="^(double_injection|rabies)$"),
+    hemisphere: Optional[str] = Query(None, regex="^(left|right|bilateral)$"),
+    subject_id: Optional[str] = None,
+    conn=Depends(get_db),
+):
+    """
+    Roll region metrics up the Allen hierarchy: each target structure (every region at st_level,
+    or each ancestor_id) aggregates load/region_pixels/object_count over its whole subtree.
+    One set-based query over the brain_region_closure table joined to region_summary.
+    """
+    if st_level is None and not ancestor_id:
+        raise HTTPException(status_code=400, detail="Provide st_level or at least one ancestor_id")
+    params = {}
+    if ancestor_id:
+        names = [f"a{i}" for i in range(len(ancestor_id))]
+        params.update(zip(names, ancestor_id))
+        where = ["c.ancestor_id IN (" + ", ".join(f":{n}" for n in names) + ")"]
+    else:
+        where = ["a.st_level = :lvl"]
+        params["lvl"] = st_level
+    q = """
+    SELECT a.region_id,
+           a.name AS region_name,
+           a.acronym,
+           a.st_level,
+           rs.hemisphere,
+           COUNT(DISTINCT rs.region_id) AS regions_with_data,
+           SUM(rs.records) AS records,
+           SUM(rs.region_pixels_sum) AS region_pixels_sum,
+           SUM(rs.load_sum) AS load_sum,
+           SUM(rs.object_count_sum) AS object_count_sum
+    FROM brain_region_closure c
+    JOIN region_summary rs ON rs.region_id = c.descendant_id
+    JOIN brain_regions a ON a.region_id = c.ancestor_id
+    """
+    where.append("rs.subject_id = :sid" if subject_id else "rs.subject_id IS NULL")
+    if subject_id:
+        params["sid"] = subject_id
+    if experiment_type:
+        where.append("rs.experiment_type = :exp")
+        params["exp"] = experiment_type
+    if hemisphere:
+        where.append("rs.hemisphere = :hemi")
+        params["hemi"] = hemisphere
+    q += " WHERE " + " AND ".join(where)
+    q += """
+    GROUP BY a.region_id, a.name, a.acronym, a.st_level, rs.hemisphere
+    ORDER BY a.region_id, rs.hemisphere
+    """
+    return await fetch_all_cached("fluor_rollup", q, params, conn)
 
 
 @router.get("/status")
-def status():
-    rows = fetch_all("SELECT count(*) AS subjects FROM subjects")
+async def status(conn=Depends(get_db)):
+    rows = await fetch_all_async("SELECT count(*) AS subjects FROM subjects", conn=conn)
     subs = rows[0]["subjects"]
-    rows = fetch_all("SELECT count(*) AS files FROM microscopy_files")
+    rows = await fetch_all_async("SELECT count(*) AS files FROM microscopy_files", conn=conn)
     files = rows[0]["files"]
-    rows = fetch_all("SELECT count(*) AS counts FROM region_counts")
+    rows = await fetch_all_async("SELECT count(*) AS counts FROM region_counts", conn=conn)
     counts = rows[0]["counts"]
     return {"subjects": subs, "files": files, "counts": counts}
+
+
+@router.get("/status/pool")
+async def status_pool():
+    """Connection pool occupancy and checkout wait counters for sizing under load."""
+    return pool_stats()
+
+
+@router.get("/status/cache")
+async def status_cache():
+    """Response cache occupancy and hit/miss counters."""
+    return response_cache.stats()
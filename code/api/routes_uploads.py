@@ -5,20 +5,28 @@ Reason: isolate write paths from read-only routes.
 from typing import List, Optional
 import tempfile
 import shutil
+import uuid
 from pathlib import Path
 import pandas as pd
 
-from fastapi import APIRouter, HTTPException, Query, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy import text, types as satypes
 
+from code.api import jobs
 from code.api.deps import (
+    fetch_all_async,
+    get_db,
     get_engine,
     resolve_session_id,
-    sha256_path,
+    save_upload,
     load_table,
     clean_numeric,
 )
-from code.database.ingest_upload import ingest
+from code.database.etl.summary import refresh_region_summary
+from code.database.generation import bump_generation
+from code.database.ingest_upload import registered_sources
+from code.database import jobs as job_store
 
 router = APIRouter()
 
@@ -130,10 +138,88 @@ def ingest_counts_csv(engine, csv_path: Path, subject_id: str, session_id: str,
             )
         ).rowcount
         conn.execute(text(f"DROP TABLE IF EXISTS {temp_table};"))
+        if inserted:
+            refresh_region_summary(conn, {subject_id})
+            bump_generation(conn)
     return inserted or 0
 
 
-@router.post("/upload/microscopy")
+def _block_duplicate_microscopy(engine, session_id: str) -> None:
+    """Prevent duplicate experiment loads."""
+    with engine.connect() as conn:
+        already = conn.execute(
+            text("SELECT 1 FROM microscopy_files WHERE session_id = :sid LIMIT 1"),
+            {"sid": session_id},
+        ).first()
+    if already:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Session {session_id} already has microscopy files registered. Duplicate ingest blocked.",
+        )
+
+
+def _block_duplicate_source(engine, name: str, sha: str, seen: dict) -> None:
+    """Reject a staged image whose source bytes repeat in this upload or match a registered file."""
+    if sha in seen:
+        raise HTTPException(status_code=409, detail=f"{name} has the same content as {seen[sha]} in this upload.")
+    with engine.connect() as conn:
+        if registered_sources(conn, [sha]):
+            raise HTTPException(
+                status_code=409,
+                detail=f"{name} matches a previously ingested microscopy image (source checksum duplicate).",
+            )
+    seen[sha] = name
+
+
+def _block_duplicate_counts(engine, session_id: str, checksums) -> None:
+    with engine.connect() as conn:
+        # Block duplicate ingest for the same session if any region_counts already linked
+        dup = conn.execute(
+            text(
+                """
+                SELECT 1
+                FROM region_counts rc
+                JOIN microscopy_files mf ON rc.file_id = mf.file_id
+                WHERE mf.session_id = :sid
+                LIMIT 1
+                """
+            ),
+            {"sid": session_id},
+        ).first()
+        if dup:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Session {session_id} already has quantification rows registered. Duplicate ingest blocked.",
+            )
+        # Block identical file contents if checksum already ingested
+        for chk in checksums:
+            existing = conn.execute(
+                text("SELECT 1 FROM ingest_log WHERE checksum = :c AND status = 'success' LIMIT 1"),
+                {"c": chk},
+            ).first()
+            if existing:
+                raise HTTPException(
+                    status_code=409,
+                    detail="This quantification file matches a previously ingested file (checksum duplicate).",
+                )
+
+
+def _log_ingest(engine, path: Path, checksum: str, rows: int, session_id: str) -> None:
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO ingest_log (source_path, checksum, rows_loaded, status, message) "
+                "VALUES (:p, :c, :r, :s, :m)"
+            ),
+            {"p": str(path), "c": checksum, "r": rows, "s": "success", "m": f"upload {session_id}"},
+        )
+
+
+# Uploads are staged with save_upload (chunked write + inline sha256 in worker threads); every DB call
+# runs via run_in_threadpool and microscopy conversion runs in the job pool, so the event loop never blocks.
+
+
+@router.post("/upload/microscopy", status_code=202)
 async def upload_microscopy(
     subject_id: str = Form(..., description="BIDS subject id (e.g., sub-DBL_A)"),
     session_id: str = Form(..., description="BIDS session id (e.g., ses-dbl or 'auto')"),
@@ -143,37 +229,31 @@ async def upload_microscopy(
     files: List[UploadFile] = File(...),
 ):
     """
-    Accept microscopy uploads, convert to OME-Zarr, register sessions/files.
+    Accept microscopy uploads and queue their OME-Zarr conversion as a background job.
+    Returns the job id at once; poll /jobs/{job_id} for per-file progress.
     """
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
     image_ext = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".ome.tif", ".ome.tiff", ".zarr", ".ome.zarr")
 
-    tmpdir = Path(tempfile.mkdtemp())
+    staging = jobs.JOB_STAGING_ROOT / uuid.uuid4().hex
+    await run_in_threadpool(staging.mkdir, parents=True)
     saved_paths: List[Path] = []
+    seen_sources = {}  # source sha256 -> file name
     try:
         engine = get_engine()
-        session_id = resolve_session_id(engine, subject_id, experiment_type, session_id)
-        # prevent duplicate experiment loads
-        with engine.connect() as conn:
-            already = conn.execute(
-                text("SELECT 1 FROM microscopy_files WHERE session_id = :sid LIMIT 1"),
-                {"sid": session_id},
-            ).first()
-            if already:
-                raise HTTPException(
-                    status_code=409,
-                    detail=f"Session {session_id} already has microscopy files registered. Duplicate ingest blocked.",
-                )
-        # Stage uploads to temp
+        session_id = await run_in_threadpool(resolve_session_id, engine, subject_id, experiment_type, session_id)
+        await run_in_threadpool(_block_duplicate_microscopy, engine, session_id)
+        # Stage uploads where the job worker (and a restarted API) can find them
         for uf in files:
             fname = uf.filename or ""
             lower = fname.lower()
             if not lower.endswith(image_ext):
                 raise HTTPException(status_code=400, detail=f"Unsupported file type for {fname}. Upload images only.")
-            dest = tmpdir / fname
-            with dest.open("wb") as f:
-                shutil.copyfileobj(uf.file, f)
+            dest = staging / fname
+            # Source hash comes from the streaming write; a re-upload is rejected here, before any conversion
+            sha = await save_upload(uf, dest)
+            await run_in_threadpool(_block_duplicate_source, engine, fname, sha, seen_sources)
             saved_paths.append(dest)
 
         if not saved_paths:
@@ -181,23 +261,46 @@ async def upload_microscopy(
 
         # Stable order so run numbering is deterministic when folder uploads are used
         all_images = sorted(saved_paths, key=lambda p: p.name)
+        params = {
+            "subject_id": subject_id,
+            "session_id": session_id,
+            "hemisphere": hemisphere,
+            "pixel_size_um": pixel_size_um,
+            "experiment_type": experiment_type,
+            "staging_dir": str(staging),
+            "source_sha256": {name: sha for sha, name in seen_sources.items()},
+        }
+        job_id = await run_in_threadpool(_create_job, engine, jobs.MICROSCOPY_JOB, params, [p.name for p in all_images])
+    except BaseException:
+        await run_in_threadpool(shutil.rmtree, staging, ignore_errors=True)
+        raise
+    try:
+        await run_in_threadpool(jobs.submit, job_id)
+    except Exception as e:
+        # never leave a queued row (and its staged files) behind for a job no worker will run
+        await run_in_threadpool(_fail_job, engine, job_id, f"Could not start conversion: {e}")
+        await run_in_threadpool(shutil.rmtree, staging, ignore_errors=True)
+        raise HTTPException(status_code=503, detail="Conversion workers unavailable; please retry the upload.")
+    return {"status": "queued", "job_id": job_id, "files_queued": [p.name for p in all_images]}
+
+
+def _create_job(engine, kind: str, params: dict, file_names: list) -> int:
+    with engine.begin() as conn:
+        return job_store.create_job(conn, kind, params, file_names)
+
+
+def _fail_job(engine, job_id: int, error: str) -> None:
+    with engine.begin() as conn:
+        job_store.finish_job(conn, job_id, "failed", error=error)
 
-        try:
-            ingested = ingest(
-                subject=subject_id,
-                session=session_id,
-                hemisphere=hemisphere,
-                files=all_images,
-                pixel_size_um=pixel_size_um,
-                experiment_type=experiment_type,
-            )
-        except HTTPException:
-            raise
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Microscopy ingest failed: {e}")
-        return {"status": "ok", "ingested": [str(p) for p in ingested], "files_processed": [p.name for p in all_images]}
-    finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: int, conn=Depends(get_db)):
+    """Job status with per-file progress (status, bytes_written, output path, error)."""
+    rows = await fetch_all_async(job_store.JOB_SELECT + " WHERE job_id = :id", {"id": job_id}, conn=conn)
+    if not rows:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job_store.decode_job(rows[0])
 
 
 @router.post("/upload/region-counts")
@@ -214,9 +317,9 @@ async def upload_region_counts(
     if not files:
         raise HTTPException(status_code=400, detail="No files provided")
     engine = get_engine()
-    sess = resolve_session_id(engine, subject_id, experiment_type, session_id)
+    sess = await run_in_threadpool(resolve_session_id, engine, subject_id, experiment_type, session_id)
 
-    tmpdir = Path(tempfile.mkdtemp())
+    tmpdir = Path(await run_in_threadpool(tempfile.mkdtemp))
     rows = 0
     try:
         saved = []
@@ -225,57 +328,20 @@ async def upload_region_counts(
             if not uf.filename.lower().endswith(".csv"):
                 raise HTTPException(status_code=400, detail=f"Unsupported file type for {uf.filename}. Upload CSV only.")
             dest = tmpdir / uf.filename
-            with dest.open("wb") as f:
-                shutil.copyfileobj(uf.file, f)
+            # Checksum computed while the bytes are written; no second read
+            saved_hashes[dest] = await save_upload(uf, dest)
             saved.append(dest)
-            saved_hashes[dest] = sha256_path(dest)
-
-        with engine.connect() as conn:
-            # Block duplicate ingest for the same session if any region_counts already linked
-            dup = conn.execute(
-                text(
-                    """
-                    SELECT 1
-                    FROM region_counts rc
-                    JOIN microscopy_files mf ON rc.file_id = mf.file_id
-                    WHERE mf.session_id = :sid
-                    LIMIT 1
-                    """
-                ),
-                {"sid": sess},
-            ).first()
-            if dup:
-                raise HTTPException(
-                    status_code=409,
-                    detail=f"Session {sess} already has quantification rows registered. Duplicate ingest blocked.",
-                )
-            # Block identical file contents if checksum already ingested
-            for chk in saved_hashes.values():
-                existing = conn.execute(
-                    text("SELECT 1 FROM ingest_log WHERE checksum = :c AND status = 'success' LIMIT 1"),
-                    {"c": chk},
-                ).first()
-                if existing:
-                    raise HTTPException(
-                        status_code=409,
-                        detail="This quantification file matches a previously ingested file (checksum duplicate).",
-                    )
+
+        await run_in_threadpool(_block_duplicate_counts, engine, sess, list(saved_hashes.values()))
         for path in saved:
             try:
-                rows += ingest_counts_csv(engine, path, subject_id, sess, hemisphere, experiment_type)
+                rows += await run_in_threadpool(ingest_counts_csv, engine, path, subject_id, sess, hemisphere, experiment_type)
                 # log checksum for dedupe
                 chk = saved_hashes.get(path)
                 if chk:
-                    with engine.begin() as conn:
-                        conn.execute(
-                            text(
-                                "INSERT INTO ingest_log (source_path, checksum, rows_loaded, status, message) "
-                                "VALUES (:p, :c, :r, :s, :m)"
-                            ),
-                            {"p": str(path), "c": chk, "r": rows, "s": "success", "m": f"upload {sess}"},
-                        )
+                    await run_in_threadpool(_log_ingest, engine, path, chk, rows, sess)
             except ValueError as e:
                 raise HTTPException(status_code=400, detail=str(e))
         return {"status": "ok", "rows_ingested": rows}
     finally:
-        shutil.rmtree(tmpdir, ignore_errors=True)
+        await run_in_threadpool(shutil.rmtree, tmpdir, ignore_errors=True)
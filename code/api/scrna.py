@@ -1,92 +1,436 @@
 """
-scRNA endpoints backed by CSV reference files (cluster, terms, membership).
+scRNA endpoints backed by per-sample CSV reference files (cluster, terms, membership).
 Reason: isolate RNA loading and routes from the main API wiring.
 """
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from typing import Optional
 
 import pandas as pd
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+
+from code.api import scrna_search, scrna_taxonomy
+from code.api.deps import make_etag, not_modified
 
 router = APIRouter()
 
 RNA_DIR = Path(__file__).resolve().parents[2] / "data" / "RNAseq_data"
-_clusters_df = None
-_terms_df = None
-_membership_df = None
+# Columnar copies of the CSVs (Feather, uncompressed so reads can be memory-mapped)
+RNA_CACHE_DIR_NAME = ".feather_cache"
+# Only these columns are read on load; missing ones are skipped
+RNA_COLUMNS = {
+    "cluster.csv": ["cluster_alias", "number_of_cells", "label"],
+    "cluster_annotation_term.csv": ["label", "name", "color_hex_triplet", "cluster_annotation_term_set_name", "term_order"],
+    "cluster_to_cluster_annotation_membership.csv": [
+        "cluster_annotation_term_label", "cluster_alias", "name", "color_hex_triplet", "cluster_annotation_term_set_name",
+    ],
+}
+RNA_TABLE_FILES = tuple(RNA_COLUMNS)
+# Offline differential-expression results (written by code.api.scrna_de)
+RNA_DE_RESULTS_NAME = "de_results.zarr"
+# Sample id for reference CSVs sitting directly in RNA_DIR (the original single-sample layout)
+RNA_DEFAULT_SAMPLE = os.getenv("RNA_DEFAULT_SAMPLE", "WMB-10Xv2-OLF")
+# Estimated bytes of loaded samples kept in memory; least-recently-used samples are evicted beyond this
+RNA_SAMPLE_CACHE_MAX_BYTES = int(os.getenv("RNA_SAMPLE_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# Rough per-record cost of the serialized marker/search indexes (small dicts of short strings)
+_RECORD_BYTES = 600
+
+
+def rna_source_version(sample_dir: Path) -> tuple:
+    """Version marker for a sample's reference CSVs (size + mtime), used for ETags."""
+    marker = []
+    for name in RNA_TABLE_FILES:
+        path = sample_dir / name
+        st = path.stat() if path.exists() else None
+        marker.append((name, st.st_size, st.st_mtime_ns) if st else (name, None, None))
+    return tuple(marker)
+
+
+def _coalesce(df: pd.DataFrame, *cols) -> list:
+    """First non-null value across the given (optional) columns, NaN mapped to None."""
+    out = pd.Series(None, index=df.index, dtype=object)
+    for col in cols:
+        if col in df.columns:
+            out = out.where(out.notna(), df[col].astype(object))
+    return [None if pd.isna(v) else v for v in out.tolist()]
+
+
+def build_marker_index(membership_df: pd.DataFrame, terms_df: pd.DataFrame) -> dict:
+    """
+    Merge membership with annotation terms once and group the serialized records by cluster_alias.
+    Reason: /scrna/markers becomes a dict lookup plus slice, with no pandas work per request.
+    """
+    merged = membership_df.merge(terms_df, left_on="cluster_annotation_term_label", right_on="label", how="left")
+    names = _coalesce(merged, "name_x", "name_y", "name")
+    colors = _coalesce(merged, "color_hex_triplet_x", "color_hex_triplet_y", "color_hex_triplet")
+    index = {}
+    for alias, gene, name, color in zip(
+        merged["cluster_alias"].tolist(), merged["cluster_annotation_term_label"].tolist(), names, colors
+    ):
+        index.setdefault(int(alias), []).append({
+            "cluster_id": str(alias),
+            "gene": gene,
+            "name": name,
+            "logfc": None,
+            "pval_adj": None,
+            "color": color,
+        })
+    return index
+
+
+def _feather_cache_path(csv_path: Path) -> Path:
+    st = csv_path.stat()
+    return csv_path.parent / RNA_CACHE_DIR_NAME / f"{csv_path.stem}.{st.st_size}-{st.st_mtime_ns}.feather"
+
+
+def read_rna_table(csv_path: Path, columns: list) -> pd.DataFrame:
+    """
+    Read a reference CSV through a Feather cache keyed on the source size + mtime.
+    A stale or missing cache is rebuilt from the CSV; reads are memory-mapped and column-pruned.
+    Falls back to plain read_csv when pyarrow is not installed.
+    """
+    try:
+        import pyarrow.feather as feather
+        import pyarrow.ipc as ipc
+    except ImportError:
+        return pd.read_csv(csv_path, usecols=lambda c: c in columns)
+
+    cache_path = _feather_cache_path(csv_path)
+    if not cache_path.exists():
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        for stale in cache_path.parent.glob(f"{csv_path.stem}.*.feather"):
+            # another worker may have just put the current cache in place
+            if stale != cache_path:
+                stale.unlink(missing_ok=True)
+        df = pd.read_csv(csv_path)
+        tmp = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        feather.write_feather(df, tmp, compression="uncompressed")
+        os.replace(tmp, cache_path)
+    try:
+        with ipc.open_file(cache_path) as reader:
+            available = set(reader.schema.names)
+        table = feather.read_table(cache_path, columns=[c for c in columns if c in available], memory_map=True)
+    except FileNotFoundError:
+        # the CSV changed again and a worker swept this cache away mid-read; the CSV is authoritative
+        return pd.read_csv(csv_path, usecols=lambda c: c in columns)
+    return table.to_pandas()
+
+
+def load_de_results(path: Path) -> Optional[dict]:
+    """Open the DE zarr store read-only; arrays stay on disk and are read one cluster row at a time."""
+    if not path.exists():
+        return None
+    import zarr
+
+    group = zarr.open_group(str(path), mode="r")
+    attrs = dict(group.attrs)
+    return {
+        "group": group,
+        "rows": {int(a): i for i, a in enumerate(attrs["cluster_aliases"])},
+        "gene_ids": attrs["gene_ids"],
+        "gene_symbols": attrs["gene_symbols"],
+    }
+
+
+def de_marker_records(de: dict, alias: int, limit: int) -> list:
+    """Ranked marker genes for one cluster with their logFC and BH-adjusted p-values."""
+    row = de["rows"][alias]
+    group = de["group"]
+    genes = group["top_genes"][row, :limit]
+    logfc = group["top_logfc"][row, :limit]
+    pval_adj = group["top_pval_adj"][row, :limit]
+    return [
+        {
+            "cluster_id": str(alias),
+            "gene": de["gene_symbols"][g],
+            "name": de["gene_ids"][g],
+            "logfc": float(lfc),
+            "pval_adj": float(p),
+            "color": None,
+        }
+        for g, lfc, p in zip(genes.tolist(), logfc.tolist(), pval_adj.tolist())
+    ]
+
+
+class RnaSample:
+    """One reference dataset's tables plus the indexes derived from them at load time."""
+
+    def __init__(self, sample_id: str, path: Path):
+        self.sample_id = sample_id
+        self.path = path
+        self.clusters_df = read_rna_table(path / "cluster.csv", RNA_COLUMNS["cluster.csv"])
+        self.terms_df = read_rna_table(path / "cluster_annotation_term.csv", RNA_COLUMNS["cluster_annotation_term.csv"])
+        membership_name = "cluster_to_cluster_annotation_membership.csv"
+        self.membership_df = read_rna_table(path / membership_name, RNA_COLUMNS[membership_name])
+        # Opened DE store: {"group", "rows" (alias -> row), "gene_ids", "gene_symbols"}; None when not computed
+        self.de_results = load_de_results(path / RNA_DE_RESULTS_NAME)
+        # cluster_alias -> marker records, merged and serialized once at load time
+        self.markers_by_cluster = build_marker_index(self.membership_df, self.terms_df)
+        # Inverted gene/term -> clusters index plus prefix list (see scrna_search)
+        self.search_index = scrna_search.build_search_index(self.markers_by_cluster, self.de_results)
+        # class -> subclass -> supertype -> cluster tree with per-node cell counts (see scrna_taxonomy)
+        self.taxonomy = scrna_taxonomy.build_taxonomy(self.membership_df, self.terms_df, self.clusters_df)
+        self.nbytes = self._estimate_bytes()
+
+    def _estimate_bytes(self) -> int:
+        frames = sum(int(df.memory_usage(deep=True).sum()) for df in (self.clusters_df, self.terms_df, self.membership_df))
+        records = sum(len(v) for v in self.markers_by_cluster.values()) + len(self.search_index["prefix"])
+        records += len(self.taxonomy["nodes"])
+        return frames + records * _RECORD_BYTES
+
+
+def _has_tables(path: Path) -> bool:
+    return all((path / name).exists() for name in RNA_TABLE_FILES)
+
+
+class SampleRegistry:
+    """
+    Samples discovered under RNA_DIR/<sample>/ (plus RNA_DIR itself as RNA_DEFAULT_SAMPLE), loaded on
+    first use and kept in LRU order; the least recently used are evicted once the estimated memory of
+    loaded samples exceeds max_bytes. The default sample (pre-loaded by warm-up and used by requests
+    without sample_id) and the sample just requested are never evicted.
+    """
+
+    def __init__(self, max_bytes: int = RNA_SAMPLE_CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._loaded: "OrderedDict[str, RnaSample]" = OrderedDict()
+        self._paths = {}
+        self._lock = threading.Lock()
+        # Per-sample locks so concurrent first requests parse a sample once without blocking other samples
+        self._load_locks = {}
+        self.loads = 0
+        self.evictions = 0
+
+    def discover(self) -> dict:
+        paths = {}
+        if _has_tables(RNA_DIR):
+            paths[RNA_DEFAULT_SAMPLE] = RNA_DIR
+        if RNA_DIR.is_dir():
+            for child in sorted(RNA_DIR.iterdir()):
+                if child.is_dir() and not child.name.startswith(".") and _has_tables(child):
+                    paths.setdefault(child.name, child)
+        with self._lock:
+            self._paths = paths
+        return dict(paths)
 
+    @staticmethod
+    def _default_id(paths: dict) -> Optional[str]:
+        return RNA_DEFAULT_SAMPLE if RNA_DEFAULT_SAMPLE in paths else next(iter(paths), None)
 
-def load_rna_tables():
-    global _clusters_df, _terms_df, _membership_df
-    if _clusters_df is not None and _terms_df is not None and _membership_df is not None:
-        return
-    cluster_path = RNA_DIR / "cluster.csv"
-    term_path = RNA_DIR / "cluster_annotation_term.csv"
-    membership_path = RNA_DIR / "cluster_to_cluster_annotation_membership.csv"
-    if not (cluster_path.exists() and term_path.exists() and membership_path.exists()):
-        raise HTTPException(status_code=500, detail="scRNA reference files missing in data/RNAseq_data")
-    _clusters_df = pd.read_csv(cluster_path)
-    _terms_df = pd.read_csv(term_path)
-    _membership_df = pd.read_csv(membership_path)
+    def resolve(self, sample_id: Optional[str]) -> tuple:
+        """(sample_id, directory) for a requested sample; None picks the default (or first) sample."""
+        paths = self._paths
+        if not paths or (sample_id and sample_id not in paths):
+            paths = self.discover()
+        if not paths:
+            raise HTTPException(status_code=500, detail="scRNA reference files missing in data/RNAseq_data")
+        if not sample_id:
+            sample_id = self._default_id(paths)
+        if sample_id not in paths:
+            raise HTTPException(status_code=404, detail=f"scRNA sample {sample_id} not found")
+        return sample_id, paths[sample_id]
+
+    def _cached(self, sample_id: str) -> Optional[RnaSample]:
+        with self._lock:
+            sample = self._loaded.get(sample_id)
+            if sample is not None:
+                self._loaded.move_to_end(sample_id)
+            return sample
+
+    def get(self, sample_id: Optional[str] = None) -> RnaSample:
+        sample = self._cached(sample_id) if sample_id else None
+        if sample is not None:
+            return sample
+        sample_id, path = self.resolve(sample_id)
+        sample = self._cached(sample_id)
+        if sample is not None:
+            return sample
+        with self._lock:
+            load_lock = self._load_locks.setdefault(sample_id, threading.Lock())
+        with load_lock:
+            sample = self._cached(sample_id)
+            if sample is None:
+                sample = RnaSample(sample_id, path)
+                with self._lock:
+                    self._loaded[sample_id] = sample
+                    self.loads += 1
+                    self._evict()
+        return sample
+
+    def _evict(self):
+        total = sum(s.nbytes for s in self._loaded.values())
+        newest = next(reversed(self._loaded))
+        pinned = {newest, self._default_id(self._paths)}
+        for sample_id in [sid for sid in self._loaded if sid not in pinned]:
+            if total <= self.max_bytes:
+                break
+            total -= self._loaded.pop(sample_id).nbytes
+            self.evictions += 1
+
+    def peek(self, sample_id: str) -> Optional[RnaSample]:
+        """Loaded sample without touching LRU order (None when not in memory)."""
+        with self._lock:
+            return self._loaded.get(sample_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": list(self._loaded),
+                "bytes": sum(s.nbytes for s in self._loaded.values()),
+                "max_bytes": self.max_bytes,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+
+_registry = SampleRegistry()
+
+
+def load_rna_tables(sample_id: Optional[str] = None) -> RnaSample:
+    """Loaded tables for a sample (default sample when None), parsing them on first use."""
+    return _registry.get(sample_id)
+
+
+def resolve_sample(sample_id: Optional[str] = None) -> tuple:
+    """(sample_id, directory) for a sample without loading its tables; None picks the default sample."""
+    return _registry.resolve(sample_id)
 
 
 def scrna_samples_data():
-    load_rna_tables()
-    return [{
-        "sample_id": "WMB-10Xv2-OLF",
-        "modality": "rna_seq",
-        "n_clusters": int(len(_clusters_df)),
-        "notes": "Clusters and annotations loaded from CSV; expression in .h5ad stored on disk."
-    }]
+    samples = []
+    for sample_id in _registry.discover():
+        loaded = _registry.peek(sample_id)
+        samples.append({
+            "sample_id": sample_id,
+            "modality": "rna_seq",
+            "n_clusters": int(len(loaded.clusters_df)) if loaded is not None else None,
+            "loaded": loaded is not None,
+            "notes": "Clusters and annotations loaded from CSV on first use; expression in .h5ad stored on disk.",
+        })
+    return samples
 
 
-def scrna_clusters_data():
-    load_rna_tables()
+def scrna_clusters_data(sample_id: Optional[str] = None):
+    sample = load_rna_tables(sample_id)
     return [
         {
-            "sample_id": "WMB-10Xv2-OLF",
+            "sample_id": sample.sample_id,
             "cluster_id": str(row.cluster_alias),
             "n_cells": int(row.number_of_cells),
             "label": row.label,
         }
-        for row in _clusters_df.itertuples()
+        for row in sample.clusters_df.itertuples()
     ]
 
 
-def scrna_markers_data(cluster_id: str, limit: int):
-    load_rna_tables()
+def scrna_markers_data(cluster_id: str, limit: int, sample_id: Optional[str] = None):
+    sample = load_rna_tables(sample_id)
     try:
         cid_int = int(cluster_id)
     except ValueError:
         raise HTTPException(status_code=400, detail="cluster_id must be an integer")
-    m = _membership_df[_membership_df["cluster_alias"] == cid_int]
-    if m.empty:
-        return []
-    merged = m.merge(_terms_df, left_on="cluster_annotation_term_label", right_on="label", how="left")
-    merged = merged.head(limit)
-    results = []
-    for row in merged.itertuples():
-        results.append({
-            "cluster_id": cluster_id,
-            "gene": getattr(row, "cluster_annotation_term_label"),
-            "name": getattr(row, "name_x", None) or getattr(row, "name_y", None),
-            "logfc": None,
-            "pval_adj": None,
-            "color": getattr(row, "color_hex_triplet_x", None) or getattr(row, "color_hex_triplet_y", None),
-        })
-    return results
+    if sample.de_results is not None and cid_int in sample.de_results["rows"]:
+        return de_marker_records(sample.de_results, cid_int, limit)
+    # No DE results for this cluster yet: fall back to its annotation terms (no statistics)
+    return sample.markers_by_cluster.get(cid_int, [])[:limit]
+
+
+def scrna_search_data(q: str, limit: int, sample_id: Optional[str] = None):
+    return scrna_search.search(load_rna_tables(sample_id).search_index, q, limit)
+
+
+def scrna_gene_clusters_data(gene: str, sample_id: Optional[str] = None):
+    records = scrna_search.clusters_for(load_rna_tables(sample_id).search_index, gene)
+    if records is None:
+        raise HTTPException(status_code=404, detail=f"No clusters carry marker {gene}")
+    return records
+
+
+def scrna_taxonomy_data(level: str, sample_id: Optional[str] = None):
+    taxonomy = load_rna_tables(sample_id).taxonomy
+    return [taxonomy["nodes"][label] for label in taxonomy["by_level"].get(level, [])]
+
+
+def scrna_taxonomy_children_data(node: str, sample_id: Optional[str] = None):
+    taxonomy = load_rna_tables(sample_id).taxonomy
+    if node not in taxonomy["nodes"]:
+        raise HTTPException(status_code=404, detail=f"Taxonomy node {node} not found")
+    return [taxonomy["nodes"][label] for label in taxonomy["children"].get(node, [])]
 
 
 @router.get("/scrna/samples")
 def scrna_samples():
+    """Samples discovered under data/RNAseq_data; n_clusters is null until a sample has been loaded."""
     return scrna_samples_data()
 
 
+@router.get("/scrna/samples/cache")
+def scrna_samples_cache():
+    """Which samples are resident, their estimated bytes against the cap, and load/eviction counters."""
+    return _registry.stats()
+
+
 @router.get("/scrna/clusters")
-def scrna_clusters(sample_id: Optional[str] = None):
-    return scrna_clusters_data()
+def scrna_clusters(request: Request, response: Response, sample_id: Optional[str] = None):
+    resolved, path = _registry.resolve(sample_id)
+    cached = not_modified(request, response, make_etag("scrna_clusters", resolved, rna_source_version(path)))
+    if cached is not None:
+        return cached
+    return scrna_clusters_data(resolved)
 
 
 @router.get("/scrna/markers")
 def scrna_markers(sample_id: str, cluster_id: str, limit: int = Query(50, ge=1, le=500)):
-    return scrna_markers_data(cluster_id, limit)
+    return scrna_markers_data(cluster_id, limit, sample_id)
+
+
+@router.get("/scrna/search")
+def scrna_search_route(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(20, ge=1, le=200),
+    sample_id: Optional[str] = None,
+):
+    """Autocomplete over marker genes (from DE results) and annotation terms by id or name prefix."""
+    return scrna_search_data(q, limit, sample_id)
+
+
+@router.get("/scrna/genes/{gene}/clusters")
+def scrna_gene_clusters(gene: str, sample_id: Optional[str] = None):
+    """
+    Clusters carrying a marker: significant up-regulated clusters for a DE gene (most significant first),
+    or member clusters for an annotation term label/name.
+    """
+    return scrna_gene_clusters_data(gene, sample_id)
+
+
+@router.get("/scrna/taxonomy")
+def scrna_taxonomy_route(
+    level: str = Query("class", regex="^(class|subclass|supertype|cluster)$"),
+    sample_id: Optional[str] = None,
+):
+    """Every taxonomy node at one level with its parent and rolled-up cell/cluster counts."""
+    return scrna_taxonomy_data(level, sample_id)
+
+
+@router.get("/scrna/taxonomy/{node}/children")
+def scrna_taxonomy_children(node: str, sample_id: Optional[str] = None):
+    """Direct children of a taxonomy node (one level down), with their rolled-up counts."""
+    return scrna_taxonomy_children_data(node, sample_id)
+
+
+@router.get("/scrna/expression")
+def scrna_expression(
+    gene: str,
+    cluster_id: Optional[str] = None,
+    max_cells: int = Query(200, ge=0, le=5000),
+    sample_id: Optional[str] = None,
+):
+    """
+    Per-cluster mean, fraction of cells expressing, and an evenly downsampled cell vector for one gene,
+    streamed from the sample's on-disk .h5ad (all clusters when cluster_id is omitted).
+    """
+    from code.api.scrna_expression import scrna_expression_data
+
+    return scrna_expression_data(gene, cluster_id, max_cells, sample_id)
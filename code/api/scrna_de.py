@@ -0,0 +1,329 @@
+"""
+Offline cluster-vs-rest differential expression over the on-disk .h5ad matrix, persisted as a zarr store.
+Reason: /scrna/markers needs real logFC / adjusted p-values; computing them per request is far too slow,
+so they are computed once here (sparse, chunked, vectorized over all genes; cell ranges of a CSR matrix
+or gene ranges of a CSC matrix spread across worker processes) and the endpoint reads one small row per cluster.
+
+Usage:
+  python -m code.api.scrna_de --workers 4                 # default sample: data/RNAseq_data/de_results.zarr
+  python -m code.api.scrna_de --sample sample-b           # data/RNAseq_data/sample-b/de_results.zarr
+  python -m code.api.scrna_de --workers 8 --worker-memory-mb 4096
+"""
+import argparse
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from code.api import scrna
+
+# Genes kept per cluster in the ranked arrays the endpoint reads
+DE_TOP_K = 500
+DE_METHOD = "welch_t"
+# Each worker holds float64 per-cluster accumulators for the genes of its task, so workers multiply
+# memory: the default stays small and a task's gene span is capped to fit RNA_DE_WORKER_MEMORY_MB.
+DE_WORKERS = int(os.getenv("RNA_DE_WORKERS", "2"))
+DE_WORKER_MEMORY_MB = float(os.getenv("RNA_DE_WORKER_MEMORY_MB", "1024"))
+# float64 (clusters x genes) arrays alive per task: sums, sumsq and the two one-hot products being added
+_ACCUMULATOR_COPIES = 4
+
+# Per-process state for pool workers (set by _init_worker)
+_worker = {}
+
+
+def _init_worker(path: str, codes: np.ndarray, n_clusters: int, chunk_cells: int, chunk_genes: int):
+    import h5py
+
+    f = h5py.File(path, "r")
+    X = f["X"]
+    encoding = X.attrs.get("encoding-type", "array") if hasattr(X, "attrs") else "array"
+    encoding = encoding.decode() if isinstance(encoding, bytes) else encoding
+    _worker.update(
+        file=f,
+        X=X,
+        encoding=encoding,
+        n_genes=int(X.attrs["shape"][1]) if encoding.endswith("_matrix") else X.shape[1],
+        codes=codes,
+        n_clusters=n_clusters,
+        chunk_cells=chunk_cells,
+        chunk_genes=chunk_genes,
+    )
+
+
+def _accumulate(sums, sumsq, codes, block) -> None:
+    """Add one (cells x genes) block into per-cluster sums via a sparse one-hot (clusters x cells) product."""
+    import scipy.sparse as sp
+
+    keep = np.flatnonzero(codes >= 0)
+    onehot = sp.csr_matrix((np.ones(keep.size), (codes[keep], keep)), shape=(sums.shape[0], block.shape[0]))
+    block = block.astype(np.float64)
+    sums += (onehot @ block).toarray()
+    sumsq += (onehot @ block.multiply(block)).toarray()
+
+
+def task_genes(n_clusters: int, worker_memory_mb: float) -> int:
+    """Most genes one task may cover so that its accumulators fit in worker_memory_mb."""
+    return max(1, int(worker_memory_mb * 2**20 // (_ACCUMULATOR_COPIES * 8 * max(n_clusters, 1))))
+
+
+def cell_moments(start: int, end: int, glo: int, ghi: int):
+    """
+    CSR / dense layouts: per-cluster sum and sum of squares over cells [start, end) for genes [glo, ghi),
+    decoding chunk_cells rows at a time. Each worker reads only its own rows; the parent adds the
+    partial moments. Only rows of clusters present in the range are returned.
+    """
+    import scipy.sparse as sp
+
+    X, codes, n_genes = _worker["X"], _worker["codes"], _worker["n_genes"]
+    sums = np.zeros((_worker["n_clusters"], ghi - glo))
+    sumsq = np.zeros_like(sums)
+    step = _worker["chunk_cells"]
+    for lo in range(start, end, step):
+        hi = min(lo + step, end)
+        if _worker["encoding"] == "csr_matrix":
+            indptr = X["indptr"][lo:hi + 1]
+            a, b = int(indptr[0]), int(indptr[-1])
+            block = sp.csr_matrix((X["data"][a:b], X["indices"][a:b], indptr - a), shape=(hi - lo, n_genes))
+            if (glo, ghi) != (0, n_genes):
+                block = block[:, glo:ghi]
+        else:
+            block = sp.csr_matrix(np.asarray(X[lo:hi, glo:ghi]))
+        _accumulate(sums, sumsq, codes[lo:hi], block)
+    rows = np.unique(codes[start:end])
+    rows = rows[rows >= 0]
+    return rows, glo, ghi, sums[rows], sumsq[rows]
+
+
+def gene_moments(lo: int, hi: int):
+    """
+    CSC layout: per-cluster moments for genes [lo, hi) over all cells, decoding chunk_genes columns at
+    a time so memory is bounded by one sub-range's nnz rather than the whole gene block.
+    """
+    import scipy.sparse as sp
+
+    X, codes = _worker["X"], _worker["codes"]
+    sums = np.zeros((_worker["n_clusters"], hi - lo))
+    sumsq = np.zeros_like(sums)
+    step = _worker["chunk_genes"]
+    for g0 in range(lo, hi, step):
+        g1 = min(g0 + step, hi)
+        indptr = X["indptr"][g0:g1 + 1]
+        a, b = int(indptr[0]), int(indptr[-1])
+        block = sp.csc_matrix((X["data"][a:b], X["indices"][a:b], indptr - a), shape=(codes.size, g1 - g0))
+        _accumulate(sums[:, g0 - lo:g1 - lo], sumsq[:, g0 - lo:g1 - lo], codes, block)
+    return lo, hi, sums, sumsq
+
+
+def welch_t(sums, sumsq, sizes):
+    """
+    Cluster-vs-rest log fold change and two-sided Welch t-test p-values from per-cluster moments.
+    The matrix is log-normalized, so logFC is the difference of mean log expression.
+    """
+    from scipy.stats import t as t_dist
+
+    n1 = sizes[:, None].astype(np.float64)
+    n2 = sizes.sum() - n1
+    tot, tot_sq = sums.sum(axis=0), sumsq.sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        m1 = sums / n1
+        m2 = (tot - sums) / n2
+        v1 = np.maximum(sumsq - n1 * m1 ** 2, 0) / (n1 - 1)
+        v2 = np.maximum((tot_sq - sumsq) - n2 * m2 ** 2, 0) / (n2 - 1)
+        s1, s2 = v1 / n1, v2 / n2
+        se = np.sqrt(s1 + s2)
+        stat = (m1 - m2) / se
+        df = (s1 + s2) ** 2 / (s1 ** 2 / (n1 - 1) + s2 ** 2 / (n2 - 1))
+        pvals = 2 * t_dist.sf(np.abs(stat), df)
+    pvals[~np.isfinite(pvals)] = 1.0
+    return np.nan_to_num(m1 - m2), pvals
+
+
+def bh_adjust(pvals: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values along the last axis (one family per cluster)."""
+    m = pvals.shape[-1]
+    order = np.argsort(pvals, axis=-1)
+    ranked = np.take_along_axis(pvals, order, axis=-1) * m / np.arange(1, m + 1)
+    ranked = np.minimum.accumulate(ranked[..., ::-1], axis=-1)[..., ::-1]
+    out = np.empty_like(pvals)
+    np.put_along_axis(out, order, np.minimum(ranked, 1.0), axis=-1)
+    return out
+
+
+def rank_markers(logfc: np.ndarray, pval_adj: np.ndarray, top_k: int) -> np.ndarray:
+    """Per cluster: up-regulated genes first, by adjusted p-value then descending logFC."""
+    k = min(top_k, logfc.shape[1])
+    top = np.empty((logfc.shape[0], k), dtype=np.int32)
+    for row in range(logfc.shape[0]):
+        down = logfc[row] <= 0
+        top[row] = np.lexsort((-logfc[row], pval_adj[row], down))[:k]
+    return top
+
+
+def _create(group, name, data, chunks):
+    create = getattr(group, "create_array", None) or group.create_dataset
+    arr = create(name, shape=data.shape, chunks=chunks, dtype=data.dtype)
+    arr[...] = data
+    return arr
+
+
+def write_results(path: Path, aliases, gene_ids, gene_symbols, sizes, logfc, pval_adj, top):
+    """
+    Full (clusters x genes) logFC / adjusted p arrays chunked one cluster per chunk, plus the ranked
+    top-K genes with their values so a markers request reads three small rows.
+    """
+    import shutil
+
+    import zarr
+
+    tmp = path.with_name(path.name + f".{os.getpid()}.tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    group = zarr.open_group(str(tmp), mode="w")
+    n_genes = logfc.shape[1]
+    _create(group, "logfc", logfc.astype(np.float32), (1, n_genes))
+    _create(group, "pval_adj", pval_adj.astype(np.float32), (1, n_genes))
+    _create(group, "top_genes", top, (1, top.shape[1]))
+    _create(group, "top_logfc", np.take_along_axis(logfc, top, axis=1).astype(np.float32), (1, top.shape[1]))
+    _create(group, "top_pval_adj", np.take_along_axis(pval_adj, top, axis=1).astype(np.float64), (1, top.shape[1]))
+    group.attrs.update({
+        "method": DE_METHOD,
+        "correction": "benjamini_hochberg",
+        "cluster_aliases": [int(a) for a in aliases],
+        "cluster_sizes": [int(s) for s in sizes],
+        "gene_ids": list(gene_ids),
+        "gene_symbols": list(gene_symbols),
+    })
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp, path)
+
+
+def compute_de(
+    h5ad_path: Path,
+    out_path: Path,
+    workers: int = 1,
+    gene_block: Optional[int] = None,
+    chunk_cells: int = 20000,
+    top_k: int = DE_TOP_K,
+    chunk_genes: int = 512,
+    worker_memory_mb: float = DE_WORKER_MEMORY_MB,
+    sample_dir: Optional[Path] = None,
+) -> dict:
+    """
+    Run the full DE pass and write the zarr store. Returns a short summary for logging.
+    CSR/dense matrices are split across workers by cell range (each worker reads only its rows and the
+    parent sums the partial moments); CSC matrices by gene range (gene_block genes per task). Either way
+    a task covers at most task_genes() genes, so each worker's accumulators stay within worker_memory_mb;
+    the parent holds two float64 (clusters x genes) arrays for the results.
+    """
+    from code.api.scrna_expression import _ExpressionHandle
+
+    handle = _ExpressionHandle(h5ad_path, sample_dir)
+    codes, aliases = handle.cell_codes, handle.cluster_aliases
+    gene_ids, gene_symbols = handle.gene_ids, handle.gene_symbols
+    by_gene = handle.encoding == "csc_matrix"  # workers open their own file handles
+
+    n_clusters, n_genes, n_cells = len(aliases), len(gene_ids), codes.size
+    sizes = np.bincount(codes[codes >= 0], minlength=n_clusters)
+    workers = max(workers, 1)
+    span = task_genes(n_clusters, worker_memory_mb)
+    if by_gene:
+        gene_block = min(gene_block or max(1, -(-n_genes // workers)), span)
+        tasks = [(lo, min(lo + gene_block, n_genes)) for lo in range(0, n_genes, gene_block)]
+        fn = gene_moments
+    else:
+        # Wider matrices than the memory cap allows are swept in gene ranges, re-reading each cell range
+        cell_block = max(1, -(-n_cells // workers))
+        tasks = [
+            (lo, min(lo + cell_block, n_cells), glo, min(glo + span, n_genes))
+            for glo in range(0, n_genes, span)
+            for lo in range(0, n_cells, cell_block)
+        ]
+        fn = cell_moments
+    init_args = (str(h5ad_path), codes, n_clusters, chunk_cells, chunk_genes)
+
+    sums = np.zeros((n_clusters, n_genes))
+    sumsq = np.zeros((n_clusters, n_genes))
+
+    def collect(result):
+        if by_gene:
+            lo, hi, s, sq = result
+            sums[:, lo:hi], sumsq[:, lo:hi] = s, sq
+        else:
+            rows, lo, hi, s, sq = result
+            sums[rows, lo:hi] += s
+            sumsq[rows, lo:hi] += sq
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(*init_args)
+        try:
+            for task in tasks:
+                collect(fn(*task))
+        finally:
+            _worker.pop("file").close()
+    else:
+        ctx = multiprocessing.get_context("spawn")  # h5py handles must not cross a fork
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker, initargs=init_args) as pool:
+            for result in pool.map(fn, *zip(*tasks)):
+                collect(result)
+
+    # Turn moments into statistics slab by slab, reusing the moment buffers to keep peak memory flat
+    slab = max(1, gene_block or 2048)
+    for lo in range(0, n_genes, slab):
+        hi = min(lo + slab, n_genes)
+        sums[:, lo:hi], sumsq[:, lo:hi] = welch_t(sums[:, lo:hi], sumsq[:, lo:hi], sizes)
+    logfc, pvals = sums, sumsq
+
+    pval_adj = bh_adjust(pvals)
+    top = rank_markers(logfc, pval_adj, top_k)
+    write_results(out_path, aliases, gene_ids, gene_symbols, sizes, logfc, pval_adj, top)
+    return {
+        "clusters": n_clusters,
+        "genes": n_genes,
+        "partition": "genes" if by_gene else "cells",
+        "tasks": len(tasks),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+
+def main():
+    from fastapi import HTTPException
+
+    from code.api.scrna_expression import h5ad_path
+
+    ap = argparse.ArgumentParser(description="Compute cluster-vs-rest marker statistics for /scrna/markers.")
+    ap.add_argument("--sample", default=None, help="Sample id under data/RNAseq_data (default sample when omitted)")
+    ap.add_argument("--h5ad", type=Path, default=None, help="Expression matrix (default: the sample's .h5ad)")
+    ap.add_argument("--out", type=Path, default=None, help="Output store (default: <sample dir>/de_results.zarr)")
+    ap.add_argument(
+        "--workers", type=int, default=DE_WORKERS,
+        help="Worker processes (one cell or gene range each). Each needs up to --worker-memory-mb for its "
+             "accumulators (4 x clusters x genes-per-task x 8 bytes) plus one decoded chunk",
+    )
+    ap.add_argument(
+        "--worker-memory-mb", type=float, default=DE_WORKER_MEMORY_MB,
+        help="Accumulator budget per worker; caps the genes a task covers",
+    )
+    ap.add_argument("--gene-block", type=int, default=None, help="CSC only: genes per task (default: split evenly across workers)")
+    ap.add_argument("--chunk-cells", type=int, default=20000, help="CSR/dense: cells decoded per chunk")
+    ap.add_argument("--chunk-genes", type=int, default=512, help="CSC: genes decoded per chunk")
+    ap.add_argument("--top-k", type=int, default=DE_TOP_K, help="Ranked genes stored per cluster")
+    args = ap.parse_args()
+    try:
+        sample_id, sample_dir, h5ad = h5ad_path(args.sample)
+    except HTTPException as e:
+        raise SystemExit(f"❌ {e.detail}")
+    # Next to the sample's reference tables, where its RnaSample loads DE results from
+    out = args.out or sample_dir / scrna.RNA_DE_RESULTS_NAME
+    summary = compute_de(
+        args.h5ad or h5ad, out, args.workers, args.gene_block, args.chunk_cells, args.top_k, args.chunk_genes,
+        args.worker_memory_mb, sample_dir,
+    )
+    print(f"✅ Wrote {out} for {sample_id}: {summary}")
+
+
+if __name__ == "__main__":
+    main()
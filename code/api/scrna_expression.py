@@ -0,0 +1,201 @@
+"""
+Per-gene expression summaries read straight from each sample's on-disk .h5ad matrix.
+Reason: the expression matrix is far larger than RAM; only the requested gene's values are streamed
+chunk by chunk, so memory is bounded by the chunk size rather than the matrix.
+"""
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+
+from code.api import scrna
+
+# Matrix of the sample stored directly in RNA_DIR; other samples keep theirs as <sample dir>/<sample_id>-log2.h5ad
+RNA_H5AD_PATH = Path(os.getenv("RNA_H5AD_PATH", str(scrna.RNA_DIR / "WMB-10Xv2-OLF-log2.h5ad")))
+RNA_H5AD_SUFFIX = "-log2.h5ad"
+# Samples whose matrix metadata (gene columns, per-cell cluster codes) is kept in memory, LRU
+RNA_EXPRESSION_HANDLES = int(os.getenv("RNA_EXPRESSION_HANDLES", "4"))
+# Cells decoded per chunk when scanning a CSR (cell-major) matrix for one gene
+EXPRESSION_CHUNK_CELLS = int(os.getenv("RNA_EXPRESSION_CHUNK_CELLS", "5000"))
+
+_lock = threading.Lock()
+_handles: "OrderedDict[Path, _ExpressionHandle]" = OrderedDict()
+
+
+class _ExpressionHandle:
+    """
+    The small in-memory metadata needed to address the matrix (gene columns, cell clusters). Shared across
+    requests; each scan reads X through its own h5py file from open_matrix().
+    """
+
+    def __init__(self, path: Path, sample_dir: Optional[Path] = None):
+        import h5py
+
+        try:
+            from anndata.io import read_elem
+        except ImportError:  # anndata < 0.11
+            from anndata.experimental import read_elem
+
+        self.path = path
+        with h5py.File(path, "r") as f:
+            var = read_elem(f["var"])
+            obs = read_elem(f["obs"])
+            X = f["X"]
+            encoding = X.attrs.get("encoding-type", "array") if hasattr(X, "attrs") else "array"
+        self.encoding = encoding.decode() if isinstance(encoding, bytes) else encoding
+        self.gene_ids = [str(g) for g in var.index]
+        self.gene_symbols = var["gene_symbol"].astype(str).tolist() if "gene_symbol" in var.columns else list(self.gene_ids)
+        self.gene_cols = {g: i for i, g in enumerate(self.gene_ids)}
+        for i, sym in enumerate(self.gene_symbols):
+            self.gene_cols.setdefault(sym, i)
+        self.n_cells = len(obs)
+        if "cluster_alias" in obs.columns:
+            aliases = obs["cluster_alias"]
+        else:
+            meta_path = (sample_dir or scrna.RNA_DIR) / "cell_metadata.csv"
+            meta = scrna.read_rna_table(meta_path, ["cell_label", "cluster_alias"])
+            aliases = pd.Series(obs.index, index=obs.index).map(meta.set_index("cell_label")["cluster_alias"])
+        codes, uniques = pd.factorize(pd.to_numeric(aliases, errors="coerce"))
+        self.cell_codes = codes  # -1 for cells without a cluster
+        self.cluster_aliases = [int(a) for a in uniques]
+        self.cluster_codes = {a: i for i, a in enumerate(self.cluster_aliases)}
+
+    @contextmanager
+    def open_matrix(self):
+        """Per-request read handle on X; the module lock covers only the open, not the scan."""
+        import h5py
+
+        with _lock:
+            f = h5py.File(self.path, "r")
+        try:
+            yield f["X"]
+        finally:
+            f.close()
+
+    def gene_values(self, X, col: int, rows_wanted: np.ndarray):
+        """
+        Yield (row_start, dense_values) for successive row chunks of X that contain any wanted row.
+        Only the gene's column is materialized densely, one chunk at a time.
+        """
+        if self.encoding == "csc_matrix":
+            # Gene-major: the column is one contiguous slice
+            indptr = X["indptr"]
+            lo, hi = int(indptr[col]), int(indptr[col + 1])
+            values = np.zeros(self.n_cells, dtype=np.float32)
+            for start in range(lo, hi, EXPRESSION_CHUNK_CELLS * 10):
+                end = min(start + EXPRESSION_CHUNK_CELLS * 10, hi)
+                values[X["indices"][start:end]] = X["data"][start:end]
+            yield 0, values
+            return
+        wanted_chunks = np.unique(rows_wanted // EXPRESSION_CHUNK_CELLS)
+        for chunk in wanted_chunks:
+            start = int(chunk) * EXPRESSION_CHUNK_CELLS
+            end = min(start + EXPRESSION_CHUNK_CELLS, self.n_cells)
+            if self.encoding == "csr_matrix":
+                indptr = X["indptr"][start:end + 1]
+                lo, hi = int(indptr[0]), int(indptr[-1])
+                indices = X["indices"][lo:hi]
+                hit = np.flatnonzero(indices == col)
+                values = np.zeros(end - start, dtype=np.float32)
+                if hit.size:
+                    rows = np.searchsorted(indptr, hit + lo, side="right") - 1
+                    values[rows] = X["data"][lo:hi][hit]
+            else:
+                values = np.asarray(X[start:end, col], dtype=np.float32)
+            yield start, values
+
+
+def h5ad_path(sample_id: Optional[str] = None) -> tuple:
+    """(sample_id, sample directory, expression matrix path) for a sample; None picks the default sample."""
+    sample_id, sample_dir = scrna.resolve_sample(sample_id)
+    if sample_dir == scrna.RNA_DIR:
+        return sample_id, sample_dir, RNA_H5AD_PATH
+    return sample_id, sample_dir, sample_dir / f"{sample_id}{RNA_H5AD_SUFFIX}"
+
+
+def get_expression_handle(sample_id: Optional[str] = None) -> _ExpressionHandle:
+    sample_id, sample_dir, path = h5ad_path(sample_id)
+    with _lock:
+        handle = _handles.get(path)
+        if handle is not None:
+            _handles.move_to_end(path)
+            return handle
+        if not path.exists():
+            raise HTTPException(status_code=500, detail=f"Expression matrix for {sample_id} not found at {path.name}")
+        try:
+            handle = _ExpressionHandle(path, sample_dir)
+        except ImportError:
+            raise HTTPException(status_code=500, detail="Expression endpoint requires h5py and anndata")
+        _handles[path] = handle
+        # handles keep no file open, so evicting one never disturbs a scan in flight
+        while len(_handles) > RNA_EXPRESSION_HANDLES:
+            _handles.popitem(last=False)
+        return handle
+
+
+def _sample_rows(rows: np.ndarray, max_cells: int) -> np.ndarray:
+    if rows.size <= max_cells:
+        return rows
+    return rows[np.linspace(0, rows.size - 1, max_cells).astype(int)]
+
+
+def scrna_expression_data(gene: str, cluster_id: Optional[str], max_cells: int, sample_id: Optional[str] = None):
+    h = get_expression_handle(sample_id)
+    col = h.gene_cols.get(gene)
+    if col is None:
+        raise HTTPException(status_code=404, detail=f"Gene {gene} not found in expression matrix")
+    if cluster_id is not None:
+        try:
+            alias = int(cluster_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="cluster_id must be an integer")
+        if alias not in h.cluster_codes:
+            return []
+        target_codes = [h.cluster_codes[alias]]
+    else:
+        target_codes = list(range(len(h.cluster_aliases)))
+
+    n = len(h.cluster_aliases)
+    in_target = np.zeros(n + 1, dtype=bool)  # last slot catches code -1
+    in_target[target_codes] = True
+    rows_wanted = np.flatnonzero(in_target[h.cell_codes])
+    samples = {c: _sample_rows(rows_wanted[h.cell_codes[rows_wanted] == c], max_cells) for c in target_codes}
+    sample_rows = np.sort(np.concatenate(list(samples.values()))) if samples else np.array([], dtype=int)
+    sample_vals = {}
+
+    sums = np.zeros(n, dtype=np.float64)
+    expressing = np.zeros(n, dtype=np.int64)
+    counts = np.zeros(n, dtype=np.int64)
+    with h.open_matrix() as X:
+        for start, values in h.gene_values(X, col, rows_wanted):
+            end = start + values.size
+            lo, hi = np.searchsorted(rows_wanted, [start, end])
+            rows = rows_wanted[lo:hi]
+            codes = h.cell_codes[rows]
+            vals = values[rows - start]
+            sums += np.bincount(codes, weights=vals, minlength=n)
+            expressing += np.bincount(codes, weights=vals > 0, minlength=n).astype(np.int64)
+            counts += np.bincount(codes, minlength=n)
+            slo, shi = np.searchsorted(sample_rows, [start, end])
+            for r in sample_rows[slo:shi]:
+                sample_vals[int(r)] = float(values[r - start])
+
+    results = []
+    for c in target_codes:
+        if counts[c] == 0:
+            continue
+        results.append({
+            "cluster_id": str(h.cluster_aliases[c]),
+            "gene": gene,
+            "n_cells": int(counts[c]),
+            "mean": float(sums[c] / counts[c]),
+            "fraction_expressing": float(expressing[c] / counts[c]),
+            "values": [sample_vals[int(r)] for r in samples[c]],
+        })
+    return results
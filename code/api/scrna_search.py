@@ -0,0 +1,87 @@
+"""
+Inverted gene/term -> clusters index and sorted prefix index for scRNA lookups.
+Reason: "which clusters carry marker X" and name autocomplete become a dict hit and a bisect
+instead of DataFrame scans; both are built once when the scRNA tables load.
+"""
+from bisect import bisect_left
+from typing import Optional
+
+import numpy as np
+
+# A DE gene counts as a cluster marker when up-regulated at or below this adjusted p-value
+MARKER_PVAL_ADJ_MAX = 0.05
+
+
+def _de_gene_records(de: dict) -> dict:
+    """gene symbol -> significant up-regulated clusters, inverted from the ranked top-K arrays."""
+    group = de["group"]
+    top_genes = group["top_genes"][...]
+    top_logfc = group["top_logfc"][...]
+    top_pval = group["top_pval_adj"][...]
+    aliases = np.empty(len(de["rows"]), dtype=np.int64)
+    for alias, row in de["rows"].items():
+        aliases[row] = alias
+    rows, ranks = np.nonzero((top_pval <= MARKER_PVAL_ADJ_MAX) & (top_logfc > 0))
+    by_gene = {}
+    for row, rank in zip(rows.tolist(), ranks.tolist()):
+        g = int(top_genes[row, rank])
+        by_gene.setdefault(g, []).append({
+            "cluster_id": str(aliases[row]),
+            "gene": de["gene_symbols"][g],
+            "name": de["gene_ids"][g],
+            "logfc": float(top_logfc[row, rank]),
+            "pval_adj": float(top_pval[row, rank]),
+            "color": None,
+        })
+    return {de["gene_symbols"][g]: recs for g, recs in by_gene.items()}
+
+
+def build_search_index(markers_by_cluster: dict, de: Optional[dict]) -> dict:
+    """
+    Invert the per-cluster marker index (annotation terms) and the DE results (genes) into
+    (kind, id) -> cluster records, plus a sorted (lowercase text, kind, id, name) list for prefix search.
+    Genes win over terms when a lowercase name collides.
+    """
+    records = {}
+    names = {}
+    if de is not None:
+        for symbol, recs in _de_gene_records(de).items():
+            recs.sort(key=lambda r: (r["pval_adj"], -r["logfc"]))
+            records[("gene", symbol)] = recs
+            names[("gene", symbol)] = recs[0]["name"]
+    for recs in markers_by_cluster.values():
+        for rec in recs:
+            key = ("term", rec["gene"])
+            records.setdefault(key, []).append(rec)
+            names.setdefault(key, rec["name"])
+
+    lookup = {}
+    prefix = []
+    for (kind, ident), name in names.items():
+        for txt in {ident, name} - {None}:
+            lowered = str(txt).lower()
+            lookup.setdefault(lowered, (kind, ident))
+            prefix.append((lowered, kind, ident, name))
+    prefix.sort()
+    return {"records": records, "lookup": lookup, "prefix": prefix}
+
+
+def search(index: dict, q: str, limit: int) -> list:
+    """Genes and terms whose id or name starts with q (case-insensitive), deduplicated, in name order."""
+    q = q.strip().lower()
+    prefix = index["prefix"]
+    out, seen = [], set()
+    i = bisect_left(prefix, (q,))
+    while i < len(prefix) and prefix[i][0].startswith(q) and len(out) < limit:
+        _, kind, ident, name = prefix[i]
+        if (kind, ident) not in seen:
+            seen.add((kind, ident))
+            out.append({"kind": kind, "id": ident, "name": name, "n_clusters": len(index["records"][(kind, ident)])})
+        i += 1
+    return out
+
+
+def clusters_for(index: dict, name: str) -> Optional[list]:
+    """Cluster records carrying a gene (by symbol/id) or annotation term (by label/name); None if unknown."""
+    key = index["lookup"].get(name.strip().lower())
+    return index["records"][key] if key is not None else None
@@ -0,0 +1,73 @@
+"""
+Cell taxonomy tree (class -> subclass -> supertype -> cluster) with cell-count rollups per node.
+Reason: drill-down charts read one precomputed level at a time instead of re-aggregating clusters client-side.
+"""
+import pandas as pd
+
+TAXONOMY_LEVELS = ("class", "subclass", "supertype", "cluster")
+LEVEL_COLUMN = "cluster_annotation_term_set_name"
+
+
+def _term_levels(membership_df: pd.DataFrame, terms_df: pd.DataFrame) -> pd.Series:
+    """term label -> taxonomy level, from the term table (or the membership table when it carries the level)."""
+    levels = pd.Series(dtype=object)
+    for df, label_col in ((terms_df, "label"), (membership_df, "cluster_annotation_term_label")):
+        if LEVEL_COLUMN in df.columns:
+            found = df.dropna(subset=[LEVEL_COLUMN]).drop_duplicates(label_col).set_index(label_col)[LEVEL_COLUMN]
+            levels = levels.combine_first(found.astype(str).str.lower())
+    return levels
+
+
+def _term_attr(terms: pd.DataFrame, col: str, labels: list) -> list:
+    return terms[col].reindex(labels).tolist() if col in terms.columns else [None] * len(labels)
+
+
+def build_taxonomy(membership_df: pd.DataFrame, terms_df: pd.DataFrame, clusters_df: pd.DataFrame) -> dict:
+    """
+    One row per cluster with its term at each level, then a groupby per level for n_cells / n_clusters.
+    A node's parent is the term its clusters share one level up.
+    Returns {"nodes": label -> record, "by_level": level -> [labels], "children": label -> [labels]}.
+    """
+    m = membership_df[["cluster_annotation_term_label", "cluster_alias"]].copy()
+    m["level"] = m["cluster_annotation_term_label"].map(_term_levels(membership_df, terms_df))
+    m = m[m["level"].isin(TAXONOMY_LEVELS)].drop_duplicates(["cluster_alias", "level"])
+    wide = m.pivot(index="cluster_alias", columns="level", values="cluster_annotation_term_label")
+    present = [level for level in TAXONOMY_LEVELS if level in wide.columns]
+    cells = clusters_df.drop_duplicates("cluster_alias").set_index("cluster_alias")["number_of_cells"]
+    wide["n_cells"] = cells.reindex(wide.index).fillna(0).astype("int64").to_numpy()
+
+    terms = terms_df.drop_duplicates("label").set_index("label")
+    order = terms["term_order"] if "term_order" in terms.columns else None
+    nodes, by_level, children = {}, {}, {}
+    for depth, level in enumerate(present):
+        parent_level = present[depth - 1] if depth else None
+        agg = {"n_cells": ("n_cells", "sum"), "n_clusters": ("n_cells", "size")}
+        if parent_level:
+            agg["parent_id"] = (parent_level, "first")
+        grouped = wide.dropna(subset=[level]).groupby(level).agg(**agg)
+        if order is not None:
+            grouped = grouped.assign(_order=order.reindex(grouped.index).to_numpy()).sort_values("_order", kind="stable")
+        labels = grouped.index.tolist()
+        parents = grouped["parent_id"].tolist() if parent_level else [None] * len(labels)
+        for label, name, color, parent, n_cells, n_clusters in zip(
+            labels,
+            _term_attr(terms, "name", labels),
+            _term_attr(terms, "color_hex_triplet", labels),
+            parents,
+            grouped["n_cells"].tolist(),
+            grouped["n_clusters"].tolist(),
+        ):
+            parent = None if pd.isna(parent) else parent
+            nodes[label] = {
+                "node_id": label,
+                "name": None if pd.isna(name) else name,
+                "level": level,
+                "parent_id": parent,
+                "n_cells": int(n_cells),
+                "n_clusters": int(n_clusters),
+                "color": None if pd.isna(color) else color,
+            }
+            if parent is not None:
+                children.setdefault(parent, []).append(label)
+        by_level[level] = labels
+    return {"nodes": nodes, "by_level": by_level, "children": children}
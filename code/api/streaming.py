@@ -0,0 +1,83 @@
+"""
+Streaming bulk output (NDJSON / Arrow IPC) for row-heavy read endpoints.
+Reason: large pulls stream from a server-side cursor in fixed-size batches instead of materializing every row as a dict.
+"""
+import io
+import json
+import os
+from typing import Iterator, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import text
+
+from code.database.connect import connect
+
+NDJSON = "application/x-ndjson"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+STREAM_BATCH_ROWS = int(os.getenv("API_STREAM_BATCH_ROWS", "5000"))
+
+
+def stream_format(request: Request) -> Optional[str]:
+    """Return the streaming media type requested via Accept, or None for the default JSON list."""
+    accept = (request.headers.get("accept") or "").lower()
+    if ARROW_STREAM in accept:
+        return ARROW_STREAM
+    if NDJSON in accept:
+        return NDJSON
+    return None
+
+
+def iter_batches(query: str, params: dict, batch_rows: Optional[int] = None) -> Iterator[tuple]:
+    """
+    Yield (columns, rows) batches from a server-side cursor.
+    Opens its own connection: the generator outlives the request-scoped dependency.
+    """
+    with connect() as conn:
+        result = conn.execution_options(yield_per=batch_rows or STREAM_BATCH_ROWS).execute(text(query), params)
+        cols = list(result.keys())
+        for part in result.partitions():
+            yield cols, part
+
+
+def _ndjson_chunks(batches) -> Iterator[bytes]:
+    for cols, rows in batches:
+        yield "".join(json.dumps(dict(zip(cols, row)), default=str) + "\n" for row in rows).encode()
+
+
+def _arrow_schema(pa, columns: dict):
+    fields = []
+    for name, kind in columns.items():
+        typ = pa.timestamp("us", tz="UTC") if kind == "timestamp" else pa.type_for_alias(kind)
+        fields.append(pa.field(name, typ))
+    return pa.schema(fields)
+
+
+def _arrow_chunks(pa, batches, columns: dict) -> Iterator[bytes]:
+    schema = _arrow_schema(pa, columns)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for cols, rows in batches:
+            arrays = [pa.array([row[i] for row in rows], type=schema.field(c).type) for i, c in enumerate(cols)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    # End-of-stream marker written on close
+    yield sink.getvalue()
+
+
+def stream_rows(query: str, params: dict, media_type: str, columns: dict) -> StreamingResponse:
+    """
+    Stream every row of query as NDJSON or an Arrow IPC stream.
+    columns maps result column -> Arrow type alias ("string", "int64", "double", "timestamp") in SELECT order.
+    """
+    batches = iter_batches(query, params)
+    if media_type == ARROW_STREAM:
+        try:
+            import pyarrow as pa
+            import pyarrow.ipc  # noqa: F401
+        except ImportError:
+            raise HTTPException(status_code=406, detail="Arrow output requires pyarrow on the server")
+        return StreamingResponse(_arrow_chunks(pa, batches, columns), media_type=ARROW_STREAM)
+    return StreamingResponse(_ndjson_chunks(batches), media_type=NDJSON)
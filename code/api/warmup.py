@@ -0,0 +1,67 @@
+"""
+Startup warm-up: preload heavy reference data before the first user request.
+Reason: the scRNA tables and atlas/subject lists were loaded on first use, so the first dashboard
+request paid for CSV parsing and DB round-trips. Warm-up runs in the background from the app lifespan;
+/status/ready reports progress. Set API_WARMUP=0 to skip it (small dev instances start instantly
+and keep the lazy path).
+"""
+import asyncio
+import os
+import time
+
+import anyio
+
+from code.api import scrna
+from code.api.deps import fetch_all_cached
+from code.api.routes_data import REGIONS_TREE_SQL, SUBJECTS_SQL
+from code.database.connect import connect_async
+
+WARMUP_ENABLED = os.getenv("API_WARMUP", "1").strip().lower() in ("1", "true", "yes", "on")
+
+_lock = asyncio.Lock()
+_state = {"enabled": WARMUP_ENABLED, "started_at": None, "finished_at": None, "steps": {}}
+
+
+async def _warm_reference_lists():
+    # Same endpoint keys and queries as the routes, so these entries serve the first real request
+    async with connect_async() as conn:
+        await fetch_all_cached("regions_tree", REGIONS_TREE_SQL, {}, conn, pin=True)
+        await fetch_all_cached("subjects", SUBJECTS_SQL, {}, conn, pin=True)
+
+
+async def _warm_scrna():
+    await anyio.to_thread.run_sync(scrna.load_rna_tables)
+
+
+STEPS = {
+    "reference_lists": _warm_reference_lists,
+    "scrna_tables": _warm_scrna,
+}
+
+
+async def run_warmup():
+    """Run every step once; a failing step is recorded and left to the lazy path, never fatal."""
+    async with _lock:
+        if _state["finished_at"] is not None:
+            return
+        _state["started_at"] = time.time()
+        for name in STEPS:
+            _state["steps"][name] = {"status": "pending"}
+        for name, step in STEPS.items():
+            start = time.perf_counter()
+            _state["steps"][name]["status"] = "running"
+            try:
+                await step()
+            except Exception as e:
+                detail = getattr(e, "detail", None) or str(e)
+                _state["steps"][name] = {"status": "error", "error": detail}
+            else:
+                _state["steps"][name] = {"status": "ok"}
+            _state["steps"][name]["seconds"] = round(time.perf_counter() - start, 3)
+        _state["finished_at"] = time.time()
+
+
+def readiness() -> dict:
+    """Warm-up progress; ready once warm-up has finished (or immediately when disabled)."""
+    ready = not _state["enabled"] or _state["finished_at"] is not None
+    return {**_state, "ready": ready, "steps": {k: dict(v) for k, v in _state["steps"].items()}}
@@ -4,22 +4,193 @@ Now modularized so other scripts (like etl.py) can import the connection.
 '''
 import os
 import sys
-from sqlalchemy import create_engine, text
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
 
 # CONNECTION SETTINGS
 # Since you are on localhost with your user, this URL is correct based on your previous file.
 # If you ever add a password, it would look like: tisyasharma:password@localhost...
 # Prefer env override so dev/prod can differ without code changes
 DB_URL = os.getenv("DATABASE_URL", "postgresql+psycopg2://tisyasharma@localhost:5432/murthy_db")
+# Async read path (FastAPI routes); derived from DB_URL unless overridden
+ASYNC_DB_URL = os.getenv("ASYNC_DATABASE_URL")
+# A checkout slower than this counts as having waited for a free connection (an idle pooled checkout takes microseconds)
+POOL_WAIT_THRESHOLD_S = float(os.getenv("DB_POOL_WAIT_THRESHOLD_S", "0.005"))
+
+# One engine (and therefore one pool) per process; created lazily on first use.
+_engine = None
+_async_engine = None
+_engine_lock = threading.Lock()
+_stats_lock = threading.Lock()
+_pool_stats = {
+    "connects": 0,
+    "checkouts": 0,
+    "checkins": 0,
+    "checkout_total_s": 0.0,
+    "waits": 0,
+    "wait_total_s": 0.0,
+    "wait_max_s": 0.0,
+}
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    val = os.getenv(name)
+    if val is None:
+        return default
+    return val.strip().lower() in ("1", "true", "yes", "on")
+
+
+def pool_settings() -> dict:
+    """Pool tuning from the environment (DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING)."""
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+    }
+
+
+def _bump(key: str, inc=1):
+    with _stats_lock:
+        _pool_stats[key] += inc
+
+
+def _attach_pool_listeners(engine):
+    event.listen(engine, "connect", lambda *_: _bump("connects"))
+    event.listen(engine, "checkout", lambda *_: _bump("checkouts"))
+    event.listen(engine, "checkin", lambda *_: _bump("checkins"))
+
 
 def get_engine():
-    """Creates and returns a database engine."""
+    """Returns the process-wide database engine, creating it on first call."""
+    global _engine
+    if _engine is not None:
+        return _engine
+    with _engine_lock:
+        if _engine is None:
+            try:
+                kwargs = pool_settings() if not DB_URL.startswith("sqlite") else {}
+                engine = create_engine(DB_URL, **kwargs)
+            except Exception as e:
+                print(f"❌ Error creating engine: {e}")
+                sys.exit(1)
+            _attach_pool_listeners(engine)
+            _engine = engine
+    return _engine
+
+
+def async_db_url() -> str:
+    """ASYNC_DATABASE_URL, or DB_URL with its driver swapped for asyncpg/aiosqlite."""
+    if ASYNC_DB_URL:
+        return ASYNC_DB_URL
+    url = make_url(DB_URL)
+    backend = url.get_backend_name()
+    if backend == "postgresql":
+        return url.set(drivername="postgresql+asyncpg").render_as_string(hide_password=False)
+    if backend == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return DB_URL
+
+
+def get_async_engine():
+    """Returns the process-wide async engine used by the read-only API routes."""
+    global _async_engine
+    if _async_engine is not None:
+        return _async_engine
+    with _engine_lock:
+        if _async_engine is None:
+            from sqlalchemy.ext.asyncio import create_async_engine
+
+            url = async_db_url()
+            kwargs = pool_settings() if not url.startswith("sqlite") else {}
+            engine = create_async_engine(url, **kwargs)
+            _attach_pool_listeners(engine.sync_engine)
+            _async_engine = engine
+    return _async_engine
+
+
+def dispose_engine():
+    """Close pooled connections and drop the shared engine (e.g. on shutdown or after fork)."""
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.dispose()
+            _engine = None
+
+
+async def dispose_async_engine():
+    global _async_engine
+    engine, _async_engine = _async_engine, None
+    if engine is not None:
+        await engine.dispose()
+
+
+def _record_checkout(elapsed: float):
+    """Every checkout adds to checkout_total_s; only ones that blocked past the threshold count as waits."""
+    with _stats_lock:
+        _pool_stats["checkout_total_s"] += elapsed
+        if elapsed < POOL_WAIT_THRESHOLD_S:
+            return
+        _pool_stats["waits"] += 1
+        _pool_stats["wait_total_s"] += elapsed
+        if elapsed > _pool_stats["wait_max_s"]:
+            _pool_stats["wait_max_s"] = elapsed
+
+
+@contextmanager
+def connect(engine=None):
+    """Check out a pooled connection, recording how long the checkout took and whether it waited."""
+    engine = engine or get_engine()
+    start = time.perf_counter()
+    conn = engine.connect()
+    _record_checkout(time.perf_counter() - start)
     try:
-        engine = create_engine(DB_URL)
-        return engine
-    except Exception as e:
-        print(f"❌ Error creating engine: {e}")
-        sys.exit(1)
+        yield conn
+    finally:
+        conn.close()
+
+
+@asynccontextmanager
+async def connect_async(engine=None):
+    """Async counterpart of connect() on the async engine."""
+    engine = engine or get_async_engine()
+    start = time.perf_counter()
+    conn = await engine.connect()
+    _record_checkout(time.perf_counter() - start)
+    try:
+        yield conn
+    finally:
+        await conn.close()
+
+
+def pool_stats() -> dict:
+    """Snapshot of pool occupancy plus cumulative checkout/wait counters."""
+    with _stats_lock:
+        snap = dict(_pool_stats)
+    snap["wait_avg_s"] = snap["wait_total_s"] / snap["waits"] if snap["waits"] else 0.0
+    pool = _engine.pool if _engine is not None else None
+    if isinstance(pool, QueuePool):
+        snap.update(_occupancy(pool))
+    pool = _async_engine.sync_engine.pool if _async_engine is not None else None
+    if isinstance(pool, QueuePool):
+        snap["async"] = _occupancy(pool)
+    return snap
+
+
+def _occupancy(pool) -> dict:
+    return {
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+    }
+
 
 def test_connection():
     """Runs a quick check to see if Postgres is awake."""
@@ -4,8 +4,9 @@
 # - utils: helpers (hashing, CSV load, hemisphere detection, session ids)
 # - subjects: seed subjects/sessions from config_map
 # - bids: scan OME-Zarr/BIDS, dedupe by hash, register sessions/files
-# - atlas: load Allen atlas into brain_regions
+# - atlas: load Allen atlas into brain_regions (+ ancestor/descendant closure table)
 # - counts: ingest quantification CSVs with checksum dedupe
+# - summary: materialized region_summary refresh for /fluor/summary
 # - stats: simple counter/summary helpers
 # - runner: orchestrates the end-to-end ETL
 
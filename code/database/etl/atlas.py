@@ -1,6 +1,6 @@
 """
 Atlas loader.
-Reason: isolated Allen atlas JSON flattening into brain_regions.
+Reason: isolated Allen atlas JSON flattening into brain_regions (plus its closure table).
 """
 import json
 import pandas as pd
@@ -27,6 +27,30 @@ def flatten_atlas(node, parent_id=None):
     return rows
 
 
+def rebuild_region_closure(conn):
+    """
+    Rebuild brain_region_closure (ancestor, descendant, depth) from brain_regions.parent_id.
+    Reason: subtree/ancestor questions become one indexed lookup instead of a recursive walk per request.
+    Every region gets a depth-0 self row, so regions without a parent (e.g. CSV-only extras) still resolve.
+    """
+    conn.execute(text("DELETE FROM brain_region_closure;"))
+    conn.execute(
+        text(
+            """
+            WITH RECURSIVE closure(ancestor_id, descendant_id, depth) AS (
+                SELECT region_id, region_id, 0 FROM brain_regions
+                UNION ALL
+                SELECT c.ancestor_id, br.region_id, c.depth + 1
+                FROM closure c
+                JOIN brain_regions br ON br.parent_id = c.descendant_id
+            )
+            INSERT INTO brain_region_closure (ancestor_id, descendant_id, depth)
+            SELECT ancestor_id, descendant_id, depth FROM closure;
+            """
+        )
+    )
+
+
 def load_atlas(engine):
     if not ATLAS_JSON.exists():
         raise FileNotFoundError(f"Atlas JSON not found at {ATLAS_JSON}")
@@ -63,6 +87,7 @@ def load_atlas(engine):
             )
         )
         conn.execute(text(f"DROP TABLE IF EXISTS {brain_stage};"))
+        rebuild_region_closure(conn)
         conn.execute(
             text("""
                 INSERT INTO units (name, description) VALUES
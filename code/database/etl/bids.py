@@ -195,7 +195,8 @@ def load_bids_files(engine, stats: dict, existing_hashes: set | None = None, all
                     INSERT INTO microscopy_files (session_id, run, hemisphere, path, sha256)
                     SELECT session_id, run, hemisphere, path, sha256
                     FROM {files_stage}
-                    ON CONFLICT (session_id, run, hemisphere) DO NOTHING;
+                    ON CONFLICT (session_id, run, hemisphere) DO UPDATE SET sha256 = EXCLUDED.sha256
+                    WHERE microscopy_files.path = EXCLUDED.path;
                     """
                 )
             )
@@ -6,6 +6,7 @@ import os
 from pathlib import Path
 import pandas as pd
 from sqlalchemy import text, types as satypes
+from .atlas import rebuild_region_closure
 from .utils import (
     clean_numeric,
     detect_hemisphere,
@@ -227,6 +228,7 @@ def insert_counts(engine, count_rows, session_rows_from_counts, extra_regions):
                     ON CONFLICT (region_id) DO NOTHING;
                 """))
                 conn.execute(text(f"DROP TABLE IF EXISTS {extra_stage};"))
+                rebuild_region_closure(conn)
 
         if count_rows:
             df_counts = pd.DataFrame(count_rows)
@@ -4,8 +4,9 @@ Reason: orchestrates modular stages so etl.py can stay thin and testable.
 """
 from sqlalchemy import text
 from code.database.connect import get_engine
+from code.database.generation import bump_generation
 from .paths import DATA_ROOT, BIDS_ROOT, ATLAS_JSON
-from . import subjects, bids, atlas, counts
+from . import subjects, bids, atlas, counts, summary
 from .stats import summarize
 from .atlas import load_atlas
 from code.src.conversion.config_map import SUBJECT_MAP
@@ -55,10 +56,19 @@ def run_etl():
     count_rows, session_rows_from_counts, extra_regions = counts.ingest_counts(engine, unit_map, atlas_map, file_map, stats)
     counts.insert_counts(engine, count_rows, session_rows_from_counts, extra_regions)
 
+    # Step 5: refresh materialized summary for subjects touched by this run (and drop cleaned-up subjects)
+    print("\n--- Step 5: Refreshing region summary ---")
+    with engine.begin() as conn:
+        # An empty summary (fresh schema or pre-existing data) gets a full rebuild
+        has_summary = conn.execute(text("SELECT 1 FROM region_summary LIMIT 1")).first()
+        touched = {row["subject_id"] for row in count_rows}
+        summary.refresh_region_summary(conn, touched if has_summary else None)
+
     # Log end
     with engine.begin() as conn:
         conn.execute(text("INSERT INTO ingest_log (source_path, status, message) VALUES (:p, :s, :m)"),
                      {"p": str(DATA_ROOT), "s": "success", "m": "ETL complete"})
+        bump_generation(conn)
 
     print("\n✅ ETL Complete. Database hydrated.")
     print("\n--- Summary ---")
@@ -0,0 +1,110 @@
+"""
+Materialized region summary.
+Reason: /fluor/summary reads pre-aggregated rows instead of joining and grouping region_counts per request.
+
+Rows are keyed by experiment_type x hemisphere x subject x region. Rows with subject_id NULL hold the
+all-subjects rollup per experiment_type, so unfiltered summaries read one row per region/hemisphere.
+"""
+from sqlalchemy import bindparam, text
+
+_SUMMARY_COLS = (
+    "experiment_type, hemisphere, subject_id, region_id, region_name, records, "
+    "region_pixels_sum, load_sum, object_count_sum, object_count_n"
+)
+
+
+def _experiment_types(conn, subject_ids) -> set:
+    """Experiment types whose rollup rows depend on the given subjects or on deleted subjects."""
+    rows = conn.execute(
+        text(
+            """
+            SELECT DISTINCT experiment_type FROM region_summary
+            WHERE subject_id IN :sids
+               OR (subject_id IS NOT NULL AND subject_id NOT IN (SELECT subject_id FROM subjects))
+            UNION
+            SELECT DISTINCT experiment_type FROM subjects WHERE subject_id IN :sids
+            """
+        ).bindparams(bindparam("sids", expanding=True)),
+        {"sids": list(subject_ids)},
+    )
+    return {r.experiment_type for r in rows}
+
+
+def refresh_region_summary(conn, subject_ids=None) -> None:
+    """
+    Refresh region_summary inside the caller's transaction.
+    subject_ids=None rebuilds everything; otherwise only those subjects (and their rollups) are recomputed.
+    """
+    if subject_ids is None:
+        conn.execute(text("DELETE FROM region_summary"))
+        subject_filter = ""
+        params = {}
+        exps = None
+    else:
+        subject_ids = sorted(set(subject_ids))
+        exps = _experiment_types(conn, subject_ids)
+        conn.execute(
+            text(
+                """
+                DELETE FROM region_summary
+                WHERE subject_id IN :sids
+                   OR (subject_id IS NOT NULL AND subject_id NOT IN (SELECT subject_id FROM subjects))
+                """
+            ).bindparams(bindparam("sids", expanding=True)),
+            {"sids": subject_ids},
+        )
+        subject_filter = "WHERE rc.subject_id IN :sids"
+        params = {"sids": subject_ids}
+
+    stmt = text(
+        f"""
+        INSERT INTO region_summary ({_SUMMARY_COLS})
+        SELECT s.experiment_type, rc.hemisphere, rc.subject_id, rc.region_id, br.name,
+               COUNT(*), SUM(rc.region_pixels), SUM(rc.load), SUM(rc.object_count), COUNT(rc.object_count)
+        FROM region_counts rc
+        JOIN brain_regions br ON rc.region_id = br.region_id
+        JOIN subjects s ON rc.subject_id = s.subject_id
+        {subject_filter}
+        GROUP BY s.experiment_type, rc.hemisphere, rc.subject_id, rc.region_id, br.name
+        """
+    )
+    if params:
+        stmt = stmt.bindparams(bindparam("sids", expanding=True))
+    conn.execute(stmt, params)
+
+    # All-subjects rollup rows are derived from the per-subject rows, not from region_counts
+    if exps is None:
+        exp_filter = ""
+        params = {}
+    else:
+        if not exps:
+            return
+        conn.execute(
+            text("DELETE FROM region_summary WHERE subject_id IS NULL AND experiment_type IN :exps").bindparams(
+                bindparam("exps", expanding=True)
+            ),
+            {"exps": sorted(exps)},
+        )
+        exp_filter = "AND experiment_type IN :exps"
+        params = {"exps": sorted(exps)}
+    stmt = text(
+        f"""
+        INSERT INTO region_summary ({_SUMMARY_COLS})
+        SELECT experiment_type, hemisphere, NULL, region_id, region_name,
+               SUM(records), SUM(region_pixels_sum), SUM(load_sum), SUM(object_count_sum), SUM(object_count_n)
+        FROM region_summary
+        WHERE subject_id IS NOT NULL {exp_filter}
+        GROUP BY experiment_type, hemisphere, region_id, region_name
+        """
+    )
+    if params:
+        stmt = stmt.bindparams(bindparam("exps", expanding=True))
+    conn.execute(stmt, params)
+
+
+if __name__ == "__main__":
+    from code.database.connect import get_engine
+
+    with get_engine().begin() as conn:
+        refresh_region_summary(conn)
+    print("✅ region_summary rebuilt.")
@@ -2,28 +2,20 @@
 ETL utilities.
 Reason: reusable helpers (hashing, CSV load, hemisphere detection, session id allocation).
 """
-import hashlib
 import os
 import re
 from pathlib import Path
 import pandas as pd
 from sqlalchemy import text
 
+from code.database.store_manifest import digest_file, store_sha256
+
 
 def file_sha256(path: Path, chunk_size: int = 1_048_576) -> str:
-    h = hashlib.sha256()
+    # Zarr directory stores: Merkle hash over a cached per-file manifest, rehashing only changed chunks
     if path.is_dir():
-        # Deterministic walk for stable hashes
-        for sub in sorted(p for p in path.rglob("*") if p.is_file()):
-            h.update(str(sub.relative_to(path)).encode())
-            with sub.open("rb") as f:
-                for chunk in iter(lambda: f.read(chunk_size), b""):
-                    h.update(chunk)
-    else:
-        with path.open("rb") as f:
-            for chunk in iter(lambda: f.read(chunk_size), b""):
-                h.update(chunk)
-    return h.hexdigest()
+        return store_sha256(path)
+    return digest_file(path, chunk_size)
 
 
 def clean_numeric(val):
@@ -0,0 +1,33 @@
+"""
+Data-generation counter.
+Reason: every write path bumps one row inside its own transaction so readers (API caches) can tell when data changed.
+"""
+from sqlalchemy import text
+
+_CURRENT_SQL = "SELECT generation FROM data_generation WHERE id = 1"
+
+
+def bump_generation(conn) -> None:
+    """Increment the data generation; call inside the transaction that writes the data."""
+    conn.execute(
+        text(
+            """
+            INSERT INTO data_generation (id, generation, updated_at)
+            VALUES (1, 1, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE
+            SET generation = data_generation.generation + 1, updated_at = CURRENT_TIMESTAMP;
+            """
+        )
+    )
+
+
+def current_generation(conn) -> int:
+    """Return the committed data generation (0 if never bumped)."""
+    val = conn.execute(text(_CURRENT_SQL)).scalar()
+    return int(val or 0)
+
+
+async def current_generation_async(conn) -> int:
+    """current_generation for an AsyncConnection."""
+    val = (await conn.execute(text(_CURRENT_SQL))).scalar()
+    return int(val or 0)
@@ -1,57 +1,61 @@
 """
 Helper to ingest uploaded microscopy images:
-- Converts PNG/JPG/TIFF (and other imageio-readable formats) to OME-Zarr.
+- Converts PNG/JPG/TIFF (and other imageio-readable formats) to OME-Zarr; TIFF/OME-TIFF inputs are
+  read lazily tile by tile so large slides never sit in memory whole. Each store carries a 2x mean
+  downsampled pyramid so zoomed-out views read small levels.
 - Writes into BIDS-style layout under data/raw_bids/sub-*/ses-*/micr/.
 - Registers sessions and microscopy_files in the database with SHA256 hashes.
 
 Usage (example):
   python -m code.database.ingest_upload --subject sub-DBL_A --session ses-dbl --hemisphere right \
-    --pixel-size-um 0.5 path/to/image1.png path/to/image2.tif
+    --pixel-size-um 0.5 --workers 4 --codec zstd --clevel 5 --chunks 512,512 path/to/image1.png path/to/image2.tif
 """
 
 import argparse
-import hashlib
+import contextlib
 import json
+import multiprocessing
+import os
+import queue
 import shutil
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
+import dask
 import dask.array as da
 import warnings
 from PIL import Image, ImageFile
 import imageio.v3 as iio
 import numpy as np
+import tifffile
 import zarr
 from ome_zarr.io import parse_url
-from ome_zarr.writer import write_image
-from sqlalchemy import text, types as satypes
+from ome_zarr.writer import write_multiscale
+from sqlalchemy import bindparam, text, types as satypes
 
 from code.database.connect import get_engine
+from code.database.generation import bump_generation
+from code.database.store_manifest import digest_file, store_sha256
+from code.database.zarr_storage import add_storage_args, storage_from_args, storage_options
 
 ROOT = Path(__file__).resolve().parents[2]  # project root
 BIDS_ROOT = ROOT / "data" / "raw_bids"
 
 
 def file_sha256(path: Path, chunk_size: int = 1_048_576) -> str:
-    h = hashlib.sha256()
+    # Directory stores hash through their manifest (only new/changed chunk files are read)
     if path.is_dir():
-        # Deterministic walk so the same tree hashes identically
-        for sub in sorted(p for p in path.rglob("*") if p.is_file()):
-            h.update(str(sub.relative_to(path)).encode())
-            with sub.open("rb") as f:
-                while True:
-                    chunk = f.read(chunk_size)
-                    if not chunk:
-                        break
-                    h.update(chunk)
-    else:
-        with path.open("rb") as f:
-            while True:
-                chunk = f.read(chunk_size)
-                if not chunk:
-                    break
-                h.update(chunk)
-    return h.hexdigest()
+        return store_sha256(path)
+    return digest_file(path, chunk_size)
+
+
+def store_bytes(path: Path) -> int:
+    """Total bytes on disk for a file or a directory store (e.g. an OME-Zarr tree)."""
+    if path.is_dir():
+        return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+    return path.stat().st_size
 
 
 def load_image(path: Path) -> np.ndarray:
@@ -73,18 +77,106 @@ def load_image(path: Path) -> np.ndarray:
     return arr
 
 
-def write_omezarr(data: np.ndarray, dest: Path, pixel_size_um: float) -> None:
+TIFF_SUFFIXES = {".tif", ".tiff"}
+# Chunk edge (pixels) used for lazily read images and the OME-Zarr store
+TILE_PX = 512
+# Downsampled (2x mean) levels written below full resolution; fewer when the image fits in one tile sooner
+PYRAMID_LEVELS = int(os.getenv("INGEST_PYRAMID_LEVELS", "4"))
+
+
+def _to_cyx(arr, axes: str):
+    """Reorder a 2-D/3-D image (numpy or dask) to (C, Y, X), dropping an alpha channel like load_image does."""
+    if arr.ndim == 2:
+        return arr[np.newaxis, ...]
+    if arr.ndim == 3 and axes.endswith("S"):
+        if arr.shape[2] == 4:
+            arr = arr[:, :, :3]
+        return arr.transpose(2, 0, 1)
+    if arr.ndim == 3 and axes.endswith("YX"):
+        return arr
+    raise ValueError(f"Unsupported image shape {arr.shape} (axes {axes})")
+
+
+@contextlib.contextmanager
+def open_tiff_lazy(path: Path):
+    """
+    Yield a (C, Y, X) dask array over a TIFF/OME-TIFF without decoding it up front.
+    Uncompressed contiguous data is memory-mapped; tiled or compressed strips are decoded tile by tile
+    through tifffile's zarr store, so only the chunks being written are held in memory.
+    """
+    with tifffile.TiffFile(path) as tf:
+        series = tf.series[0]
+        if series.dataoffset is not None:
+            chunks = tuple(TILE_PX if ax in "YX" else -1 for ax in series.axes)
+            arr = da.from_array(tifffile.memmap(path, series=0, mode="r"), chunks=chunks)
+            yield _to_cyx(arr, series.axes)
+            return
+        store = series.aszarr(level=0)
+        try:
+            arr = da.from_zarr(zarr.open(store, mode="r"))
+            yield _to_cyx(arr, series.axes)
+        finally:
+            store.close()
+
+
+@contextlib.contextmanager
+def open_image(path: Path):
+    """
+    Yield the image as a (C, Y, X) dask array: TIFFs are read lazily (open_tiff_lazy), other formats
+    (PNG/JPG/...) are decoded whole by load_image since they cannot be read tile-wise.
+    """
+    if path.suffix.lower() in TIFF_SUFFIXES:
+        with open_tiff_lazy(path) as arr:
+            yield arr
+    else:
+        yield da.from_array(load_image(path))
+
+
+def build_pyramid(base: da.Array, levels: int) -> list:
+    """
+    Full resolution plus up to `levels` 2x mean-downsampled (C, Y, X) levels, each computed chunk-wise
+    from the one above. Odd trailing rows/columns are dropped; stops once a level fits in one tile.
+    """
+    pyramid = [base]
+    for _ in range(levels):
+        prev = pyramid[-1]
+        _, h, w = prev.shape
+        if max(h, w) <= TILE_PX or min(h, w) < 2:
+            break
+        down = da.coarsen(np.mean, prev[:, : h - h % 2, : w - w % 2], {1: 2, 2: 2})
+        if np.issubdtype(base.dtype, np.integer):
+            down = da.round(down)
+        pyramid.append(down.astype(base.dtype).rechunk((base.shape[0], TILE_PX, TILE_PX)))
+    return pyramid
+
+
+def write_omezarr(
+    data, dest: Path, pixel_size_um: float, pyramid_levels: Optional[int] = None, storage: Optional[dict] = None,
+) -> None:
+    """
+    Write a (C, Y, X) numpy or dask array as a multiscale OME-Zarr image; dask inputs are streamed
+    chunk by chunk into the store. Each level's scale/translation is recorded in the multiscales metadata.
+    storage: optional {"codec", "clevel", "shuffle", "chunks"} (see zarr_storage); chunks default to (C, 512, 512).
+    """
     dest.parent.mkdir(parents=True, exist_ok=True)
     store = parse_url(dest, mode="w").store
     root = zarr.group(store=store)
-    darr = da.from_array(data, chunks=(data.shape[0], 512, 512))
+    darr = data if isinstance(data, da.Array) else da.from_array(data)
+    darr = darr.rechunk((darr.shape[0], TILE_PX, TILE_PX))
+    pyramid = build_pyramid(darr, PYRAMID_LEVELS if pyramid_levels is None else pyramid_levels)
     ps_m = pixel_size_um * 1e-6
-    write_image(
-        darr,
-        group=root,
-        axes="cyx",
-        scaler=None,
-        coordinate_transformations=[[{"type": "scale", "scale": [1.0, ps_m, ps_m]}]],
+    transforms = []
+    for level in range(len(pyramid)):
+        factor = 2 ** level
+        # a mean-downsampled pixel is centred between the (factor x factor) pixels it averages
+        offset = ps_m * (factor - 1) / 2
+        transforms.append([
+            {"type": "scale", "scale": [1.0, ps_m * factor, ps_m * factor]},
+            {"type": "translation", "translation": [0.0, offset, offset]},
+        ])
+    options = storage_options(darr.shape, (darr.shape[0], TILE_PX, TILE_PX), **(storage or {}))
+    write_multiscale(
+        pyramid, group=root, axes="cyx", coordinate_transformations=transforms, storage_options=options
     )
 
 def write_sidecar(dest: Path, subject: str, session: str, run: int, hemisphere: str, experiment_type: str, pixel_size_um: float):
@@ -124,67 +216,265 @@ def validate_outputs(dest: Path):
     if not dd.exists():
         raise FileNotFoundError(f"Missing dataset_description.json at {dd}")
 
-def ingest(subject: str, session: str, hemisphere: str, files: list[Path], pixel_size_um: float = 1.0, experiment_type: str = "double_injection"):
+
+# Processes converting files in parallel inside ingest(); each holds one decoded image in memory.
+# Background jobs (code/api/jobs.py) pass their own share of this budget instead of the full value.
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+def _output_path(subject: str, session: str, idx: int) -> Path:
+    return BIDS_ROOT / subject / session / "microscopy" / f"{subject}_{session}_run-{idx:02d}_micr.ome.zarr"
+
+
+def _remove_outputs(dest: Path) -> None:
+    shutil.rmtree(dest, ignore_errors=True)
+    dest.with_suffix(dest.suffix + ".json").unlink(missing_ok=True)
+
+
+def discard_unregistered_outputs(subject: str, session: str, n_files: int) -> list[Path]:
+    """
+    Remove stores (and sidecars) at an upload's output paths that no microscopy_files row points to:
+    what a conversion left behind when its process died before ingest could register or remove it.
+    """
+    dests = [_output_path(subject, session, idx) for idx in range(1, n_files + 1)]
+    with get_engine().connect() as conn:
+        registered = set(conn.execute(
+            text("SELECT path FROM microscopy_files WHERE path IN :paths").bindparams(
+                bindparam("paths", expanding=True)
+            ),
+            {"paths": [str(d) for d in dests]},
+        ).scalars())
+    removed = [
+        d for d in dests
+        if str(d) not in registered and (d.exists() or d.with_suffix(d.suffix + ".json").exists())
+    ]
+    for dest in removed:
+        _remove_outputs(dest)
+    return removed
+
+
+def convert_file(
+    src: Path, dest: Path, idx: int, subject: str, session: str, hemisphere: str, experiment_type: str,
+    pixel_size_um: float, pyramid_levels: Optional[int] = None, storage: Optional[dict] = None,
+) -> dict:
+    """
+    Decode one input, write its OME-Zarr store + sidecar, and hash the store. No DB access or BIDS_ROOT
+    lookups, so it can run in a worker process; the parent validates outputs. Returns {"index", "path", "sha256", "bytes_written"}.
+    """
+    if not src.exists():
+        raise FileNotFoundError(f"Input file not found: {src}")
+    # Clean up any stale store from prior attempts so the writer can proceed
+    if dest.exists():
+        _remove_outputs(dest)
+    with open_image(src) as data:
+        write_omezarr(data, dest, pixel_size_um, pyramid_levels, storage)
+    write_sidecar(dest, subject, session, idx, hemisphere, experiment_type, pixel_size_um)
+    return {"index": idx, "path": dest, "sha256": file_sha256(dest), "bytes_written": store_bytes(dest)}
+
+
+# Conversion-pool worker state: queue on which a worker announces the file index it has started
+_started = None
+# Seconds between checks for newly started files while waiting on the conversion pool
+PROGRESS_POLL_S = 0.5
+
+
+def _init_convert_worker(started) -> None:
+    global _started
+    _started = started
+
+
+def _convert_in_worker(*args) -> dict:
+    if _started is not None:
+        _started.put(args[2])
+    # Parallelism comes from the process pool; keep dask single-threaded inside each worker
+    with dask.config.set(scheduler="synchronous"):
+        return convert_file(*args)
+
+
+def _convert_all(files: list[Path], workers: int, report, subject: str, session: str, options: tuple) -> list[dict]:
+    """Convert every file (in a process pool when workers > 1); on any failure remove all outputs and raise."""
+    args = {
+        idx: (src, _output_path(subject, session, idx), idx, subject, session, *options)
+        for idx, src in enumerate(files, start=1)
+    }
+    results = {}
+
+    def event(idx: int, status: str, **extra) -> dict:
+        base = {"index": idx, "name": files[idx - 1].name, "status": status, "bytes_written": 0, "path": None, "error": None}
+        return {**base, **extra}
+
+    def finished(idx: int, result: dict):
+        validate_outputs(result["path"])
+        results[idx] = result
+        report(event(idx, "done", bytes_written=result["bytes_written"], path=str(result["path"])))
+
+    try:
+        if workers <= 1 or len(files) <= 1:
+            for idx in args:
+                report(event(idx, "running"))
+                try:
+                    finished(idx, convert_file(*args[idx]))
+                except Exception as e:
+                    report(event(idx, "failed", error=str(e)))
+                    raise
+        else:
+            ctx = multiprocessing.get_context("spawn")
+            started = ctx.Queue()
+            running = set()
+
+            def mark_running(idx: int):
+                if idx not in running:
+                    running.add(idx)
+                    report(event(idx, "running"))
+
+            try:
+                with ProcessPoolExecutor(
+                    max_workers=min(workers, len(files)), mp_context=ctx,
+                    initializer=_init_convert_worker, initargs=(started,),
+                ) as pool:
+                    futures = {pool.submit(_convert_in_worker, *a): idx for idx, a in args.items()}
+                    # Files wait for a free worker; each turns "running" only once a worker picks it up
+                    for idx in args:
+                        report(event(idx, "queued"))
+                    pending = set(futures)
+                    while pending:
+                        done, pending = wait(pending, timeout=PROGRESS_POLL_S, return_when=FIRST_COMPLETED)
+                        while True:
+                            try:
+                                mark_running(started.get_nowait())
+                            except queue.Empty:
+                                break
+                        for fut in done:
+                            idx = futures[fut]
+                            mark_running(idx)  # its start announcement may still be in flight
+                            try:
+                                finished(idx, fut.result())
+                            except Exception as e:
+                                report(event(idx, "failed", error=str(e)))
+                                for other in futures:
+                                    other.cancel()
+                                raise
+            finally:
+                started.close()
+    except BaseException:
+        for a in args.values():
+            _remove_outputs(a[1])
+        raise
+    return [results[idx] for idx in sorted(results)]
+
+
+def registered_sources(conn, shas: list) -> set:
+    """Subset of source-byte hashes already registered in microscopy_files (indexed lookup, no decode)."""
+    if not shas:
+        return set()
+    return set(conn.execute(
+        text("SELECT source_sha256 FROM microscopy_files WHERE source_sha256 IN :shas").bindparams(
+            bindparam("shas", expanding=True)
+        ),
+        {"shas": list(shas)},
+    ).scalars())
+
+
+def check_duplicate_sources(files: list[Path], source_shas: list) -> None:
+    """Raise ValueError if any source repeats within the batch or matches an already registered upload."""
+    with get_engine().connect() as conn:
+        known = registered_sources(conn, source_shas)
+    for src, sha in zip(files, source_shas):
+        if sha in known:
+            raise ValueError(f"Duplicate microscopy source detected (source sha256 already exists) for {src.name}")
+        known.add(sha)
+
+
+def ingest(
+    subject: str,
+    session: str,
+    hemisphere: str,
+    files: list[Path],
+    pixel_size_um: float = 1.0,
+    experiment_type: str = "double_injection",
+    progress=None,
+    workers: Optional[int] = None,
+    pyramid_levels: Optional[int] = None,
+    storage: Optional[dict] = None,
+    source_hashes: Optional[dict] = None,
+):
+    """
+    Reject re-uploads by the sha256 of their source bytes before any decode or write, then convert every
+    file (decode -> OME-Zarr -> sha256) in parallel across worker processes and register all of them in
+    one short transaction. source_hashes ({file name: sha256}) skips re-reading sources the caller
+    already hashed while streaming the upload.
+    progress, if given, is called with a dict per file state change:
+    {"index", "name", "status" ("queued" | "running" | "done" | "failed"), "bytes_written", "path", "error"};
+    with worker processes, files wait as "queued" until a worker starts them.
+    storage selects the codec and chunk shape of the written stores (zarr_storage; env defaults otherwise).
+    """
+    report = progress or (lambda event: None)
+    source_shas = []
+    for src in files:
+        if not src.exists():
+            raise FileNotFoundError(f"Input file not found: {src}")
+        source_shas.append((source_hashes or {}).get(src.name) or file_sha256(src))
+    check_duplicate_sources(files, source_shas)
+    ensure_dataset_files()
+    options = (hemisphere, experiment_type, pixel_size_um, pyramid_levels, storage)
+    converted = _convert_all(files, workers or INGEST_WORKERS, report, subject, session, options)
+
     engine = get_engine()
-    inserted = []
-    with engine.begin() as conn:
-        # ensure subject exists (generic placeholder if new)
-        conn.execute(
-            text("""
-                INSERT INTO subjects (subject_id, original_id, sex, experiment_type, details)
-                VALUES (:subj, :orig, 'U', :exp_type, '')
-                ON CONFLICT (subject_id) DO NOTHING;
-            """),
-            {"subj": subject, "orig": subject, "exp_type": experiment_type},
-        )
-        # ensure session
-        conn.execute(
-            text("""
-                INSERT INTO sessions (session_id, subject_id, modality)
-                VALUES (:sid, :subj, :mod)
-                ON CONFLICT (session_id) DO NOTHING;
-            """),
-            {"sid": session, "subj": subject, "mod": "micr"},
-        )
-
-        for idx, src in enumerate(files, start=1):
-            if not src.exists():
-                raise FileNotFoundError(f"Input file not found: {src}")
-            data = load_image(src)
-            ensure_dataset_files()
-            dest = BIDS_ROOT / subject / session / "microscopy" / f"{subject}_{session}_run-{idx:02d}_micr.ome.zarr"
-            # Clean up any stale store from prior attempts so the writer can proceed
-            if dest.exists():
-                shutil.rmtree(dest, ignore_errors=True)
-                sidecar_stale = dest.with_suffix(dest.suffix + ".json")
-                sidecar_stale.unlink(missing_ok=True)
-            write_omezarr(data, dest, pixel_size_um)
-            write_sidecar(dest, subject, session, idx, hemisphere, experiment_type, pixel_size_um)
-            validate_outputs(dest)
-            sha = file_sha256(dest)
-            # reject duplicate content
-            dup = conn.execute(
-                text("SELECT 1 FROM microscopy_files WHERE sha256 = :sha LIMIT 1"),
-                {"sha": sha},
-            ).first()
-            if dup:
-                # clean up created files to avoid orphaned duplicates
-                shutil.rmtree(dest, ignore_errors=True)
-                sidecar = dest.with_suffix(dest.suffix + ".json")
-                sidecar.unlink(missing_ok=True)
+    try:
+        # reject duplicate converted content too (stores registered by the BIDS scan have no source hash)
+        with engine.connect() as conn:
+            known = set(conn.execute(
+                text("SELECT sha256 FROM microscopy_files WHERE sha256 IN :shas").bindparams(
+                    bindparam("shas", expanding=True)
+                ),
+                {"shas": [c["sha256"] for c in converted]},
+            ).scalars())
+        for src, c in zip(files, converted):
+            if c["sha256"] in known:
                 raise ValueError(f"Duplicate microscopy content detected (sha256 already exists) for {src.name}")
+            known.add(c["sha256"])
 
-            # register file
+        with engine.begin() as conn:
+            # ensure subject exists (generic placeholder if new)
+            conn.execute(
+                text("""
+                    INSERT INTO subjects (subject_id, original_id, sex, experiment_type, details)
+                    VALUES (:subj, :orig, 'U', :exp_type, '')
+                    ON CONFLICT (subject_id) DO NOTHING;
+                """),
+                {"subj": subject, "orig": subject, "exp_type": experiment_type},
+            )
+            # ensure session
             conn.execute(
                 text("""
-                    INSERT INTO microscopy_files (session_id, run, hemisphere, path, sha256)
-                    VALUES (:sid, :run, :hemi, :path, :sha)
+                    INSERT INTO sessions (session_id, subject_id, modality)
+                    VALUES (:sid, :subj, :mod)
+                    ON CONFLICT (session_id) DO NOTHING;
+                """),
+                {"sid": session, "subj": subject, "mod": "micr"},
+            )
+            # register files (one executemany)
+            conn.execute(
+                text("""
+                    INSERT INTO microscopy_files (session_id, run, hemisphere, path, sha256, source_sha256)
+                    VALUES (:sid, :run, :hemi, :path, :sha, :src_sha)
                     ON CONFLICT (session_id, run, hemisphere) DO NOTHING;
                 """),
-                {"sid": session, "run": idx, "hemi": hemisphere, "path": str(dest), "sha": sha},
+                [
+                    {
+                        "sid": session, "run": c["index"], "hemi": hemisphere, "path": str(c["path"]),
+                        "sha": c["sha256"], "src_sha": src_sha,
+                    }
+                    for src_sha, c in zip(source_shas, converted)
+                ],
             )
-            inserted.append(dest)
-    return inserted
+            bump_generation(conn)
+    except BaseException:
+        # clean up created files to avoid orphaned stores
+        for c in converted:
+            _remove_outputs(c["path"])
+        raise
+    return [c["path"] for c in converted]
 
 
 def main():
@@ -194,10 +484,16 @@ def main():
     ap.add_argument("--hemisphere", default="bilateral", choices=["left", "right", "bilateral"])
     ap.add_argument("--pixel-size-um", type=float, default=1.0, help="Pixel size in micrometers")
     ap.add_argument("--experiment-type", default="double_injection", choices=["double_injection", "rabies"], help="Experiment type to satisfy subjects constraint")
+    ap.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Processes converting files in parallel")
+    ap.add_argument("--pyramid-levels", type=int, default=PYRAMID_LEVELS, help="Downsampled 2x levels below full resolution")
+    add_storage_args(ap)
     ap.add_argument("files", nargs="+", type=Path, help="Input image files")
     args = ap.parse_args()
 
-    ingested = ingest(args.subject, args.session, args.hemisphere, args.files, args.pixel_size_um, args.experiment_type)
+    ingested = ingest(
+        args.subject, args.session, args.hemisphere, args.files, args.pixel_size_um, args.experiment_type,
+        workers=args.workers, pyramid_levels=args.pyramid_levels, storage=storage_from_args(args),
+    )
     print(f"Ingested {len(ingested)} file(s):")
     for p in ingested:
         print(" -", p)
@@ -0,0 +1,186 @@
+"""
+Durable job records for background conversion work (ingest_jobs table).
+Reason: job state lives in the database rather than in the API process, so queued or interrupted jobs
+are resumed after a restart and any API worker can report progress. Running jobs heartbeat updated_at;
+one that goes silent is requeued by the periodic stale sweep, until it has used up its attempts.
+"""
+import json
+import os
+import socket
+from datetime import datetime, timezone
+from typing import Optional
+
+from sqlalchemy import bindparam, text
+
+JOB_SELECT = """
+SELECT job_id, kind, status, params, files_total, files_done, bytes_written, progress, result, error,
+       worker_host, worker_pid, attempts, created_at, started_at, finished_at, updated_at
+FROM ingest_jobs
+"""
+_JSON_FIELDS = ("params", "progress", "result")
+
+
+def decode_job(row: dict) -> dict:
+    """JSON columns come back as text on drivers without JSONB decoding (asyncpg, sqlite)."""
+    job = dict(row)
+    for key in _JSON_FIELDS:
+        if isinstance(job.get(key), str):
+            job[key] = json.loads(job[key])
+    return job
+
+
+def create_job(conn, kind: str, params: dict, file_names: list) -> int:
+    """Insert a queued job with one pending progress entry per input file; returns job_id."""
+    progress = [{"name": n, "status": "queued", "bytes_written": 0, "path": None, "error": None} for n in file_names]
+    row = conn.execute(
+        text(
+            """
+            INSERT INTO ingest_jobs (kind, status, params, files_total, progress)
+            VALUES (:kind, 'queued', :params, :total, :progress)
+            RETURNING job_id
+            """
+        ),
+        {"kind": kind, "params": json.dumps(params), "total": len(file_names), "progress": json.dumps(progress)},
+    ).first()
+    return int(row[0])
+
+
+def get_job(conn, job_id: int) -> Optional[dict]:
+    row = conn.execute(text(JOB_SELECT + " WHERE job_id = :id"), {"id": job_id}).mappings().first()
+    return decode_job(row) if row else None
+
+
+def claim_job(conn, job_id: int) -> Optional[dict]:
+    """
+    Atomically move a queued job to running for this process and count the attempt; None if it is
+    not queued (already claimed by another worker, or finished).
+    """
+    claimed = conn.execute(
+        text(
+            """
+            UPDATE ingest_jobs
+            SET status = 'running', started_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP,
+                worker_host = :host, worker_pid = :pid, attempts = attempts + 1
+            WHERE job_id = :id AND status = 'queued'
+            """
+        ),
+        {"id": job_id, "host": socket.gethostname(), "pid": os.getpid()},
+    ).rowcount
+    return get_job(conn, job_id) if claimed else None
+
+
+def record_progress(conn, job_id: int, progress: list) -> None:
+    conn.execute(
+        text(
+            """
+            UPDATE ingest_jobs
+            SET progress = :progress, files_done = :done, bytes_written = :bytes, updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = :id
+            """
+        ),
+        {
+            "id": job_id,
+            "progress": json.dumps(progress),
+            "done": sum(1 for p in progress if p["status"] == "done"),
+            "bytes": sum(p.get("bytes_written") or 0 for p in progress),
+        },
+    )
+
+
+def finish_job(conn, job_id: int, status: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+    conn.execute(
+        text(
+            """
+            UPDATE ingest_jobs
+            SET status = :status, result = :result, error = :error,
+                finished_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = :id
+            """
+        ),
+        {"id": job_id, "status": status, "result": json.dumps(result) if result is not None else None, "error": error},
+    )
+
+
+def release_running_job(conn, job_id: int, max_attempts: int, error: str, seen=None) -> Optional[str]:
+    """
+    Hand back a running job whose worker was lost: to queued, or to failed with `error` once it has been
+    claimed max_attempts times (a job that keeps killing its worker must not loop forever).
+    With `seen`, only if updated_at still equals it (no heartbeat since it was read).
+    Returns the new status, or None if the job was not released.
+    """
+    row = conn.execute(
+        text(
+            f"""
+            UPDATE ingest_jobs
+            SET status = CASE WHEN attempts < :max THEN 'queued' ELSE 'failed' END,
+                error = CASE WHEN attempts < :max THEN error ELSE :error END,
+                finished_at = CASE WHEN attempts < :max THEN finished_at ELSE CURRENT_TIMESTAMP END,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE job_id = :id AND status = 'running' {"AND updated_at = :seen" if seen is not None else ""}
+            RETURNING status
+            """
+        ),
+        {"id": job_id, "max": max_attempts, "error": error, **({"seen": seen} if seen is not None else {})},
+    ).first()
+    return row[0] if row else None
+
+
+def requeue_worker_jobs(conn, host: str, pids: list) -> list:
+    """
+    Put back to queued the running jobs of worker processes that were stopped deliberately (API shutdown);
+    the interrupted attempt is not counted against the job.
+    """
+    if not pids:
+        return []
+    rows = conn.execute(
+        text(
+            """
+            UPDATE ingest_jobs SET status = 'queued', attempts = attempts - 1, updated_at = CURRENT_TIMESTAMP
+            WHERE status = 'running' AND worker_host = :host AND worker_pid IN :pids
+            RETURNING job_id
+            """
+        ).bindparams(bindparam("pids", expanding=True)),
+        {"host": host, "pids": list(pids)},
+    ).all()
+    return sorted(r.job_id for r in rows)
+
+
+def heartbeat(conn, job_id: int) -> bool:
+    """Refresh updated_at while a job runs; the stale sweep treats a silent running job as dead."""
+    return bool(conn.execute(
+        text("UPDATE ingest_jobs SET updated_at = CURRENT_TIMESTAMP WHERE job_id = :id AND status = 'running'"),
+        {"id": job_id},
+    ).rowcount)
+
+
+def _as_utc(value) -> datetime:
+    """Timestamps come back as aware datetimes (Postgres) or naive UTC text (sqlite CURRENT_TIMESTAMP)."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def requeue_stale(conn, stale_after_s: float, max_attempts: int) -> tuple:
+    """
+    Release every running job whose heartbeat (updated_at) is older than stale_after_s, measured on the
+    database clock: its worker died or its API process is gone, on any host. Returns (requeued, failed)
+    job ids; a job that heartbeated between the read and the write is skipped.
+    """
+    now = _as_utc(conn.execute(text("SELECT CURRENT_TIMESTAMP")).scalar())
+    rows = conn.execute(text("SELECT job_id, updated_at FROM ingest_jobs WHERE status = 'running'")).all()
+    requeued, failed = [], []
+    for r in rows:
+        # claim_job always sets updated_at, so running rows carry a heartbeat
+        if (now - _as_utc(r.updated_at)).total_seconds() < stale_after_s:
+            continue
+        status = release_running_job(conn, r.job_id, max_attempts, "Worker stopped responding", seen=r.updated_at)
+        if status == "queued":
+            requeued.append(r.job_id)
+        elif status == "failed":
+            failed.append(r.job_id)
+    return requeued, failed
+
+
+def queued_job_ids(conn) -> list:
+    rows = conn.execute(text("SELECT job_id FROM ingest_jobs WHERE status = 'queued' ORDER BY job_id")).all()
+    return [r.job_id for r in rows]
@@ -1,4 +1,8 @@
 
+DROP TABLE IF EXISTS ingest_jobs CASCADE;
+DROP TABLE IF EXISTS data_generation CASCADE;
+DROP TABLE IF EXISTS region_summary CASCADE;
+DROP TABLE IF EXISTS brain_region_closure CASCADE;
 DROP TABLE IF EXISTS region_counts CASCADE;
 DROP TABLE IF EXISTS ingest_log CASCADE;
 DROP TABLE IF EXISTS units CASCADE;
@@ -30,6 +34,14 @@ CREATE TABLE brain_regions (
     ontology_id INT
 );
 
+-- 2a. Region closure (every ancestor/descendant pair, depth 0 = self); rebuilt by etl.atlas
+CREATE TABLE brain_region_closure (
+    ancestor_id INT NOT NULL REFERENCES brain_regions(region_id),
+    descendant_id INT NOT NULL REFERENCES brain_regions(region_id),
+    depth INT NOT NULL,
+    PRIMARY KEY (ancestor_id, descendant_id)
+);
+
 -- 2b. Sessions (for imaging/omics runs)
 CREATE TABLE sessions (
     session_id VARCHAR(50) PRIMARY KEY,
@@ -48,6 +60,7 @@ CREATE TABLE microscopy_files (
     hemisphere VARCHAR(20) CHECK (hemisphere IN ('left','right','bilateral')),
     path TEXT NOT NULL,
     sha256 CHAR(64),
+    source_sha256 CHAR(64),  -- hash of the uploaded source bytes; dedupes re-uploads before conversion
     created_at TIMESTAMPTZ DEFAULT now(),
     UNIQUE(session_id, run, hemisphere)
 );
@@ -98,9 +111,61 @@ CREATE TABLE ingest_log (
     created_at TIMESTAMPTZ DEFAULT now()
 );
 
+-- 3b. Materialized summary for /fluor/summary (refreshed by etl.summary after ingest)
+-- subject_id NULL rows hold the all-subjects rollup per experiment_type
+CREATE TABLE region_summary (
+    experiment_type VARCHAR(50) NOT NULL,
+    hemisphere VARCHAR(20) NOT NULL,
+    subject_id VARCHAR(50),
+    region_id INT NOT NULL,
+    region_name VARCHAR(255) NOT NULL,
+    records INT NOT NULL,
+    region_pixels_sum BIGINT,
+    load_sum FLOAT,
+    object_count_sum BIGINT,
+    object_count_n INT
+);
+
+-- 6. Data generation marker; bumped in the same transaction as any data write so API caches can invalidate
+CREATE TABLE data_generation (
+    id INT PRIMARY KEY CHECK (id = 1),
+    generation BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+INSERT INTO data_generation (id, generation) VALUES (1, 0);
+
+-- 7. Background conversion jobs (code.database.jobs); rows outlive the API process so jobs survive restarts.
+-- progress holds one entry per file: name, status, bytes_written, path, error
+CREATE TABLE ingest_jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(30) NOT NULL,
+    status VARCHAR(20) NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    params JSONB NOT NULL,
+    files_total INT NOT NULL DEFAULT 0,
+    files_done INT NOT NULL DEFAULT 0,
+    bytes_written BIGINT NOT NULL DEFAULT 0,
+    progress JSONB,
+    result JSONB,
+    error TEXT,
+    worker_host VARCHAR(255),
+    worker_pid INT,
+    attempts INT NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT now(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    updated_at TIMESTAMPTZ DEFAULT now()
+);
+
 -- Indexes
 CREATE INDEX idx_region_counts_subject ON region_counts(subject_id);
 CREATE INDEX idx_region_counts_region ON region_counts(region_id);
 CREATE INDEX idx_region_counts_hemi ON region_counts(hemisphere);
 CREATE INDEX idx_brain_regions_parent ON brain_regions(parent_id);
+CREATE INDEX idx_brain_region_closure_descendant ON brain_region_closure(descendant_id, depth);
 CREATE INDEX idx_microscopy_files_session ON microscopy_files(session_id);
+CREATE INDEX idx_microscopy_files_source_sha ON microscopy_files(source_sha256);
+-- Keyset pagination: /fluor/counts walks region_counts_uniq (subject_id, region_id, hemisphere);
+-- /files walks this expression index (run NULLS LAST via COALESCE, file_id as tiebreaker)
+CREATE INDEX idx_microscopy_files_keyset ON microscopy_files(session_id, (COALESCE(run, 2147483647)), file_id);
+CREATE INDEX idx_ingest_jobs_status ON ingest_jobs(status);
+CREATE INDEX idx_region_summary_lookup ON region_summary(subject_id, experiment_type, hemisphere, region_id);
@@ -0,0 +1,107 @@
+"""
+Incremental Merkle-style hashing of directory stores (OME-Zarr trees).
+Reason: hashing a store used to re-read every chunk file serially on each ETL run. A manifest kept at
+the store root records (path, size, mtime, sha256) per file; the store hash is derived from the manifest
+and only files whose size or mtime changed are re-read, in a thread pool.
+"""
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Optional
+
+MANIFEST_NAME = ".sha256-manifest.json"
+MANIFEST_VERSION = 1
+# Reading and hashing release the GIL, so threads overlap I/O and digest work across chunk files
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(8, (os.cpu_count() or 1) * 2))))
+
+
+def digest_file(path: Path, chunk_size: int = 1_048_576) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _walk(store: Path):
+    """(relative posix path, stat) for every file under store except the manifest, via scandir."""
+    stack = [store]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(Path(entry.path))
+                elif entry.is_file():
+                    rel = Path(entry.path).relative_to(store).as_posix()
+                    if not rel.startswith(MANIFEST_NAME):  # manifest and its temp/clock files
+                        yield rel, entry.stat()
+
+
+def load_manifest(store: Path) -> dict:
+    try:
+        manifest = json.loads((store / MANIFEST_NAME).read_text())
+    except (OSError, ValueError):
+        return {}
+    return manifest if manifest.get("version") == MANIFEST_VERSION else {}
+
+
+def _save_manifest(store: Path, manifest: dict) -> None:
+    tmp = store / (MANIFEST_NAME + ".tmp")
+    try:
+        tmp.write_text(json.dumps(manifest, separators=(",", ":"), sort_keys=True))
+        os.replace(tmp, store / MANIFEST_NAME)
+    except OSError:
+        # read-only store: the hash is still correct, it just is not cached for next time
+        tmp.unlink(missing_ok=True)
+
+
+def _now_ns(store: Path) -> int:
+    """Filesystem clock (not the process clock) so comparisons with file mtimes are consistent."""
+    probe = store / (MANIFEST_NAME + ".clock")
+    try:
+        probe.touch()
+        return probe.stat().st_mtime_ns
+    except OSError:
+        return 0
+    finally:
+        probe.unlink(missing_ok=True)
+
+
+def update_manifest(store: Path, workers: Optional[int] = None) -> dict:
+    """
+    Refresh the store's manifest and return its {relative path: {"size", "mtime_ns", "sha256"}} entries.
+    A cached digest is reused only when size and mtime match and the file was last modified before the
+    manifest was written (a file changed in the same clock tick as the manifest is re-read, as git does).
+    """
+    old = load_manifest(store)
+    cached = old.get("files", {})
+    written_ns = old.get("written_ns", 0)
+    files, stale = {}, []
+    for rel, st in _walk(store):
+        prev = cached.get(rel)
+        if prev and prev["size"] == st.st_size and prev["mtime_ns"] == st.st_mtime_ns and st.st_mtime_ns < written_ns:
+            files[rel] = prev
+        else:
+            files[rel] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": None}
+            stale.append(rel)
+    if stale:
+        with ThreadPoolExecutor(max_workers=workers or HASH_WORKERS) as pool:
+            for rel, digest in zip(stale, pool.map(lambda r: digest_file(store / r), stale)):
+                files[rel]["sha256"] = digest
+    if stale or files.keys() != cached.keys():
+        _save_manifest(store, {"version": MANIFEST_VERSION, "written_ns": _now_ns(store), "files": files})
+    return files
+
+
+def manifest_digest(files: dict) -> str:
+    """Root hash: sha256 over sorted "path NUL size NUL sha256" lines, so any added/removed/changed file alters it."""
+    h = hashlib.sha256()
+    for rel in sorted(files):
+        h.update(f"{rel}\0{files[rel]['size']}\0{files[rel]['sha256']}\n".encode())
+    return h.hexdigest()
+
+
+def store_sha256(store: Path, workers: Optional[int] = None) -> str:
+    return manifest_digest(update_manifest(store, workers))
@@ -0,0 +1,84 @@
+"""
+Compression codec and chunk-shape options shared by the OME-Zarr writers (ingest_upload, convert_to_zarr).
+Reason: codec and chunking decide write throughput, store size and tile read latency; they are chosen
+per ingest (or from the environment) using scripts/bench_zarr_codecs.py instead of being hard-coded.
+"""
+import argparse
+import os
+from typing import Optional
+
+BLOSC_CODECS = ("zstd", "lz4", "lz4hc", "blosclz", "zlib")
+SHUFFLES = ("noshuffle", "shuffle", "bitshuffle")
+# "default" leaves compression to the zarr library; "none" stores raw chunks
+CODEC_CHOICES = ("default", "none") + BLOSC_CODECS
+
+ZARR_CODEC = os.getenv("ZARR_CODEC", "default")
+ZARR_CLEVEL = int(os.getenv("ZARR_CLEVEL", "5"))
+ZARR_SHUFFLE = os.getenv("ZARR_SHUFFLE", "shuffle")
+
+
+def parse_chunks(spec: Optional[str]) -> Optional[tuple]:
+    """'512,512' -> (512, 512); empty/None -> None (writer default)."""
+    if not spec:
+        return None
+    chunks = tuple(int(part) for part in spec.split(","))
+    if any(c <= 0 for c in chunks):
+        raise ValueError(f"Chunk sizes must be positive: {spec}")
+    return chunks
+
+
+def chunk_shape(shape: tuple, chunks: Optional[tuple], default: tuple) -> tuple:
+    """
+    Chunk shape for an array of `shape`: `chunks` overrides the trailing dimensions of `default`
+    (so (256, 256) on a (C, Y, X) image keeps C whole), clipped to the array extent.
+    """
+    chunks = tuple(chunks or ())
+    if len(chunks) > len(shape):
+        raise ValueError(f"Chunk shape {chunks} has more dimensions than array shape {shape}")
+    merged = tuple(default[: len(shape) - len(chunks)]) + chunks
+    return tuple(min(c, s) for c, s in zip(merged, shape))
+
+
+def compressor(codec: Optional[str] = None, clevel: Optional[int] = None, shuffle: Optional[str] = None):
+    """Blosc codec for zarr v3 stores; None for uncompressed; "default" defers to the zarr library."""
+    codec = codec or ZARR_CODEC
+    if codec not in CODEC_CHOICES:
+        raise ValueError(f"Unknown codec {codec!r}; expected one of {', '.join(CODEC_CHOICES)}")
+    if codec == "default":
+        return "default"
+    if codec == "none":
+        return None
+    shuffle = shuffle or ZARR_SHUFFLE
+    if shuffle not in SHUFFLES:
+        raise ValueError(f"Unknown shuffle {shuffle!r}; expected one of {', '.join(SHUFFLES)}")
+    from zarr.codecs import BloscCodec
+
+    return BloscCodec(cname=codec, clevel=ZARR_CLEVEL if clevel is None else clevel, shuffle=shuffle)
+
+
+def storage_options(
+    shape: tuple,
+    default_chunks: tuple,
+    chunks: Optional[tuple] = None,
+    codec: Optional[str] = None,
+    clevel: Optional[int] = None,
+    shuffle: Optional[str] = None,
+) -> dict:
+    """storage_options for ome_zarr's write_image / write_multiscale."""
+    options = {"chunks": chunk_shape(shape, chunks, default_chunks)}
+    comp = compressor(codec, clevel, shuffle)
+    if comp != "default":
+        options["compressor"] = comp
+    return options
+
+
+def add_storage_args(ap: argparse.ArgumentParser) -> None:
+    """--codec / --clevel / --shuffle / --chunks, shared by the converter CLIs."""
+    ap.add_argument("--codec", default=ZARR_CODEC, choices=CODEC_CHOICES, help="Chunk compressor (Blosc cname)")
+    ap.add_argument("--clevel", type=int, default=ZARR_CLEVEL, help="Blosc compression level (0-9)")
+    ap.add_argument("--shuffle", default=ZARR_SHUFFLE, choices=SHUFFLES, help="Blosc shuffle filter")
+    ap.add_argument("--chunks", type=parse_chunks, default=None, help="Chunk shape for trailing axes, e.g. 512,512")
+
+
+def storage_from_args(args: argparse.Namespace) -> dict:
+    return {"codec": args.codec, "clevel": args.clevel, "shuffle": args.shuffle, "chunks": args.chunks}
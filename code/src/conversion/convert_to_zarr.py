@@ -1,7 +1,9 @@
+import argparse
 import os
 import re
 import sys
 import shutil  # Added for auto-cleaning old folders
+from pathlib import Path
 import numpy as np
 import zarr
 from skimage.io import imread
@@ -16,6 +18,15 @@ except ImportError:
     sys.path.append(os.path.join(os.getcwd(), 'src', 'conversion'))
     from config_map import SUBJECT_MAP
 
+# Project root on sys.path so the shared codec/chunk helpers import when run as a script
+PROJECT_ROOT = Path(__file__).resolve().parents[3]
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+from code.database.zarr_storage import add_storage_args, storage_from_args, storage_options
+
+# Default chunking: 1 slice at a time, in 1024x1024 pixel tiles
+DEFAULT_CHUNKS = (1, 1024, 1024)
+
 # --- PATH CONFIGURATION ---
 # Based on your screenshot: 'images' is lowercase
 SOURCE_ROOT = os.path.join("data", "sourcedata", "images")
@@ -38,7 +49,11 @@ def extract_slice_number(filename):
     
     return 9999 # If no number found, push to end
 
-def convert_subject(folder_name, metadata):
+def convert_subject(folder_name, metadata, storage=None):
+    """
+    storage: optional {"codec", "clevel", "shuffle", "chunks"} (see code/database/zarr_storage.py);
+    chunks override the trailing axes of DEFAULT_CHUNKS.
+    """
     source_dir = os.path.join(SOURCE_ROOT, folder_name)
     
     # Safety Check: Does source exist?
@@ -129,19 +144,24 @@ def convert_subject(folder_name, metadata):
     store = parse_url(store_path, mode="w").store
     root = zarr.group(store=store)
     
-    # Write the image with 3D chunks. 
-    # (1, 1024, 1024) means "Load 1 slice at a time, in 1024x1024 pixel tiles"
-    write_image(image=volume, group=root, axes="zyx", storage_options=dict(chunks=(1, 1024, 1024)))
+    # Write the image with 3D chunks (DEFAULT_CHUNKS unless overridden) and the selected compressor
+    options = storage_options(volume.shape, DEFAULT_CHUNKS, **(storage or {}))
+    print(f"  Chunks {options['chunks']}, compressor {options.get('compressor', 'zarr default')}")
+    write_image(image=volume, group=root, axes="zyx", storage_options=options)
     print("  Done.")
 
 def main():
+    ap = argparse.ArgumentParser(description="Convert source PNG stacks to OME-Zarr volumes.")
+    add_storage_args(ap)
+    storage = storage_from_args(ap.parse_args())
+
     # Ensure output root exists
     if not os.path.exists(BIDS_ROOT):
         os.makedirs(BIDS_ROOT)
 
     # Loop through every mouse defined in config_map.py
     for raw_folder, meta in SUBJECT_MAP.items():
-        convert_subject(raw_folder, meta)
+        convert_subject(raw_folder, meta, storage)
 
 if __name__ == "__main__":
     main()
@@ -519,9 +519,25 @@ async function uploadMicroscopy(modality, mouse, sessionId, hemisphere, files){
     }
     throw new Error(msg || 'Upload failed');
   }
-  const data = await res.json();
+  const queued = await res.json();
+  // Conversion runs as a background job; wait for it so the CSV uploads can link to the new files
+  const job = await waitForJob(queued.job_id);
+  if(job.status === 'failed'){
+    throw new Error(job.error || 'Microscopy conversion failed');
+  }
   setStatus(`Uploaded ${files.length} microscopy file(s) for ${subj} -> ${sessionId}`);
-  return data;
+  return job;
+}
+
+async function waitForJob(jobId, intervalMs = 1000){
+  while(true){
+    const job = await fetchJson(`${API}/jobs/${jobId}`);
+    if(job.status === 'succeeded' || job.status === 'failed'){
+      return job;
+    }
+    showSpinner(`Converting ${job.files_done}/${job.files_total} file(s)…`);
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+  }
 }
 
 function resetUploadForm(){
@@ -623,9 +639,25 @@ async function loadSamples(){
   }
 }
 
+// /files is keyset-paged; follow X-Next-Cursor until the last page
+async function fetchAllFiles(){
+  const files = [];
+  let cursor = null;
+  do{
+    const url = new URL(`${API}/files`, window.location.href);
+    url.searchParams.set('limit', '5000');
+    if(cursor) url.searchParams.set('cursor', cursor);
+    const res = await fetch(url);
+    if(!res.ok) throw new Error(await res.text());
+    files.push(...await res.json());
+    cursor = res.headers.get('X-Next-Cursor');
+  }while(cursor);
+  return files;
+}
+
 async function loadFiles(){
   try{
-    const files = await fetchJson(`${API}/files`);
+    const files = await fetchAllFiles();
     if(fileSelect){
       fileSelect.innerHTML = '<option value="" disabled selected>Select file</option>' +
         files.map(f => {
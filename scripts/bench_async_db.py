@@ -0,0 +1,109 @@
+"""
+Benchmark the sync (threadpool) vs async DB read paths used by the API routes.
+Reason: size the async migration with numbers; the sync path is run exactly as FastAPI runs
+sync routes (anyio worker threads, 40-token limiter), the async path as the async routes do.
+
+Usage:
+  python scripts/bench_async_db.py --concurrency 50 100 200 --requests 2000 --query summary
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import anyio
+from anyio import CapacityLimiter
+
+# Ensure project root is on path so `code` package is importable when run as a script
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from code.api.deps import fetch_all, fetch_all_async
+from code.database.connect import dispose_async_engine, dispose_engine, pool_stats
+
+QUERIES = {
+    "subjects": ("SELECT subject_id, sex, experiment_type, details FROM subjects ORDER BY subject_id", {}),
+    "summary": (
+        """
+        SELECT region_id, region_name, hemisphere, SUM(records) AS records, SUM(load_sum) AS load_sum
+        FROM region_summary WHERE subject_id IS NULL
+        GROUP BY region_id, region_name, hemisphere ORDER BY region_id LIMIT 500
+        """,
+        {},
+    ),
+    "counts": (
+        """
+        SELECT rc.subject_id, rc.region_id, br.name AS region_name, rc.load, rc.hemisphere
+        FROM region_counts rc JOIN brain_regions br ON rc.region_id = br.region_id
+        ORDER BY rc.subject_id, rc.region_id, rc.hemisphere LIMIT 500
+        """,
+        {},
+    ),
+}
+
+# FastAPI/Starlette default threadpool size for sync endpoints
+THREADPOOL_TOKENS = 40
+
+
+async def _drive(concurrency: int, total: int, call) -> dict:
+    latencies = []
+    remaining = total
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+async def run(concurrency_levels, total: int, query_name: str):
+    query, params = QUERIES[query_name]
+    limiter = CapacityLimiter(THREADPOOL_TOKENS)
+
+    async def sync_call():
+        await anyio.to_thread.run_sync(fetch_all, query, params, limiter=limiter)
+
+    async def async_call():
+        await fetch_all_async(query, params)
+
+    # Warm both pools so connection setup is not measured
+    await sync_call()
+    await async_call()
+
+    print(f"query={query_name} requests={total}")
+    print(f"{'clients':>8} {'path':>6} {'req/s':>10} {'p50 ms':>9} {'p95 ms':>9}")
+    for c in concurrency_levels:
+        for label, call in (("sync", sync_call), ("async", async_call)):
+            res = await _drive(c, total, call)
+            print(f"{c:>8} {label:>6} {res['rps']:>10.1f} {res['p50_ms']:>9.2f} {res['p95_ms']:>9.2f}")
+    print("\npool:", pool_stats())
+    dispose_engine()
+    await dispose_async_engine()
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare sync threadpool vs async DB read throughput.")
+    ap.add_argument("--concurrency", type=int, nargs="+", default=[50, 100, 200], help="Concurrent clients per run")
+    ap.add_argument("--requests", type=int, default=2000, help="Requests per (concurrency, path) run")
+    ap.add_argument("--query", choices=sorted(QUERIES), default="summary")
+    args = ap.parse_args()
+    asyncio.run(run(args.concurrency, args.requests, args.query))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Microbenchmark /scrna/markers: per-request mask + merge (previous implementation) vs the precomputed per-cluster index.
+Reason: show the per-request latency change on the full Allen WMB membership table.
+
+Usage:
+  python scripts/bench_scrna_markers.py                      # uses data/RNAseq_data
+  python scripts/bench_scrna_markers.py --synthetic 5322      # WMB-sized synthetic tables when the CSVs are absent
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Ensure project root is on path so `code` package is importable when run as a script
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from code.api import scrna
+
+
+def legacy_markers(membership_df, terms_df, cluster_id: str, limit: int):
+    """The pre-index implementation, kept here only as the benchmark baseline."""
+    cid_int = int(cluster_id)
+    m = membership_df[membership_df["cluster_alias"] == cid_int]
+    if m.empty:
+        return []
+    merged = m.merge(terms_df, left_on="cluster_annotation_term_label", right_on="label", how="left")
+    merged = merged.head(limit)
+    results = []
+    for row in merged.itertuples():
+        results.append({
+            "cluster_id": cluster_id,
+            "gene": getattr(row, "cluster_annotation_term_label"),
+            "name": getattr(row, "name_x", None) or getattr(row, "name_y", None),
+            "logfc": None,
+            "pval_adj": None,
+            "color": getattr(row, "color_hex_triplet_x", None) or getattr(row, "color_hex_triplet_y", None),
+        })
+    return results
+
+
+def synthetic_tables(n_clusters: int, terms_per_cluster: int = 4):
+    """Membership/term tables shaped like the WMB taxonomy (class/subclass/supertype/cluster per cluster)."""
+    rng = np.random.default_rng(0)
+    n_terms = n_clusters * 2
+    terms = pd.DataFrame({
+        "label": [f"CS_{i:06d}" for i in range(n_terms)],
+        "name": [f"term {i}" for i in range(n_terms)],
+        "color_hex_triplet": ["#%06X" % c for c in rng.integers(0, 0xFFFFFF, n_terms)],
+    })
+    membership = pd.DataFrame({
+        "cluster_alias": np.repeat(np.arange(1, n_clusters + 1), terms_per_cluster),
+        "cluster_annotation_term_label": terms["label"].to_numpy()[rng.integers(0, n_terms, n_clusters * terms_per_cluster)],
+    })
+    return membership, terms
+
+
+def time_calls(fn, cluster_ids, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        for cid in cluster_ids:
+            start = time.perf_counter()
+            fn(cid)
+            samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e6, statistics.mean(samples) * 1e6
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark /scrna/markers lookup strategies.")
+    ap.add_argument("--synthetic", type=int, default=0, help="Generate N synthetic clusters instead of reading RNA_DIR")
+    ap.add_argument("--samples", type=int, default=200, help="Random cluster ids per repeat")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--limit", type=int, default=50)
+    args = ap.parse_args()
+
+    if args.synthetic:
+        membership, terms = synthetic_tables(args.synthetic)
+    else:
+        membership = pd.read_csv(scrna.RNA_DIR / "cluster_to_cluster_annotation_membership.csv")
+        terms = pd.read_csv(scrna.RNA_DIR / "cluster_annotation_term.csv")
+    print(f"membership rows={len(membership):,} terms={len(terms):,}")
+
+    start = time.perf_counter()
+    index = scrna.build_marker_index(membership, terms)
+    print(f"index build (once at load): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    aliases = membership["cluster_alias"].unique().tolist()
+    cluster_ids = [str(random.choice(aliases)) for _ in range(args.samples)]
+    old_p50, old_mean = time_calls(lambda cid: legacy_markers(membership, terms, cid, args.limit), cluster_ids, args.repeat)
+    new_p50, new_mean = time_calls(lambda cid: index.get(int(cid), [])[: args.limit], cluster_ids, args.repeat)
+    print(f"{'path':>8} {'p50 us':>10} {'mean us':>10}")
+    print(f"{'before':>8} {old_p50:>10.1f} {old_mean:>10.1f}")
+    print(f"{'after':>8} {new_p50:>10.1f} {new_mean:>10.1f}")
+    print(f"speedup (p50): {old_p50 / new_p50:.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark OME-Zarr codec / chunk-shape combinations on a sample of our slices.
+Reason: pick ZARR_CODEC / ZARR_CLEVEL / ZARR_SHUFFLE and --chunks from measured write throughput,
+on-disk size and random-tile read latency instead of library defaults.
+
+Usage:
+  python scripts/bench_zarr_codecs.py                                  # samples data/sourcedata/images
+  python scripts/bench_zarr_codecs.py --slices 8 --codecs zstd lz4 none --clevels 1 5 \
+    --shuffles shuffle bitshuffle --chunks 256,256 512,512 1024,1024
+  python scripts/bench_zarr_codecs.py --synthetic 4096                 # synthetic 4096x4096 slices
+"""
+import argparse
+import itertools
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import zarr
+
+# Ensure project root is on path so `code` package is importable when run as a script
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from code.database.ingest_upload import load_image, store_bytes, write_omezarr
+from code.database.zarr_storage import BLOSC_CODECS, CODEC_CHOICES, SHUFFLES, parse_chunks
+
+SOURCE_ROOT = ROOT / "data" / "sourcedata" / "images"
+IMAGE_SUFFIXES = {".png", ".tif", ".tiff", ".jpg", ".jpeg"}
+
+
+def sample_slices(n: int, seed: int) -> list:
+    files = sorted(p for p in SOURCE_ROOT.rglob("*") if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not files:
+        raise SystemExit(f"No slices under {SOURCE_ROOT}; pass --synthetic SIZE instead")
+    random.Random(seed).shuffle(files)
+    return [load_image(p) for p in files[:n]]
+
+
+def synthetic_slices(n: int, size: int, seed: int) -> list:
+    """Smooth tissue-like blobs on a dark background, so compression ratios are not pure-noise worst cases."""
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[0:size, 0:size]
+    out = []
+    for _ in range(n):
+        cy, cx = rng.uniform(0.3, 0.7, 2) * size
+        tissue = np.exp(-(((yy - cy) / (0.3 * size)) ** 2 + ((xx - cx) / (0.25 * size)) ** 2))
+        img = tissue * 180 + rng.normal(0, 6, (size, size))
+        out.append(np.clip(img, 0, 255).astype(np.uint8)[np.newaxis].repeat(3, axis=0))
+    return out
+
+
+def combos(args) -> list:
+    out = []
+    for codec, chunks in itertools.product(args.codecs, args.chunks):
+        if codec in BLOSC_CODECS:
+            for clevel, shuffle in itertools.product(args.clevels, args.shuffles):
+                out.append({"codec": codec, "clevel": clevel, "shuffle": shuffle, "chunks": chunks})
+        else:
+            out.append({"codec": codec, "clevel": None, "shuffle": None, "chunks": chunks})
+    return out
+
+
+def read_latencies(stores: list, tile: int, reads: int, rng: random.Random) -> list:
+    """Random viewer-sized (tile x tile) windows from full-resolution levels; each read opens the array cold."""
+    samples = []
+    for _ in range(reads):
+        path = rng.choice(stores)
+        start = time.perf_counter()
+        root = zarr.open_group(path, mode="r")
+        level = root[root.attrs.get("ome", root.attrs)["multiscales"][0]["datasets"][0]["path"]]
+        _, h, w = level.shape
+        y = rng.randrange(0, max(1, h - tile))
+        x = rng.randrange(0, max(1, w - tile))
+        level[:, y : y + tile, x : x + tile]
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def run_combo(slices: list, storage: dict, workdir: Path, args, rng: random.Random) -> dict:
+    raw = sum(s.nbytes for s in slices)
+    stores = [workdir / f"slice{i}.ome.zarr" for i in range(len(slices))]
+    start = time.perf_counter()
+    for img, dest in zip(slices, stores):
+        write_omezarr(img, dest, 1.0, pyramid_levels=0, storage=storage)
+    elapsed = time.perf_counter() - start
+    on_disk = sum(store_bytes(p) for p in stores)
+    lat = sorted(read_latencies(stores, args.tile, args.reads, rng))
+    for p in stores:
+        shutil.rmtree(p)
+    return {
+        "write_mb_s": raw / elapsed / 1e6,
+        "size_mb": on_disk / 1e6,
+        "ratio": raw / on_disk,
+        "read_p50_ms": statistics.median(lat) * 1e3,
+        "read_p95_ms": lat[int(0.95 * (len(lat) - 1))] * 1e3,
+    }
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark OME-Zarr codec and chunk-shape settings.")
+    ap.add_argument("--slices", type=int, default=6, help="Slices sampled from data/sourcedata/images")
+    ap.add_argument("--synthetic", type=int, default=0, help="Use synthetic SIZE x SIZE RGB slices instead")
+    ap.add_argument("--codecs", nargs="+", default=["zstd", "lz4", "default", "none"], choices=CODEC_CHOICES)
+    ap.add_argument("--clevels", nargs="+", type=int, default=[1, 5])
+    ap.add_argument("--shuffles", nargs="+", default=["shuffle", "bitshuffle"], choices=SHUFFLES)
+    ap.add_argument("--chunks", nargs="+", type=parse_chunks, default=[(256, 256), (512, 512), (1024, 1024)])
+    ap.add_argument("--tile", type=int, default=256, help="Edge of the random read window (viewer tile)")
+    ap.add_argument("--reads", type=int, default=200, help="Random tile reads per combination")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    if args.synthetic:
+        slices = synthetic_slices(args.slices, args.synthetic, args.seed)
+    else:
+        slices = sample_slices(args.slices, args.seed)
+    raw_mb = sum(s.nbytes for s in slices) / 1e6
+    print(f"{len(slices)} slices, {raw_mb:.1f} MB raw; shapes {sorted({s.shape for s in slices})[:3]}")
+
+    header = f"{'codec':>8} {'clevel':>6} {'shuffle':>10} {'chunks':>11} {'write MB/s':>10} {'size MB':>9} " \
+             f"{'ratio':>6} {'read p50 ms':>11} {'read p95 ms':>11}"
+    print(header)
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="bench_zarr_") as tmp:
+        for storage in combos(args):
+            r = run_combo(slices, storage, Path(tmp), args, rng)
+            chunks = "x".join(map(str, storage["chunks"]))
+            print(
+                f"{storage['codec']:>8} {storage['clevel'] if storage['clevel'] is not None else '-':>6} "
+                f"{storage['shuffle'] or '-':>10} {chunks:>11} {r['write_mb_s']:>10.1f} {r['size_mb']:>9.2f} "
+                f"{r['ratio']:>6.2f} {r['read_p50_ms']:>11.2f} {r['read_p95_ms']:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
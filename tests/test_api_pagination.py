@@ -0,0 +1,209 @@
+import io
+import json
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from code.api.deps import decode_cursor, encode_cursor, get_db, response_cache
+from code.api import streaming
+from code.api.main import app
+from code.database.etl.atlas import rebuild_region_closure
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    db_path = tmp_path / "api.db"
+    engine = create_engine(f"sqlite:///{db_path}")
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE data_generation (id INT PRIMARY KEY, generation INT)"))
+        conn.execute(text("CREATE TABLE brain_regions (region_id INT PRIMARY KEY, name TEXT, acronym TEXT, parent_id INT, st_level INT, atlas_id INT, ontology_id INT)"))
+        conn.execute(text("""
+            CREATE TABLE region_counts (
+                subject_id TEXT, region_id INT, file_id INT, region_pixels BIGINT, region_area_mm FLOAT,
+                object_count INT, object_pixels BIGINT, object_area_mm FLOAT, load FLOAT, norm_load FLOAT, hemisphere TEXT
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE region_summary (
+                experiment_type TEXT, hemisphere TEXT, subject_id TEXT, region_id INT, region_name TEXT,
+                records INT, region_pixels_sum BIGINT, load_sum FLOAT, object_count_sum BIGINT, object_count_n INT
+            )
+        """))
+        conn.execute(text("""
+            INSERT INTO region_summary VALUES
+            ('rabies','left',NULL,2,'B',2,20,1.0,4,2),
+            ('rabies','left',NULL,3,'C',2,10,0.5,2,2),
+            ('rabies','right',NULL,3,'C',1,5,0.25,1,1)
+        """))
+        conn.execute(text("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, subject_id TEXT)"))
+        conn.execute(text("""
+            CREATE TABLE microscopy_files (
+                file_id INTEGER PRIMARY KEY, session_id TEXT, run INT, hemisphere TEXT, path TEXT, sha256 TEXT, created_at TEXT
+            )
+        """))
+        conn.execute(text("INSERT INTO brain_regions (region_id, name, parent_id, st_level) VALUES (1,'A',NULL,1), (2,'B',1,2), (3,'C',2,3)"))
+        conn.execute(text("CREATE TABLE brain_region_closure (ancestor_id INT, descendant_id INT, depth INT, PRIMARY KEY (ancestor_id, descendant_id))"))
+        rebuild_region_closure(conn)
+        for sid in ("sub-a", "sub-b"):
+            for rid in (1, 2, 3):
+                for hemi in ("left", "right"):
+                    conn.execute(
+                        text("INSERT INTO region_counts (subject_id, region_id, region_pixels, load, hemisphere) VALUES (:s, :r, 1, 1.0, :h)"),
+                        {"s": sid, "r": rid, "h": hemi},
+                    )
+        conn.execute(text("INSERT INTO sessions VALUES ('ses-1','sub-a')"))
+        conn.execute(text("""
+            INSERT INTO microscopy_files (file_id, session_id, run, path) VALUES
+            (1,'ses-1',NULL,'p1'), (2,'ses-1',2,'p2'), (3,'ses-1',1,'p3')
+        """))
+
+    async def override():
+        async with async_engine.connect() as conn:
+            yield conn
+
+    @contextmanager
+    def stream_connect():
+        with engine.connect() as conn:
+            yield conn
+
+    app.dependency_overrides[get_db] = override
+    monkeypatch.setattr(streaming, "connect", stream_connect)
+    monkeypatch.setattr(streaming, "STREAM_BATCH_ROWS", 5)
+    response_cache._generation = None
+    test_client = TestClient(app)
+    test_client.engine = engine
+    yield test_client
+    app.dependency_overrides.clear()
+
+
+def walk(client, url, limit):
+    rows, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": limit}
+        if cursor:
+            params["cursor"] = cursor
+        res = client.get(url, params=params)
+        assert res.status_code == 200
+        rows.extend(res.json())
+        pages += 1
+        cursor = res.headers.get("X-Next-Cursor")
+        if not cursor:
+            return rows, pages
+
+
+def test_cursor_roundtrip():
+    assert decode_cursor(encode_cursor(["sub-a", 5, "left"]), (str, int, str)) == ["sub-a", 5, "left"]
+
+
+def test_counts_keyset_walks_all_rows(client):
+    rows, pages = walk(client, "/fluor/counts", limit=4)
+    keys = [(r["subject_id"], r["region_id"], r["hemisphere"]) for r in rows]
+    assert len(keys) == 12 and len(set(keys)) == 12
+    assert keys == sorted(keys)
+    assert pages == 3
+
+
+def test_files_keyset_orders_null_runs_last(client):
+    rows, _ = walk(client, "/files", limit=1)
+    assert [r["run"] for r in rows] == [1, 2, None]
+
+
+def test_bad_cursor_rejected(client):
+    assert client.get("/fluor/counts", params={"cursor": "not-a-cursor"}).status_code == 400
+    # Right shape, wrong key types: rejected before it reaches the query
+    for url, values in (("/fluor/counts", ["a", "b", "c"]), ("/files", ["ses-1", 1, "x"]), ("/files", ["ses-1", True, 1])):
+        assert client.get(url, params={"cursor": encode_cursor(values)}).status_code == 400
+
+
+def test_counts_ndjson_streams_all_rows(client):
+    res = client.get("/fluor/counts", params={"limit": 2}, headers={"Accept": streaming.NDJSON})
+    assert res.headers["content-type"].startswith(streaming.NDJSON)
+    rows = [json.loads(line) for line in res.text.splitlines()]
+    assert len(rows) == 12
+    assert rows[0]["region_name"] == "A"
+
+
+def test_files_arrow_stream(client):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+
+    res = client.get("/files", headers={"Accept": streaming.ARROW_STREAM})
+    table = pa.ipc.open_stream(io.BytesIO(res.content)).read_all()
+    assert table.num_rows == 3
+    assert table.column("run").to_pylist() == [1, 2, None]
+
+
+def test_regions_tree_conditional_get(client):
+    first = client.get("/regions/tree")
+    etag = first.headers["ETag"]
+    assert first.status_code == 200 and "must-revalidate" in first.headers["Cache-Control"]
+    again = client.get("/regions/tree", headers={"If-None-Match": etag})
+    assert again.status_code == 304 and again.content == b""
+    # A data write moves the generation and invalidates the tag
+    with client.engine.begin() as conn:
+        conn.execute(text("INSERT INTO data_generation (id, generation) VALUES (1, 5)"))
+    assert client.get("/regions/tree", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_rollup_aggregates_whole_subtree(client):
+    res = client.get("/fluor/rollup", params={"st_level": 1, "hemisphere": "left"})
+    assert res.status_code == 200
+    (row,) = res.json()
+    assert row["region_id"] == 1
+    assert row["regions_with_data"] == 2
+    assert row["region_pixels_sum"] == 30 and row["load_sum"] == 1.5
+
+    rows = client.get("/fluor/rollup", params=[("ancestor_id", 2), ("ancestor_id", 3)]).json()
+    by_key = {(r["region_id"], r["hemisphere"]): r["records"] for r in rows}
+    assert by_key == {(2, "left"): 4, (2, "right"): 1, (3, "left"): 2, (3, "right"): 1}
+    assert client.get("/fluor/rollup").status_code == 400
+
+
+def test_region_lineage_from_closure(client):
+    desc = client.get("/regions/1/descendants").json()
+    assert [(r["region_id"], r["depth"]) for r in desc] == [(2, 1), (3, 2)]
+    assert [r["region_id"] for r in client.get("/regions/1/descendants", params={"max_depth": 1}).json()] == [2]
+    anc = client.get("/regions/3/ancestors").json()
+    assert [r["region_id"] for r in anc] == [1, 2]
+    assert client.get("/regions/99/ancestors").status_code == 404
+
+
+def test_counts_under_subtree(client):
+    rows = client.get("/fluor/counts", params={"under": 2, "limit": 100}).json()
+    assert {r["region_id"] for r in rows} == {2, 3}
+    summary = client.get("/fluor/summary", params={"under": 3}).json()
+    assert {r["region_id"] for r in summary} == {3}
+
+
+def test_warmup_pins_reference_lists_and_reports_readiness(client, monkeypatch, tmp_path):
+    import asyncio
+    from contextlib import asynccontextmanager
+    from code.api import scrna, warmup
+
+    with client.engine.begin() as conn:
+        conn.execute(text("CREATE TABLE subjects (subject_id TEXT, sex TEXT, experiment_type TEXT, details TEXT)"))
+        conn.execute(text("INSERT INTO subjects (subject_id) VALUES ('sub-a')"))
+
+    @asynccontextmanager
+    async def warm_connect():
+        async for conn in app.dependency_overrides[get_db]():
+            yield conn
+
+    monkeypatch.setattr(warmup, "connect_async", warm_connect)
+    monkeypatch.setattr(warmup, "_state", {"enabled": True, "started_at": None, "finished_at": None, "steps": {}})
+    monkeypatch.setattr(scrna, "RNA_DIR", tmp_path / "missing")
+    assert client.get("/status/ready").status_code == 503
+
+    asyncio.run(warmup.run_warmup())
+    res = client.get("/status/ready")
+    assert res.status_code == 200
+    steps = res.json()["steps"]
+    assert steps["reference_lists"]["status"] == "ok"
+    # A failing step is reported, not fatal; the lazy path still handles it later
+    assert steps["scrna_tables"]["status"] == "error"
+    assert response_cache.stats()["pinned"] == 2
+    assert [r["subject_id"] for r in client.get("/subjects").json()] == ["sub-a"]
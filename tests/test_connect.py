@@ -0,0 +1,47 @@
+import pytest
+
+from code.database import connect
+
+
+@pytest.fixture
+def fresh_engine(monkeypatch):
+    monkeypatch.setattr(connect, "_engine", None)
+    yield
+    connect.dispose_engine()
+
+
+def test_pool_settings_from_env(monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "12")
+    monkeypatch.setenv("DB_MAX_OVERFLOW", "3")
+    monkeypatch.setenv("DB_POOL_PRE_PING", "false")
+    settings = connect.pool_settings()
+    assert settings["pool_size"] == 12
+    assert settings["max_overflow"] == 3
+    assert settings["pool_pre_ping"] is False
+
+
+def test_engine_is_shared(fresh_engine, monkeypatch):
+    monkeypatch.setenv("DB_POOL_SIZE", "7")
+    e1 = connect.get_engine()
+    e2 = connect.get_engine()
+    assert e1 is e2
+    assert connect.pool_stats()["pool_size"] == 7
+
+
+def test_connect_counts_only_blocked_checkouts_as_waits(fresh_engine, monkeypatch):
+    monkeypatch.setattr(connect, "DB_URL", "sqlite:///:memory:")
+    monkeypatch.setattr(connect, "POOL_WAIT_THRESHOLD_S", 60.0)
+    before = connect.pool_stats()
+    with connect.connect() as conn:
+        assert conn.exec_driver_sql("SELECT 1").scalar() == 1
+    stats = connect.pool_stats()
+    assert stats["waits"] == before["waits"]
+    assert stats["checkouts"] >= 1
+    assert stats["checkout_total_s"] > before["checkout_total_s"]
+
+    monkeypatch.setattr(connect, "POOL_WAIT_THRESHOLD_S", 0.0)
+    with connect.connect():
+        pass
+    stats = connect.pool_stats()
+    assert stats["waits"] == before["waits"] + 1
+    assert stats["wait_max_s"] >= 0.0
@@ -0,0 +1,61 @@
+from sqlalchemy import create_engine, text
+
+from code.database.etl.summary import refresh_region_summary
+
+
+def make_engine():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE subjects (subject_id TEXT PRIMARY KEY, experiment_type TEXT)"))
+        conn.execute(text("CREATE TABLE brain_regions (region_id INT PRIMARY KEY, name TEXT)"))
+        conn.execute(text("""
+            CREATE TABLE region_counts (
+                subject_id TEXT, region_id INT, region_pixels BIGINT, load FLOAT, object_count INT, hemisphere TEXT
+            )
+        """))
+        conn.execute(text("""
+            CREATE TABLE region_summary (
+                experiment_type TEXT, hemisphere TEXT, subject_id TEXT, region_id INT, region_name TEXT,
+                records INT, region_pixels_sum BIGINT, load_sum FLOAT, object_count_sum BIGINT, object_count_n INT
+            )
+        """))
+        conn.execute(text("INSERT INTO subjects VALUES ('sub-dbl01','double_injection'), ('sub-dbl02','double_injection'), ('sub-rab01','rabies')"))
+        conn.execute(text("INSERT INTO brain_regions VALUES (1,'A'), (2,'B')"))
+        conn.execute(text("""
+            INSERT INTO region_counts VALUES
+            ('sub-dbl01',1,10,0.5,2,'left'),
+            ('sub-dbl02',1,30,1.5,NULL,'left'),
+            ('sub-rab01',2,5,0.1,1,'right')
+        """))
+    return engine
+
+
+def rollup(conn, exp):
+    return conn.execute(text(
+        "SELECT records, region_pixels_sum, load_sum, object_count_sum, object_count_n FROM region_summary "
+        "WHERE subject_id IS NULL AND experiment_type = :e AND region_id = 1"
+    ), {"e": exp}).first()
+
+
+def test_full_refresh_builds_subject_and_rollup_rows():
+    engine = make_engine()
+    with engine.begin() as conn:
+        refresh_region_summary(conn)
+        per_subject = conn.execute(text("SELECT COUNT(*) FROM region_summary WHERE subject_id IS NOT NULL")).scalar()
+        assert per_subject == 3
+        assert tuple(rollup(conn, "double_injection")) == (2, 40, 2.0, 2, 1)
+
+
+def test_incremental_refresh_updates_rollup_and_drops_deleted_subjects():
+    engine = make_engine()
+    with engine.begin() as conn:
+        refresh_region_summary(conn)
+        conn.execute(text("INSERT INTO subjects VALUES ('sub-dbl03','double_injection')"))
+        conn.execute(text("INSERT INTO region_counts VALUES ('sub-dbl03',1,60,3.0,4,'left')"))
+        conn.execute(text("DELETE FROM region_counts WHERE subject_id = 'sub-dbl02'"))
+        conn.execute(text("DELETE FROM subjects WHERE subject_id = 'sub-dbl02'"))
+        refresh_region_summary(conn, {"sub-dbl03"})
+        assert tuple(rollup(conn, "double_injection")) == (2, 70, 3.5, 6, 2)
+        # Untouched experiment types keep their rollup
+        rab = conn.execute(text("SELECT records FROM region_summary WHERE subject_id IS NULL AND experiment_type = 'rabies'")).scalar()
+        assert rab == 1
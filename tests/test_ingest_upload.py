@@ -0,0 +1,172 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, text
+
+from code.database import ingest_upload
+
+
+@pytest.fixture
+def ingest_env(tmp_path, monkeypatch):
+    iio = pytest.importorskip("imageio.v3")
+    engine = create_engine(f"sqlite:///{tmp_path / 'ingest.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE subjects (subject_id TEXT PRIMARY KEY, original_id TEXT, sex TEXT, experiment_type TEXT, details TEXT)"))
+        conn.execute(text("CREATE TABLE sessions (session_id TEXT PRIMARY KEY, subject_id TEXT, modality TEXT)"))
+        conn.execute(text("""
+            CREATE TABLE microscopy_files (
+                file_id INTEGER PRIMARY KEY, session_id TEXT, run INT, hemisphere TEXT, path TEXT, sha256 TEXT, source_sha256 TEXT,
+                UNIQUE (session_id, run, hemisphere)
+            )
+        """))
+        conn.execute(text("CREATE TABLE data_generation (id INT PRIMARY KEY, generation INT, updated_at TEXT)"))
+    monkeypatch.setattr(ingest_upload, "get_engine", lambda: engine)
+    monkeypatch.setattr(ingest_upload, "BIDS_ROOT", tmp_path / "bids")
+    rng = np.random.default_rng(0)
+    files = []
+    for i in range(3):
+        path = tmp_path / f"slice{i}.png"
+        iio.imwrite(path, rng.integers(0, 255, size=(40, 30), dtype=np.uint8))
+        files.append(path)
+    return engine, files
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ingest_converts_in_parallel_and_registers_in_one_batch(ingest_env, workers):
+    engine, files = ingest_env
+    events = []
+    out = ingest_upload.ingest("sub-a", "ses-1", "left", files, 0.5, "rabies", progress=events.append, workers=workers)
+    assert [p.name for p in out] == [f"sub-a_ses-1_run-{i:02d}_micr.ome.zarr" for i in (1, 2, 3)]
+    assert all(p.is_dir() for p in out)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT run, path, sha256 FROM microscopy_files ORDER BY run")).all()
+        assert conn.execute(text("SELECT generation FROM data_generation")).scalar() == 1
+    assert [r.run for r in rows] == [1, 2, 3] and len({r.sha256 for r in rows}) == 3
+    done = [e for e in events if e["status"] == "done"]
+    assert sorted(e["index"] for e in done) == [1, 2, 3] and all(e["bytes_written"] > 0 for e in done)
+    for idx in (1, 2, 3):
+        states = [e["status"] for e in events if e["index"] == idx]
+        # with a pool, files queue for a worker before running
+        assert states == (["queued", "running", "done"] if workers > 1 else ["running", "done"])
+
+
+def test_duplicate_source_rejected_before_conversion(ingest_env, monkeypatch):
+    engine, files = ingest_env
+    ingest_upload.ingest("sub-a", "ses-1", "left", files[:1], workers=1)
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT source_sha256 FROM microscopy_files")).scalar() == (
+            ingest_upload.file_sha256(files[0])
+        )
+
+    def no_conversion(*args, **kwargs):
+        raise AssertionError("duplicate source must be rejected before conversion")
+
+    monkeypatch.setattr(ingest_upload, "_convert_all", no_conversion)
+    with pytest.raises(ValueError, match="Duplicate microscopy source"):
+        ingest_upload.ingest("sub-a", "ses-2", "left", files[:2], workers=1)
+    # a hash supplied by the upload stream is trusted without re-reading the file
+    with pytest.raises(ValueError, match="Duplicate microscopy source.*slice2"):
+        ingest_upload.ingest("sub-a", "ses-2", "left", files[1:], workers=1, source_hashes={"slice2.png": "same", "slice1.png": "same"})
+    assert not (ingest_upload.BIDS_ROOT / "sub-a" / "ses-2").exists()
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM microscopy_files")).scalar() == 1
+
+
+def test_duplicate_converted_content_rejected_and_outputs_removed(ingest_env):
+    engine, files = ingest_env
+    ingest_upload.ingest("sub-a", "ses-1", "left", files[:1], workers=1)
+    with engine.begin() as conn:
+        # stores registered by the BIDS scan carry no source hash; the output hash still dedupes them
+        conn.execute(text("UPDATE microscopy_files SET source_sha256 = NULL"))
+    with pytest.raises(ValueError, match="Duplicate microscopy content"):
+        ingest_upload.ingest("sub-a", "ses-2", "left", files[:2], workers=1)
+    assert not list((ingest_upload.BIDS_ROOT / "sub-a" / "ses-2").rglob("*.ome.zarr*"))
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT count(*) FROM microscopy_files")).scalar() == 1
+
+
+def test_discard_unregistered_outputs_keeps_registered_stores(ingest_env):
+    engine, files = ingest_env
+    (registered,) = ingest_upload.ingest("sub-a", "ses-1", "left", files[:1], workers=1)
+    partial = ingest_upload._output_path("sub-a", "ses-1", 2)
+    partial.mkdir(parents=True)
+    partial.with_suffix(partial.suffix + ".json").write_text("{}")
+    assert ingest_upload.discard_unregistered_outputs("sub-a", "ses-1", 3) == [partial]
+    assert registered.is_dir() and not partial.exists()
+    assert not partial.with_suffix(partial.suffix + ".json").exists()
+
+
+
+@pytest.mark.parametrize("layout", ["tiled", "contiguous", "strips"])
+def test_tiff_read_lazily_and_written_tile_wise(tmp_path, layout):
+    tifffile = pytest.importorskip("tifffile")
+    rgba = np.random.default_rng(1).integers(0, 255, size=(1100, 700, 4), dtype=np.uint8)
+    src = tmp_path / "slide.tif"
+    kwargs = {
+        "tiled": {"tile": (256, 256), "compression": "zlib"},
+        "contiguous": {},
+        "strips": {"rowsperstrip": 64, "compression": "zlib"},
+    }[layout]
+    tifffile.imwrite(src, rgba, photometric="rgb", extrasamples=["unassalpha"], **kwargs)
+
+    with ingest_upload.open_image(src) as data:
+        assert isinstance(data, ingest_upload.da.Array)
+        assert data.shape == (3, 1100, 700)
+        # no chunk spans the whole slide
+        assert max(data.chunks[1]) < 1100
+        ingest_upload.write_omezarr(data, tmp_path / "out.ome.zarr", 1.0)
+
+    root = ingest_upload.zarr.open_group(tmp_path / "out.ome.zarr", mode="r")
+    multiscales = root.attrs.get("ome", root.attrs)["multiscales"]
+    written = root[multiscales[0]["datasets"][0]["path"]]
+    assert written.chunks == (3, ingest_upload.TILE_PX, ingest_upload.TILE_PX)
+    np.testing.assert_array_equal(written[...], np.moveaxis(rgba[..., :3], -1, 0))
+
+
+def test_pyramid_levels_are_2x_means_with_metadata(tmp_path):
+    img = np.arange(3 * 1500 * 1100, dtype=np.uint16).reshape(3, 1500, 1100) % 1000
+    ingest_upload.write_omezarr(img, tmp_path / "p.ome.zarr", 0.5, pyramid_levels=4)
+
+    root = ingest_upload.zarr.open_group(tmp_path / "p.ome.zarr", mode="r")
+    datasets = root.attrs.get("ome", root.attrs)["multiscales"][0]["datasets"]
+    # 1500x1100 -> 750x550 -> 375x275 fits one tile, so the pyramid stops early
+    levels = [root[d["path"]] for d in datasets]
+    assert [lvl.shape for lvl in levels] == [(3, 1500, 1100), (3, 750, 550), (3, 375, 275)]
+    assert all(lvl.dtype == np.uint16 for lvl in levels)
+    expected = np.round(img.reshape(3, 750, 2, 550, 2).mean(axis=(2, 4))).astype(np.uint16)
+    np.testing.assert_array_equal(levels[1][...], expected)
+
+    scales = [d["coordinateTransformations"][0]["scale"] for d in datasets]
+    assert scales == [[1.0, 0.5e-6 * f, 0.5e-6 * f] for f in (1, 2, 4)]
+    assert datasets[1]["coordinateTransformations"][1]["translation"][1] == pytest.approx(0.25e-6)
+
+
+def test_pyramid_can_be_disabled(tmp_path):
+    ingest_upload.write_omezarr(np.zeros((1, 2000, 2000), dtype=np.uint8), tmp_path / "flat.ome.zarr", 1.0, 0)
+    root = ingest_upload.zarr.open_group(tmp_path / "flat.ome.zarr", mode="r")
+    assert len(root.attrs.get("ome", root.attrs)["multiscales"][0]["datasets"]) == 1
+
+
+def test_storage_codec_and_chunks_configurable(tmp_path):
+    img = np.random.default_rng(2).integers(0, 50, size=(2, 900, 700), dtype=np.uint8)
+    storage = {"codec": "lz4", "clevel": 3, "shuffle": "bitshuffle", "chunks": (256, 128)}
+    ingest_upload.write_omezarr(img, tmp_path / "c.ome.zarr", 1.0, pyramid_levels=1, storage=storage)
+
+    root = ingest_upload.zarr.open_group(tmp_path / "c.ome.zarr", mode="r")
+    levels = [root[d["path"]] for d in root.attrs.get("ome", root.attrs)["multiscales"][0]["datasets"]]
+    for arr in levels:
+        assert arr.chunks == (2, 256, 128)
+        (blosc,) = arr.compressors
+        assert (blosc.cname.value, blosc.clevel, blosc.shuffle.value) == ("lz4", 3, "bitshuffle")
+    np.testing.assert_array_equal(levels[0][...], img)
+
+
+def test_storage_options_validation():
+    from code.database import zarr_storage
+
+    assert zarr_storage.chunk_shape((3, 100, 5000), (128, 1024), (3, 512, 512)) == (3, 100, 1024)
+    assert zarr_storage.storage_options((1, 10, 10), (1, 4, 4), codec="none") == {"chunks": (1, 4, 4), "compressor": None}
+    assert "compressor" not in zarr_storage.storage_options((1, 10, 10), (1, 4, 4), codec="default")
+    with pytest.raises(ValueError, match="Unknown codec"):
+        zarr_storage.compressor("snappy")
+    with pytest.raises(ValueError):
+        zarr_storage.parse_chunks("512,0")
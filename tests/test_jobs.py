@@ -0,0 +1,205 @@
+import os
+import socket
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from code.api import jobs
+from code.database import jobs as job_store
+
+JOBS_DDL = """
+CREATE TABLE ingest_jobs (
+    job_id INTEGER PRIMARY KEY AUTOINCREMENT, kind TEXT, status TEXT DEFAULT 'queued', params TEXT,
+    files_total INT DEFAULT 0, files_done INT DEFAULT 0, bytes_written INT DEFAULT 0, progress TEXT, result TEXT,
+    error TEXT, worker_host TEXT, worker_pid INT, attempts INT DEFAULT 0, created_at TEXT, started_at TEXT, finished_at TEXT, updated_at TEXT
+)
+"""
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+    with engine.begin() as conn:
+        conn.execute(text(JOBS_DDL))
+    monkeypatch.setattr(jobs, "get_engine", lambda: engine)
+    return engine
+
+
+def _params(staging: Path) -> dict:
+    return {
+        "subject_id": "sub-a", "session_id": "ses-1", "hemisphere": "left",
+        "pixel_size_um": 0.5, "experiment_type": "rabies", "staging_dir": str(staging),
+        "source_sha256": {"a.tif": "aa", "b.tif": "bb"},
+    }
+
+
+def test_claim_is_exclusive_and_stale_jobs_are_requeued(engine, tmp_path):
+    with engine.begin() as conn:
+        job_id = job_store.create_job(conn, "microscopy", _params(tmp_path), ["a.tif", "b.tif"])
+        assert job_store.claim_job(conn, job_id)["status"] == "running"
+        assert job_store.claim_job(conn, job_id) is None
+        # Fresh heartbeat: still owned by its worker
+        assert job_store.requeue_stale(conn, 300, max_attempts=3) == ([], [])
+        conn.execute(text("UPDATE ingest_jobs SET updated_at = datetime('now', '-10 minutes')"))
+        assert job_store.heartbeat(conn, job_id)
+        assert job_store.requeue_stale(conn, 300, max_attempts=3) == ([], [])
+        conn.execute(text("UPDATE ingest_jobs SET updated_at = datetime('now', '-10 minutes')"))
+        assert job_store.requeue_stale(conn, 300, max_attempts=3) == ([job_id], [])
+        assert job_store.queued_job_ids(conn) == [job_id]
+        assert not job_store.heartbeat(conn, job_id)
+        job = job_store.get_job(conn, job_id)
+    assert job["files_total"] == 2 and job["worker_host"] == socket.gethostname() and job["attempts"] == 1
+    assert [p["status"] for p in job["progress"]] == ["queued", "queued"]
+
+
+def test_run_job_records_per_file_progress(engine, tmp_path, monkeypatch):
+    staging = tmp_path / "staging"
+    staging.mkdir()
+
+    def fake_ingest(subject, session, hemisphere, files, pixel_size_um, experiment_type, progress, source_hashes, workers):
+        assert (subject, session, pixel_size_um) == ("sub-a", "ses-1", 0.5)
+        assert workers == jobs.JOB_INGEST_WORKERS >= 1
+        assert source_hashes == {"a.tif": "aa", "b.tif": "bb"}
+        for idx, src in enumerate(files, start=1):
+            progress({"index": idx, "name": src.name, "status": "running", "bytes_written": 0})
+            progress({"index": idx, "name": src.name, "status": "done", "bytes_written": 10 * idx, "path": f"out{idx}"})
+        return [Path("out1"), Path("out2")]
+
+    monkeypatch.setattr(jobs, "ingest", fake_ingest)
+    with engine.begin() as conn:
+        job_id = job_store.create_job(conn, "microscopy", _params(staging), ["a.tif", "b.tif"])
+    jobs.run_job(job_id)
+
+    with engine.connect() as conn:
+        job = job_store.get_job(conn, job_id)
+    assert job["status"] == "succeeded" and job["worker_pid"] == os.getpid()
+    assert (job["files_done"], job["bytes_written"]) == (2, 30)
+    assert job["result"] == {"ingested": ["out1", "out2"]}
+    assert not staging.exists()
+    # A finished job is never claimed again
+    jobs.run_job(job_id)
+
+
+def test_run_job_failure_is_recorded(engine, tmp_path, monkeypatch):
+    def failing_ingest(progress, files, **kwargs):
+        progress({"index": 1, "name": files[0].name, "status": "failed", "error": "bad tiff"})
+        raise ValueError("bad tiff")
+
+    monkeypatch.setattr(jobs, "ingest", failing_ingest)
+    with engine.begin() as conn:
+        job_id = job_store.create_job(conn, "microscopy", _params(tmp_path / "s"), ["a.tif"])
+    jobs.run_job(job_id)
+    with engine.connect() as conn:
+        job = job_store.get_job(conn, job_id)
+    assert job["status"] == "failed" and job["error"] == "bad tiff"
+    assert job["progress"][0]["error"] == "bad tiff"
+
+
+class _FakeProcess:
+    def __init__(self):
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+
+class _FakePool:
+    def __init__(self, broken: bool, pids=()):
+        self.broken, self.submitted, self.was_shut_down = broken, [], False
+        self._processes = {pid: _FakeProcess() for pid in pids}
+
+    def submit(self, fn, *args):
+        if self.broken:
+            raise BrokenProcessPool("worker died")
+        self.submitted.append(args)
+        return Future()
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        self.was_shut_down = True
+        self._processes = None
+
+
+def _broken_future() -> Future:
+    future = Future()
+    future.set_exception(BrokenProcessPool("worker died"))
+    return future
+
+
+def test_submit_rebuilds_broken_pool(monkeypatch):
+    pools = [_FakePool(broken=True), _FakePool(broken=False)]
+    monkeypatch.setattr(jobs, "_pool", None)
+    monkeypatch.setattr(jobs, "ProcessPoolExecutor", lambda **kwargs: pools.pop(0))
+    jobs.submit(7)
+    assert jobs._pool.submitted == [(7,)]
+    assert not pools
+
+
+def test_broken_pool_requeues_every_job_and_resubmits(engine, tmp_path, monkeypatch):
+    with engine.begin() as conn:
+        running = job_store.create_job(conn, "microscopy", _params(tmp_path), ["a.tif"])
+        waiting = job_store.create_job(conn, "microscopy", _params(tmp_path), ["b.tif"])
+        job_store.claim_job(conn, running)
+    resubmitted = []
+    monkeypatch.setattr(jobs, "submit", resubmitted.append)
+    broken = _FakePool(broken=True)
+    for job_id in (running, waiting):
+        jobs._on_job_done(job_id, broken, _broken_future())
+
+    with engine.connect() as conn:
+        # A job running on a worker that was collateral of the break is requeued, not failed
+        assert job_store.get_job(conn, running)["status"] == "queued"
+        assert job_store.get_job(conn, waiting)["status"] == "queued"
+    assert resubmitted == [running, waiting] and broken.was_shut_down
+
+
+def test_job_out_of_attempts_fails_and_discards_files(engine, tmp_path, monkeypatch):
+    staging = tmp_path / "staging"
+    staging.mkdir()
+    with engine.begin() as conn:
+        job_id = job_store.create_job(conn, "microscopy", _params(staging), ["a.tif", "b.tif"])
+        job_store.claim_job(conn, job_id)
+        conn.execute(text("UPDATE ingest_jobs SET attempts = :n"), {"n": jobs.JOB_MAX_ATTEMPTS})
+    discarded, resubmitted = [], []
+    monkeypatch.setattr(jobs, "discard_unregistered_outputs", lambda *args: discarded.append(args))
+    monkeypatch.setattr(jobs, "submit", resubmitted.append)
+    jobs._on_job_done(job_id, _FakePool(broken=True), _broken_future())
+
+    with engine.connect() as conn:
+        job = job_store.get_job(conn, job_id)
+    assert job["status"] == "failed" and job["error"] == "Worker process died during conversion"
+    assert not staging.exists() and discarded == [("sub-a", "ses-1", 2)]
+    assert resubmitted == []
+
+
+def test_shutdown_terminates_workers_and_requeues_their_jobs(engine, tmp_path, monkeypatch):
+    with engine.begin() as conn:
+        job_id = job_store.create_job(conn, "microscopy", _params(tmp_path), ["a.tif"])
+        job_store.claim_job(conn, job_id)
+        conn.execute(text("UPDATE ingest_jobs SET worker_pid = 4242"))
+    pool = _FakePool(broken=False, pids=[4242])
+    workers = dict(pool._processes)
+    monkeypatch.setattr(jobs, "_pool", pool)
+    monkeypatch.setattr(jobs, "_shutting_down", False)
+    jobs.shutdown()
+
+    assert workers[4242].terminated and pool.was_shut_down
+    with engine.connect() as conn:
+        job = job_store.get_job(conn, job_id)
+    assert job["status"] == "queued" and job["attempts"] == 0
+    # Futures broken by the termination do not resubmit into a new pool
+    jobs._on_job_done(job_id, pool, _broken_future())
+    assert jobs._pool is None
+
+
+def test_sweep_resubmits_stale_jobs(engine, tmp_path, monkeypatch):
+    with engine.begin() as conn:
+        job_id = job_store.create_job(conn, "microscopy", _params(tmp_path), ["a.tif"])
+        job_store.claim_job(conn, job_id)
+        conn.execute(text("UPDATE ingest_jobs SET updated_at = datetime('now', '-1 hour')"))
+    submitted = []
+    monkeypatch.setattr(jobs, "submit", submitted.append)
+    assert jobs.sweep_stale_jobs() == [job_id] and submitted == [job_id]
+    assert jobs.sweep_stale_jobs() == []
@@ -0,0 +1,66 @@
+from sqlalchemy import create_engine, text
+
+from code.api.cache import ResponseCache, cache_key
+from code.database.generation import bump_generation, current_generation
+
+
+def test_cache_key_normalizes_params():
+    k1 = cache_key("fluor_summary", hemi="left", sid=None, lim=500)
+    k2 = cache_key("fluor_summary", lim=500, hemi="left ")
+    assert k1 == k2
+    assert k1 != cache_key("fluor_counts", hemi="left", lim=500)
+
+
+def test_cache_hit_and_generation_invalidation():
+    cache = ResponseCache(max_bytes=10_000)
+    key = cache_key("fluor_summary", lim=10)
+    cache.put(key, [{"a": 1}], generation=1)
+    assert cache.get(key, generation=1) == [{"a": 1}]
+    # A newer generation flushes stale entries
+    assert cache.get(key, generation=2) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_cache_evicts_lru_under_byte_budget():
+    cache = ResponseCache(max_bytes=70)
+    rows = [{"v": "x" * 10}]  # 21 bytes serialized
+    for i in range(3):
+        cache.put(cache_key("e", i=i), rows, generation=0)
+    cache.get(cache_key("e", i=0), generation=0)  # touch oldest
+    cache.put(cache_key("e", i=3), rows, generation=0)
+    assert cache.get(cache_key("e", i=1), generation=0) is None
+    assert cache.get(cache_key("e", i=0), generation=0) == rows
+    assert cache.stats()["bytes"] <= 70
+
+
+def test_stale_generation_misses_without_flushing():
+    cache = ResponseCache(max_bytes=1024)
+    cache.put(cache_key("regions_tree"), [1], generation=2, pin=True)
+    # A request that read generation 1 before the bump neither wipes nor overwrites generation 2
+    assert cache.get(cache_key("regions_tree"), generation=1) is None
+    cache.put(cache_key("regions_tree"), [0], generation=1)
+    assert cache.get(cache_key("regions_tree"), generation=2) == [1]
+    assert cache.stats()["pinned"] == 1 and cache.stats()["generation"] == 2
+
+
+def test_pinned_entries_survive_eviction_until_generation_moves():
+    cache = ResponseCache(max_bytes=50)
+    rows = [{"v": "x" * 10}]  # 21 bytes serialized
+    cache.put(cache_key("regions_tree"), rows, generation=0, pin=True)
+    for i in range(3):
+        cache.put(cache_key("e", i=i), rows, generation=0)
+    assert cache.get(cache_key("regions_tree"), generation=0) == rows
+    assert cache.get(cache_key("e", i=0), generation=0) is None
+    assert cache.stats()["pinned"] == 1
+    assert cache.get(cache_key("regions_tree"), generation=1) is None
+    assert cache.stats()["pinned"] == 0
+
+
+def test_generation_bump_roundtrip():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE data_generation (id INT PRIMARY KEY, generation BIGINT NOT NULL DEFAULT 0, updated_at TEXT)"))
+        assert current_generation(conn) == 0
+        bump_generation(conn)
+        bump_generation(conn)
+        assert current_generation(conn) == 2
@@ -0,0 +1,242 @@
+import pandas as pd
+import pytest
+from fastapi import HTTPException
+
+from code.api import scrna
+
+
+@pytest.fixture
+def rna_dir(tmp_path, monkeypatch):
+    pd.DataFrame({
+        "cluster_alias": [1, 2],
+        "number_of_cells": [100, 40],
+        "label": ["CS_1", "CS_2"],
+    }).to_csv(tmp_path / "cluster.csv", index=False)
+    pd.DataFrame({
+        "label": ["CS_class_01", "CS_sub_01", "CS_sub_02"],
+        "name": ["01 IT-ET Glut", "001 CLA-EPd-CTX Car3 Glut", "002 IT EP-CLA Glut"],
+        "color_hex_triplet": ["#FA0087", "#00FF00", None],
+        "cluster_annotation_term_set_name": ["class", "subclass", "subclass"],
+    }).to_csv(tmp_path / "cluster_annotation_term.csv", index=False)
+    pd.DataFrame({
+        "cluster_annotation_term_label": ["CS_class_01", "CS_sub_01", "CS_class_01", "CS_sub_02"],
+        "cluster_alias": [1, 1, 2, 2],
+    }).to_csv(tmp_path / "cluster_to_cluster_annotation_membership.csv", index=False)
+    monkeypatch.setattr(scrna, "RNA_DIR", tmp_path)
+    monkeypatch.setattr(scrna, "_registry", scrna.SampleRegistry())
+    return tmp_path
+
+
+def test_markers_served_from_precomputed_index(rna_dir):
+    markers = scrna.scrna_markers_data("1", limit=50)
+    assert [m["gene"] for m in markers] == ["CS_class_01", "CS_sub_01"]
+    assert markers[0]["name"] == "01 IT-ET Glut" and markers[0]["color"] == "#FA0087"
+    assert scrna.scrna_markers_data("1", limit=1) == markers[:1]
+    assert scrna.scrna_markers_data("2", limit=50)[1]["color"] is None
+    assert scrna.scrna_markers_data("999", limit=50) == []
+
+
+def test_registry_discovers_samples_and_evicts_lru(rna_dir, monkeypatch):
+    other = rna_dir / "sample-b"
+    other.mkdir()
+    for name in scrna.RNA_TABLE_FILES:
+        (other / name).write_bytes((rna_dir / name).read_bytes())
+    pd.DataFrame({"cluster_alias": [7], "number_of_cells": [5], "label": ["CS_7"]}).to_csv(other / "cluster.csv", index=False)
+    registry = scrna.SampleRegistry(max_bytes=1)  # every sample exceeds the cap: only the latest stays
+    monkeypatch.setattr(scrna, "_registry", registry)
+
+    samples = {s["sample_id"]: s for s in scrna.scrna_samples_data()}
+    assert set(samples) == {scrna.RNA_DEFAULT_SAMPLE, "sample-b"}
+    assert not samples["sample-b"]["loaded"] and samples["sample-b"]["n_clusters"] is None
+
+    assert [c["cluster_id"] for c in scrna.scrna_clusters_data("sample-b")] == ["7"]
+    assert [c["cluster_id"] for c in scrna.scrna_clusters_data(None)] == ["1", "2"]
+    stats = registry.stats()
+    assert stats["loaded"] == [scrna.RNA_DEFAULT_SAMPLE] and stats["evictions"] == 1
+    # A repeat hit on the resident sample does not reload
+    scrna.scrna_clusters_data(scrna.RNA_DEFAULT_SAMPLE)
+    assert registry.stats()["loads"] == 2
+    # The default sample is pinned: loading another one over the cap does not evict it
+    scrna.scrna_clusters_data("sample-b")
+    stats = registry.stats()
+    assert stats["loaded"] == [scrna.RNA_DEFAULT_SAMPLE, "sample-b"] and stats["evictions"] == 1
+    with pytest.raises(HTTPException) as exc:
+        scrna.scrna_clusters_data("nope")
+    assert exc.value.status_code == 404
+
+
+def test_term_search_and_inverted_lookup(rna_dir):
+    hits = scrna.scrna_search_data("0", limit=10)
+    # Ordered by matched name: "001 ...", "002 ...", "01 ..."
+    assert [h["id"] for h in hits] == ["CS_sub_01", "CS_sub_02", "CS_class_01"]
+    assert hits[2]["n_clusters"] == 2
+    assert [h["id"] for h in scrna.scrna_search_data("CS_SUB", limit=1)] == ["CS_sub_01"]
+    assert scrna.scrna_search_data("zzz", limit=10) == []
+
+    by_name = scrna.scrna_gene_clusters_data("01 IT-ET Glut")
+    assert [r["cluster_id"] for r in by_name] == ["1", "2"]
+    assert scrna.scrna_gene_clusters_data("cs_sub_02")[0]["cluster_id"] == "2"
+    with pytest.raises(HTTPException):
+        scrna.scrna_gene_clusters_data("Nope")
+
+
+def test_taxonomy_rollups_and_children(rna_dir):
+    (root,) = scrna.scrna_taxonomy_data("class")
+    assert root["node_id"] == "CS_class_01" and root["parent_id"] is None
+    assert (root["n_cells"], root["n_clusters"]) == (140, 2)
+
+    subs = scrna.scrna_taxonomy_children_data("CS_class_01")
+    assert [(n["node_id"], n["n_cells"]) for n in subs] == [("CS_sub_01", 100), ("CS_sub_02", 40)]
+    assert all(n["level"] == "subclass" and n["parent_id"] == "CS_class_01" for n in subs)
+    assert scrna.scrna_taxonomy_children_data("CS_sub_01") == []
+    assert scrna.scrna_taxonomy_data("supertype") == []
+    with pytest.raises(HTTPException):
+        scrna.scrna_taxonomy_children_data("CS_missing")
+
+
+def test_feather_cache_built_and_refreshed(rna_dir):
+    pytest.importorskip("pyarrow")
+    csv_path = rna_dir / "cluster.csv"
+    df = scrna.read_rna_table(csv_path, ["cluster_alias", "label", "missing_col"])
+    assert list(df.columns) == ["cluster_alias", "label"]
+    cache_files = list((rna_dir / scrna.RNA_CACHE_DIR_NAME).glob("cluster.*.feather"))
+    assert len(cache_files) == 1
+
+    # Rewriting the source invalidates the cache entry
+    pd.DataFrame({"cluster_alias": [9], "number_of_cells": [1], "label": ["CS_9"]}).to_csv(csv_path, index=False)
+    df = scrna.read_rna_table(csv_path, ["cluster_alias"])
+    assert df["cluster_alias"].tolist() == [9]
+    assert len(list((rna_dir / scrna.RNA_CACHE_DIR_NAME).glob("cluster.*.feather"))) == 1
+
+
+def test_feather_cache_removed_mid_read_falls_back_to_csv(rna_dir, monkeypatch):
+    feather = pytest.importorskip("pyarrow.feather")
+    csv_path = rna_dir / "cluster.csv"
+    scrna.read_rna_table(csv_path, ["cluster_alias"])
+    cache_path = scrna._feather_cache_path(csv_path)
+    read_table = feather.read_table
+
+    def swept(path, **kwargs):
+        path.unlink()
+        raise FileNotFoundError(path)
+
+    monkeypatch.setattr(feather, "read_table", swept)
+    df = scrna.read_rna_table(csv_path, ["cluster_alias", "label"])
+    assert list(df.columns) == ["cluster_alias", "label"] and not cache_path.exists()
+    # Rebuilding leaves the fresh cache in place rather than sweeping it as stale
+    monkeypatch.setattr(feather, "read_table", read_table)
+    scrna.read_rna_table(csv_path, ["cluster_alias"])
+    assert cache_path.exists()
+
+
+@pytest.mark.parametrize("fmt", ["csr", "csc"])
+def test_expression_streams_gene_column(rna_dir, monkeypatch, fmt):
+    anndata = pytest.importorskip("anndata")
+    sp = pytest.importorskip("scipy.sparse")
+    import numpy as np
+    from code.api import scrna_expression
+
+    # 7 cells x 3 genes; Gene "B" is column 1
+    dense = np.zeros((7, 3), dtype=np.float32)
+    dense[:, 1] = [1.0, 0.0, 3.0, 0.0, 2.0, 2.0, 0.0]
+    dense[:, 0] = 9.0
+    obs = pd.DataFrame({"cluster_alias": [1, 1, 1, 2, 2, 2, 2]}, index=[f"c{i}" for i in range(7)])
+    var = pd.DataFrame({"gene_symbol": ["A", "B", "C"]}, index=["ENS0", "ENS1", "ENS2"])
+    matrix = sp.csr_matrix(dense) if fmt == "csr" else sp.csc_matrix(dense)
+    path = rna_dir / "expr.h5ad"
+    anndata.AnnData(X=matrix, obs=obs, var=var).write_h5ad(path)
+
+    monkeypatch.setattr(scrna_expression, "RNA_H5AD_PATH", path)
+    monkeypatch.setattr(scrna_expression, "EXPRESSION_CHUNK_CELLS", 2)
+    monkeypatch.setattr(scrna_expression, "_handles", type(scrna_expression._handles)())
+
+    rows = {r["cluster_id"]: r for r in scrna_expression.scrna_expression_data("B", None, max_cells=2)}
+    assert rows["1"]["n_cells"] == 3
+    assert rows["1"]["mean"] == pytest.approx(4 / 3)
+    assert rows["1"]["fraction_expressing"] == pytest.approx(2 / 3)
+    assert rows["2"]["fraction_expressing"] == pytest.approx(0.5)
+    assert rows["2"]["values"] == [0.0, 0.0]  # first and last cell of cluster 2
+    (only,) = scrna_expression.scrna_expression_data("ENS1", "1", max_cells=10)
+    assert only["values"] == [1.0, 0.0, 3.0]
+
+    # Concurrent scans each read through their own file handle
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda g: scrna_expression.scrna_expression_data(g, None, max_cells=2), ["B"] * 8))
+    assert all(r == results[0] for r in results)
+
+    # Other samples read their own matrix, <sample dir>/<sample_id>-log2.h5ad
+    other = rna_dir / "sample-b"
+    other.mkdir()
+    for name in scrna.RNA_TABLE_FILES:
+        (other / name).write_bytes((rna_dir / name).read_bytes())
+    doubled = sp.csr_matrix(dense * 2) if fmt == "csr" else sp.csc_matrix(dense * 2)
+    anndata.AnnData(X=doubled, obs=obs, var=var).write_h5ad(other / f"sample-b{scrna_expression.RNA_H5AD_SUFFIX}")
+    (only,) = scrna_expression.scrna_expression_data("B", "1", max_cells=10, sample_id="sample-b")
+    assert only["values"] == [2.0, 0.0, 6.0]
+    with pytest.raises(HTTPException) as exc:
+        scrna_expression.scrna_expression_data("B", None, max_cells=1, sample_id="missing")
+    assert exc.value.status_code == 404
+
+
+@pytest.mark.parametrize(
+    "fmt,workers,max_genes,partition,tasks",
+    [
+        ("csr", 1, None, "cells", 1),
+        ("csr", 2, None, "cells", 2),
+        ("csr", 2, 3, "cells", 4),  # memory cap splits each cell range into two gene ranges
+        ("csc", 1, None, "genes", 2),
+        ("csc", 2, 3, "genes", 2),
+    ],
+)
+def test_de_results_match_scipy_and_feed_markers(rna_dir, fmt, workers, max_genes, partition, tasks):
+    anndata = pytest.importorskip("anndata")
+    sp = pytest.importorskip("scipy.sparse")
+    pytest.importorskip("zarr")
+    import numpy as np
+    from scipy import stats
+    from code.api import scrna_de
+
+    rng = np.random.default_rng(0)
+    dense = rng.poisson(0.6, size=(40, 6)).astype(np.float32)
+    dense[:20, 2] += 3.0  # gene G2 marks cluster 1
+    obs = pd.DataFrame({"cluster_alias": [1] * 20 + [2] * 20}, index=[f"c{i}" for i in range(40)])
+    var = pd.DataFrame({"gene_symbol": [f"G{i}" for i in range(6)]}, index=[f"ENS{i}" for i in range(6)])
+    matrix = sp.csr_matrix(dense) if fmt == "csr" else sp.csc_matrix(dense)
+    path = rna_dir / "expr.h5ad"
+    anndata.AnnData(X=matrix, obs=obs, var=var).write_h5ad(path)
+
+    out = rna_dir / scrna.RNA_DE_RESULTS_NAME
+    # budget for max_genes genes of float64 accumulators across the 2 clusters
+    memory_mb = max_genes * 2 * 4 * 8 / 2**20 if max_genes else scrna_de.DE_WORKER_MEMORY_MB
+    summary = scrna_de.compute_de(
+        path, out, workers=workers, gene_block=4, chunk_cells=7, chunk_genes=3, worker_memory_mb=memory_mb
+    )
+    assert summary["clusters"] == 2
+    assert (summary["partition"], summary["tasks"]) == (partition, tasks)
+
+    import zarr
+    group = zarr.open_group(str(out), mode="r")
+    in_c1 = np.arange(40) < 20
+    expected_p = stats.ttest_ind(dense[in_c1], dense[~in_c1], equal_var=False).pvalue
+    row = dict(group.attrs)["cluster_aliases"].index(1)
+    np.testing.assert_allclose(group["pval_adj"][row], np.minimum(scrna_de.bh_adjust(expected_p), 1), rtol=1e-4)
+    np.testing.assert_allclose(group["logfc"][row], dense[in_c1].mean(0) - dense[~in_c1].mean(0), rtol=1e-5)
+
+    markers = scrna.scrna_markers_data("1", limit=3)
+    assert markers[0]["gene"] == "G2" and markers[0]["name"] == "ENS2"
+    assert markers[0]["logfc"] == pytest.approx(3.0, abs=0.6) and markers[0]["pval_adj"] < 1e-6
+    assert len(markers) == 3
+
+    hits = scrna.scrna_gene_clusters_data("g2")
+    assert [h["cluster_id"] for h in hits] == ["1"] and hits[0]["logfc"] == markers[0]["logfc"]
+    assert {"kind": "gene", "id": "G2", "name": "ENS2", "n_clusters": 1} in scrna.scrna_search_data("ens", 10)
+
+
+def test_bh_adjust_matches_reference():
+    import numpy as np
+    from code.api import scrna_de
+
+    p = np.array([[0.01, 0.04, 0.03, 0.5], [1.0, 0.001, 0.2, 0.2]])
+    expected = np.array([[0.04, 0.16 / 3, 0.16 / 3, 0.5], [1.0, 0.004, 4 / 15, 4 / 15]])
+    np.testing.assert_allclose(scrna_de.bh_adjust(p), expected)
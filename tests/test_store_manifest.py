@@ -0,0 +1,66 @@
+import os
+from pathlib import Path
+
+from code.database import store_manifest
+
+
+def make_store(root: Path) -> Path:
+    store = root / "img.ome.zarr"
+    for rel, body in {"zarr.json": "{}", "s0/c/0/0/0": "chunk-a", "s0/c/0/0/1": "chunk-b", "s1/c/0/0/0": "x"}.items():
+        path = store / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(body)
+    age(store)
+    return store
+
+
+def age(store: Path, seconds: int = 60):
+    """Push every file's mtime into the past so it is clearly older than the manifest."""
+    for rel, st in store_manifest._walk(store):
+        os.utime(store / rel, ns=(st.st_atime_ns, st.st_mtime_ns - seconds * 10**9))
+
+
+def count_reads(monkeypatch) -> list:
+    reads = []
+    real = store_manifest.digest_file
+
+    def counting(path, *a, **kw):
+        reads.append(path.as_posix())
+        return real(path, *a, **kw)
+
+    monkeypatch.setattr(store_manifest, "digest_file", counting)
+    return reads
+
+
+def test_unchanged_store_is_not_reread(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    reads = count_reads(monkeypatch)
+    first = store_manifest.store_sha256(store)
+    assert len(reads) == 4 and (store / store_manifest.MANIFEST_NAME).exists()
+
+    reads.clear()
+    assert store_manifest.store_sha256(store) == first
+    assert reads == []
+
+
+def test_only_changed_chunks_rehashed_and_root_hash_changes(tmp_path, monkeypatch):
+    store = make_store(tmp_path)
+    before = store_manifest.store_sha256(store)
+    reads = count_reads(monkeypatch)
+
+    (store / "s0/c/0/0/1").write_text("chunk-b-rewritten")
+    changed = store_manifest.store_sha256(store)
+    assert changed != before and len(reads) == 1 and reads[0].endswith("s0/c/0/0/1")
+
+    (store / "s1/c/0/0/0").unlink()
+    assert store_manifest.store_sha256(store) not in {before, changed}
+
+
+def test_hash_matches_fresh_computation_and_ignores_manifest(tmp_path):
+    store = make_store(tmp_path)
+    cached = store_manifest.store_sha256(store, workers=2)
+    (store / store_manifest.MANIFEST_NAME).unlink()
+    assert store_manifest.store_sha256(store, workers=1) == cached
+
+    copy = make_store(tmp_path / "copy")
+    assert store_manifest.store_sha256(copy) == cached
@@ -0,0 +1,35 @@
+import asyncio
+import hashlib
+import io
+
+import pytest
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import create_engine, text
+
+from code.api.deps import save_upload
+from code.api.routes_uploads import _block_duplicate_source
+
+
+def test_save_upload_streams_and_hashes_in_one_pass(tmp_path):
+    payload = bytes(range(256)) * 1000
+    upload = UploadFile(file=io.BytesIO(payload), filename="counts.csv")
+    dest = tmp_path / "counts.csv"
+    digest = asyncio.run(save_upload(upload, dest, chunk_size=4096))
+    assert dest.read_bytes() == payload
+    assert digest == hashlib.sha256(payload).hexdigest()
+
+
+def test_duplicate_source_blocked_while_staging():
+    engine = create_engine("sqlite:///:memory:")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE microscopy_files (file_id INTEGER PRIMARY KEY, source_sha256 TEXT)"))
+        conn.execute(text("INSERT INTO microscopy_files (source_sha256) VALUES ('old')"))
+    seen = {}
+    _block_duplicate_source(engine, "a.tif", "new", seen)
+    assert seen == {"new": "a.tif"}
+    with pytest.raises(HTTPException) as batch_dup:
+        _block_duplicate_source(engine, "b.tif", "new", seen)
+    with pytest.raises(HTTPException) as known_dup:
+        _block_duplicate_source(engine, "c.tif", "old", seen)
+    assert batch_dup.value.status_code == known_dup.value.status_code == 409
+    assert "a.tif" in batch_dup.value.detail